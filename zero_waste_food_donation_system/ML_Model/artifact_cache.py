@@ -0,0 +1,67 @@
+"""
+Memory-mappable copies of pickled artifacts.
+
+Every process that unpickles a model owns a private copy of it, and the
+unpickling itself imports scikit-learn. What the web workers actually serve
+with is a handful of flat NumPy arrays (the compiled tree ensemble, the food
+type labels), so those are written once as .npy files next to the pickle and
+opened with mmap_mode="r". Read-only file mappings are backed by the page
+cache, so all workers on a node share a single copy.
+
+A cache directory records the size and hash of the pickle it was built
+from and is rebuilt when the pickle changes. If it cannot be written (e.g.
+a read-only deployment) the freshly built object is used from memory.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+STAMP_FILE = "source.json"
+
+
+def _stamp(source):
+    # A content hash rather than the mtime, which changes on every checkout
+    # or deploy copy; hashing the file is still far cheaper than unpickling.
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return {"size": os.path.getsize(source), "sha256": digest.hexdigest()}
+
+
+def is_fresh(source, directory):
+    try:
+        with open(os.path.join(directory, STAMP_FILE)) as f:
+            return json.load(f) == _stamp(source)
+    except (OSError, ValueError):
+        return False
+
+
+def cached(source, directory, build, write, read):
+    """
+    Return read(directory), first running write(directory, build()) if the
+    directory is missing or older than `source`.
+    """
+    if is_fresh(source, directory):
+        return read(directory)
+
+    obj = build()
+    try:
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(directory))
+    except OSError:
+        return obj
+    try:
+        write(tmp, obj)
+        with open(os.path.join(tmp, STAMP_FILE), "w") as f:
+            json.dump(_stamp(source), f)
+        if os.path.isdir(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+        os.rename(tmp, directory)
+    except OSError:
+        # Another process won the race, or the directory is read-only
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not is_fresh(source, directory):
+            return obj
+    return read(directory)
@@ -0,0 +1,165 @@
+"""
+Offline batch scorer for datasets shaped like ML_Part/food_donation_dataset.csv.
+
+Runs without Django. The input is streamed in chunks, each chunk is scored in
+a worker process that loads the model once, and results are appended to the
+output in input order, so memory stays bounded by a few chunks whatever the
+input size. Features go through ml_model.assemble_features, the same code
+the web app uses, so offline and online scores match.
+
+    python -m ML_Model.batch_score input.csv output.csv [--workers 4]
+        [--chunk-size 100000] [--model gradient_boosting:v1.0]
+
+Output columns are the input columns plus `predicted_priority`; rows with a
+food type the encoder has not seen get an empty score. Writing .parquet
+output requires pyarrow.
+"""
+import argparse
+import collections
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from .ml_model import assemble_features, encode_food_types, is_known_food_type
+from .registry import get_active_model, load_model
+
+REQUIRED_COLUMNS = ["receiver_capacity", "receiver_distance", "food_type", "quantity", "time_to_expiry"]
+OUTPUT_COLUMN = "predicted_priority"
+
+_worker_model = None
+
+
+def _init_worker(model_tag):
+    global _worker_model
+    _worker_model = _load(model_tag)
+
+
+def _load(model_tag):
+    if model_tag is None:
+        return get_active_model()
+    name, version = model_tag.split(":", 1)
+    return load_model(name, version)
+
+
+def score_frame(df, model):
+    """Return a copy of `df` with the OUTPUT_COLUMN added."""
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Input is missing columns: {', '.join(missing)}")
+
+    known = df["food_type"].map(is_known_food_type).to_numpy(dtype=bool)
+    scores = np.full(len(df), np.nan)
+    if known.any():
+        rows = df[known]
+        X = assemble_features(
+            receiver_capacity=rows["receiver_capacity"],
+            receiver_distance=rows["receiver_distance"],
+            food_type_encoded=encode_food_types(rows["food_type"]),
+            quantity=rows["quantity"],
+            time_to_expiry=rows["time_to_expiry"],
+        )
+        scores[known] = model.predict(X)
+    out = df.copy()
+    out[OUTPUT_COLUMN] = scores
+    return out
+
+
+def _score_in_worker(df):
+    return score_frame(df, _worker_model)
+
+
+class CsvSink:
+    def __init__(self, path):
+        self.path = path
+        self.header = True
+
+    def write(self, df):
+        df.to_csv(self.path, mode="w" if self.header else "a", header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        pass
+
+
+class ParquetSink:
+    def __init__(self, path):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet output requires pyarrow (pip install pyarrow)")
+        self.path = path
+        self.writer = None
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def score_file(input_path, output_path, workers=None, chunk_size=100_000, model_tag=None, log=None):
+    """Score `input_path` into `output_path`; returns (rows, seconds)."""
+    workers = workers or os.cpu_count() or 1
+    sink = ParquetSink(output_path) if output_path.endswith(".parquet") else CsvSink(output_path)
+    chunks = pd.read_csv(input_path, chunksize=chunk_size)
+    start = time.perf_counter()
+    rows = 0
+
+    def emit(df):
+        nonlocal rows
+        sink.write(df)
+        rows += len(df)
+        if log:
+            elapsed = time.perf_counter() - start
+            log(f"{rows} rows scored, {rows / elapsed:,.0f} rows/s")
+
+    try:
+        if workers == 1:
+            model = _load(model_tag)
+            for chunk in chunks:
+                emit(score_frame(chunk, model))
+        else:
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(model_tag,)) as pool:
+                # Keep at most two chunks per worker in flight so memory stays bounded
+                pending = collections.deque()
+                for chunk in chunks:
+                    pending.append(pool.apply_async(_score_in_worker, (chunk,)))
+                    if len(pending) >= 2 * workers:
+                        emit(pending.popleft().get())
+                while pending:
+                    emit(pending.popleft().get())
+    finally:
+        sink.close()
+    return rows, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a donation dataset with the priority model.")
+    parser.add_argument("input", help="CSV file with " + ", ".join(REQUIRED_COLUMNS))
+    parser.add_argument("output", help="Output .csv or .parquet file")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="Rows per chunk")
+    parser.add_argument("--model", default=None, help="Registered model as name:version (default: active)")
+    args = parser.parse_args(argv)
+
+    rows, seconds = score_file(
+        args.input, args.output,
+        workers=args.workers, chunk_size=args.chunk_size, model_tag=args.model,
+        log=lambda message: print(message, file=sys.stderr),
+    )
+    print(f"Scored {rows} rows in {seconds:.2f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
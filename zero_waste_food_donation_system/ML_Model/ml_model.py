@@ -1,15 +1,170 @@
-import joblib
+"""
+Lazy access to the priority model artifacts.
+
+Unpickling the model pulls in scikit-learn and takes a noticeable share of
+process start-up, so nothing is loaded at import time. The first call to
+one of the getters loads that artifact once per process; web workers can
+load eagerly through warm_up() (see CoreConfig.ready and ML_MODEL_WARMUP),
+or once in the parent before forking through preload().
+
+Scoring itself does not unpickle anything: the food type labels and the
+compiled model are read from memory-mapped copies (ML_Model.artifact_cache)
+that all worker processes share.
+
+The model used for scoring is chosen by ML_Model.registry; the getters here
+cover the feature encoding shared by all registered models and the original
+gradient boosting artifact.
+"""
 import os
+import pickle
+import threading
+
+import numpy as np
+
+MODEL_DIR = os.path.dirname(__file__)
 
 # Path to your saved model
-MODEL_PATH = os.path.join(os.path.dirname(__file__), "gradient_boosting_priority_model.pkl")
+MODEL_PATH = os.path.join(MODEL_DIR, "gradient_boosting_priority_model.pkl")
+ENCODER_PATH = os.path.join(MODEL_DIR, "food_type_encoder.pkl")
+SCALER_PATH = os.path.join(MODEL_DIR, "scaler.pkl")
+
+# Column order all priority models are trained on
+FEATURE_COLUMNS = [
+    "receiver_capacity",
+    "receiver_distance",
+    "food_type_encoded",
+    "quantity",
+    "time_to_expiry",
+]
+
+_artifacts = {}
+_food_type_codes = None
+_lock = threading.Lock()
+
+
+def _unpickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _joblib_load(path):
+    import joblib
+
+    return joblib.load(path)
 
-# Load the model
-priority_model = joblib.load(MODEL_PATH)
 
 # LabelEncoder and Scaler (must match the ones used during training)
-import pickle
-with open(os.path.join(os.path.dirname(__file__), "food_type_encoder.pkl"), "rb") as f:
-    food_type_encoder = pickle.load(f)
-with open(os.path.join(os.path.dirname(__file__), "scaler.pkl"), "rb") as f:
-    scaler = pickle.load(f)
+_LOADERS = {
+    "priority_model": (_joblib_load, MODEL_PATH),
+    "food_type_encoder": (_unpickle, ENCODER_PATH),
+    "scaler": (_unpickle, SCALER_PATH),
+}
+
+
+def _get(name):
+    # Each artifact is loaded on its own, so serving code that only needs
+    # the food type labels never unpickles the model or the scaler.
+    artifact = _artifacts.get(name)
+    if artifact is None:
+        with _lock:
+            if name not in _artifacts:
+                load, path = _LOADERS[name]
+                _artifacts[name] = load(path)
+            artifact = _artifacts[name]
+    return artifact
+
+
+def get_priority_model():
+    return _get("priority_model")
+
+
+def get_food_type_encoder():
+    return _get("food_type_encoder")
+
+
+def get_scaler():
+    return _get("scaler")
+
+
+def food_type_classes():
+    """The encoder's labels in code order, read from a memory-mapped copy."""
+    from .artifact_cache import cached
+
+    return cached(
+        ENCODER_PATH,
+        ENCODER_PATH + ".arrays",
+        build=lambda: np.asarray(get_food_type_encoder().classes_, dtype=str),
+        write=lambda directory, classes: np.save(os.path.join(directory, "classes.npy"), classes),
+        read=lambda directory: np.load(os.path.join(directory, "classes.npy"), mmap_mode="r"),
+    )
+
+
+def _codes():
+    global _food_type_codes
+    if _food_type_codes is None:
+        _food_type_codes = {str(label): code for code, label in enumerate(food_type_classes())}
+    return _food_type_codes
+
+
+def is_known_food_type(food_type):
+    """Whether the encoder (and so the model) has seen this food type."""
+    return food_type in _codes()
+
+
+def encode_food_types(food_types):
+    """Same codes as food_type_encoder.transform, without calling sklearn."""
+    codes = _codes()
+    try:
+        return [codes[food_type] for food_type in food_types]
+    except KeyError as e:
+        raise ValueError(f"y contains previously unseen labels: {e.args[0]!r}") from None
+
+
+def assemble_features(receiver_capacity, receiver_distance, food_type_encoded, quantity, time_to_expiry):
+    """
+    Stack model inputs into an (n, 5) float64 matrix in FEATURE_COLUMNS order.
+    Shared by online scoring (core.scoring) and the offline batch scorer so
+    both feed the model exactly the same values; scalars are broadcast.
+    """
+    columns = np.broadcast_arrays(*(
+        np.asarray(column, dtype=np.float64)
+        for column in (receiver_capacity, receiver_distance, food_type_encoded, quantity, time_to_expiry)
+    ))
+    return np.column_stack(columns)
+
+
+def is_loaded():
+    """Whether anything has been loaded yet (the active model included)."""
+    from . import registry
+
+    return bool(_artifacts) or _food_type_codes is not None or bool(registry._models)
+
+
+def warm_up():
+    """Load what scoring needs now instead of on first use."""
+    from .registry import get_active_model
+
+    _codes()
+    get_active_model()
+
+
+def preload():
+    """
+    warm_up() for a parent process that is about to fork workers (gunicorn
+    --preload, see zero_waste/wsgi.py). Freezing the collector afterwards
+    keeps it from touching, and so copying, the inherited objects in every
+    worker.
+    """
+    import gc
+
+    warm_up()
+    gc.collect()
+    gc.freeze()
+
+
+def __getattr__(name):
+    # Keeps `from ML_Model.ml_model import priority_model` working; the
+    # import itself then triggers the load.
+    if name in ("priority_model", "food_type_encoder", "scaler"):
+        return _get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
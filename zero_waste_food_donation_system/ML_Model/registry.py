@@ -0,0 +1,191 @@
+"""
+Registry of priority models.
+
+The manifest lists every model artifact by name and version, and which one
+is active. Workers re-read the manifest when its modification time changes,
+so set_active_model() (or `manage.py activate_model`) switches the model used
+for scoring in every running process without a restart.
+
+registry.json is the manifest shipped with the code and is never written.
+register_model() and set_active_model() write the live manifest instead,
+REGISTRY_PATH (the ML_MODEL_REGISTRY environment variable, by default
+ML_Model/registry.local.json, which is not under version control), and it
+takes precedence over registry.json once it exists.
+
+Each loaded model exposes predict(X) on a plain (n, 5) NumPy array in
+FEATURE_COLUMNS order, and a `tag` ("name:version") that is stamped on every
+stored score and prediction. Tree ensembles also provide time_curves(X).
+"""
+import json
+import os
+import threading
+
+from .ml_model import MODEL_DIR, FEATURE_COLUMNS
+
+DEFAULT_REGISTRY_PATH = os.path.join(MODEL_DIR, "registry.json")
+REGISTRY_PATH = os.environ.get("ML_MODEL_REGISTRY") or os.path.join(MODEL_DIR, "registry.local.json")
+
+# Supported artifact kinds:
+#   tree_ensemble  GradientBoostingRegressor, served by the compiled evaluator
+#   sklearn        any other fitted sklearn regressor, served by its predict()
+KINDS = ("tree_ensemble", "sklearn")
+
+
+class RegisteredModel:
+    def __init__(self, name, version, kind, predictor, compiled=None):
+        self.name = name
+        self.version = version
+        self.kind = kind
+        self._predictor = predictor
+        self.compiled = compiled
+
+    @property
+    def tag(self):
+        return f"{self.name}:{self.version}"
+
+    def predict(self, X):
+        return self._predictor(X)
+
+    def time_curves(self, X):
+        """Score curves over time_to_expiry, one per row, or None if unsupported."""
+        if self.compiled is None:
+            return None
+        return self.compiled.time_curves(X, FEATURE_COLUMNS.index("time_to_expiry"))
+
+    def __repr__(self):
+        return f"<RegisteredModel {self.tag} ({self.kind})>"
+
+
+_models = {}
+_manifest = None
+_manifest_stamp = None
+_lock = threading.Lock()
+
+
+def _read_manifest():
+    # A stat() or two per call; the file is only re-read after it changed
+    global _manifest, _manifest_stamp
+    path = REGISTRY_PATH if os.path.exists(REGISTRY_PATH) else DEFAULT_REGISTRY_PATH
+    stamp = (path, os.stat(path).st_mtime_ns)
+    if stamp != _manifest_stamp:
+        with _lock:
+            with open(path) as f:
+                _manifest = json.load(f)
+            _manifest_stamp = stamp
+    return _manifest
+
+
+def _entry(name, version):
+    for entry in _read_manifest()["models"]:
+        if entry["name"] == name and entry["version"] == version:
+            return entry
+    raise LookupError(f"No registered model {name}:{version}")
+
+
+def _load_estimator(entry, path):
+    import joblib
+
+    estimator = joblib.load(path)
+    names = getattr(estimator, "feature_names_in_", None)
+    if names is not None:
+        if list(names) != FEATURE_COLUMNS:
+            raise ValueError(f"{entry['path']} was trained on {list(names)}, expected {FEATURE_COLUMNS}")
+        # We always pass arrays in FEATURE_COLUMNS order; dropping the names
+        # stops sklearn from warning on every array input.
+        del estimator.feature_names_in_
+    _check_schema(entry, os.path.join(os.path.dirname(path), "schema.json"))
+    return estimator
+
+
+def _load(entry):
+    path = os.path.join(MODEL_DIR, entry["path"])
+    compiled = None
+    if entry["kind"] == "tree_ensemble":
+        from .artifact_cache import cached
+        from .tree_compiler import CompiledTreeEnsemble, compile_gradient_boosting
+
+        # Served from memory-mapped arrays; the pickle is only read to
+        # (re)build them.
+        compiled = cached(
+            path,
+            path + ".arrays",
+            build=lambda: compile_gradient_boosting(_load_estimator(entry, path)),
+            write=lambda directory, ensemble: ensemble.save_arrays(directory),
+            read=CompiledTreeEnsemble.load_arrays,
+        )
+        predictor = compiled.predict
+    elif entry["kind"] == "sklearn":
+        predictor = _load_estimator(entry, path).predict
+    else:
+        raise ValueError(f"Unknown model kind {entry['kind']!r}, expected one of {KINDS}")
+    return RegisteredModel(entry["name"], entry["version"], entry["kind"], predictor, compiled)
+
+
+def _check_schema(entry, schema_path):
+    # Artifacts exported by ML_Model.training carry a schema.json; the model
+    # is only usable if it was trained on today's columns and food type codes.
+    if not os.path.exists(schema_path):
+        return
+    from .ml_model import food_type_classes
+
+    with open(schema_path) as f:
+        schema = json.load(f)
+    if schema["feature_columns"] != FEATURE_COLUMNS:
+        raise ValueError(f"{entry['path']} was trained on {schema['feature_columns']}, expected {FEATURE_COLUMNS}")
+    if schema["food_types"] != food_type_classes().tolist():
+        raise ValueError(f"{entry['path']} was trained with a different food type encoder")
+
+
+def list_models():
+    """All registered (name, version) pairs, in manifest order."""
+    return [(entry["name"], entry["version"]) for entry in _read_manifest()["models"]]
+
+
+def load_model(name, version):
+    """Load (once per process) and return a registered model."""
+    key = (name, version)
+    model = _models.get(key)
+    if model is None:
+        model = _load(_entry(name, version))
+        with _lock:
+            model = _models.setdefault(key, model)
+    return model
+
+
+def active_tag():
+    """Tag of the active model, without loading it."""
+    return _read_manifest()["active"]
+
+
+def get_active_model():
+    name, version = active_tag().split(":", 1)
+    return load_model(name, version)
+
+
+def register_model(name, version, path, kind):
+    """Add (or replace) a manifest entry; `path` is relative to ML_Model/."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown model kind {kind!r}, expected one of {KINDS}")
+    manifest = dict(_read_manifest())
+    models = [e for e in manifest["models"] if (e["name"], e["version"]) != (name, version)]
+    models.append({"name": name, "version": version, "path": path, "kind": kind})
+    manifest["models"] = models
+    _write_manifest(manifest)
+    with _lock:
+        _models.pop((name, version), None)
+
+
+def set_active_model(name, version):
+    _entry(name, version)  # Fail early on unknown models
+    manifest = dict(_read_manifest())
+    manifest["active"] = f"{name}:{version}"
+    _write_manifest(manifest)
+
+
+def _write_manifest(manifest):
+    # Write to a temp file and rename so readers never see a partial file
+    tmp_path = REGISTRY_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, REGISTRY_PATH)
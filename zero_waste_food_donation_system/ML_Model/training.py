@@ -0,0 +1,151 @@
+"""
+Training of priority models, replacing ML_Part/food_donation_priority.ipynb.
+
+Training data arrives as an iterable of DataFrame chunks with the raw model
+inputs (food_type as a label, not a code) and a `target` column, so the same
+code trains from a CSV read in chunks or from database history (see
+core.training_data). Only compact float64 feature columns are kept between
+chunks.
+
+The regressor is scikit-learn's HistGradientBoostingRegressor, which bins
+the features once and uses all cores through OpenMP. Food types are encoded
+with the shared food_type_encoder so codes stay compatible with every other
+registered model; rows with unseen food types are dropped and counted.
+
+export_artifacts() writes a versioned directory under ML_Model/models/ (not
+under version control) with the model, a copy of the encoder and
+schema.json (feature columns, food types, metrics), ready for
+ML_Model.registry.register_model().
+"""
+import json
+import os
+import resource
+import shutil
+import time
+
+import numpy as np
+
+from .ml_model import (
+    ENCODER_PATH, FEATURE_COLUMNS, MODEL_DIR,
+    assemble_features, encode_food_types, food_type_classes, is_known_food_type,
+)
+
+INPUT_COLUMNS = ["receiver_capacity", "receiver_distance", "food_type", "quantity", "time_to_expiry"]
+TARGET_COLUMN = "target"
+ARTIFACTS_DIR = os.path.join(MODEL_DIR, "models")
+
+DEFAULT_PARAMS = {
+    "max_iter": 200,
+    "learning_rate": 0.1,
+    "max_leaf_nodes": 31,
+    "l2_regularization": 0.0,
+    "early_stopping": "auto",
+    "random_state": 42,
+}
+
+
+def read_csv_chunks(path, chunk_size=100_000, target_column="priority_score"):
+    """Yield training chunks from a CSV shaped like ML_Part/food_donation_dataset.csv."""
+    import pandas as pd
+
+    for chunk in pd.read_csv(path, chunksize=chunk_size, usecols=INPUT_COLUMNS + [target_column]):
+        yield chunk.rename(columns={target_column: TARGET_COLUMN})
+
+
+def collect(chunks):
+    """
+    Encode and stack training chunks; returns (X, y, dropped) where `dropped`
+    counts rows with a food type the encoder has not seen.
+    """
+    features, targets, dropped = [], [], 0
+    for chunk in chunks:
+        known = chunk["food_type"].map(is_known_food_type).to_numpy(dtype=bool)
+        dropped += int((~known).sum())
+        chunk = chunk[known]
+        if chunk.empty:
+            continue
+        features.append(assemble_features(
+            receiver_capacity=chunk["receiver_capacity"],
+            receiver_distance=chunk["receiver_distance"],
+            food_type_encoded=encode_food_types(chunk["food_type"]),
+            quantity=chunk["quantity"],
+            time_to_expiry=chunk["time_to_expiry"],
+        ))
+        targets.append(chunk[TARGET_COLUMN].to_numpy(dtype=np.float64))
+    if not features:
+        return np.empty((0, len(FEATURE_COLUMNS))), np.empty(0), dropped
+    return np.concatenate(features), np.concatenate(targets), dropped
+
+
+def peak_memory_mb():
+    """Peak resident set size of this process so far (Linux reports KiB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def train(X, y, threads=None, test_size=0.2, **params):
+    """
+    Fit a HistGradientBoostingRegressor on (X, y) and score it on a held-out
+    split; returns (model, metrics). `threads` caps the OpenMP thread pool
+    (default: all cores).
+    """
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    from sklearn.model_selection import train_test_split
+    from threadpoolctl import threadpool_limits
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=test_size, random_state=params.get("random_state", 42),
+    )
+    model = HistGradientBoostingRegressor(
+        categorical_features=[FEATURE_COLUMNS.index("food_type_encoded")],
+        **{**DEFAULT_PARAMS, **params},
+    )
+    start = time.perf_counter()
+    with threadpool_limits(limits=threads):
+        model.fit(X_train, y_train)
+        predictions = model.predict(X_test)
+    train_seconds = time.perf_counter() - start
+
+    rmse = float(np.sqrt(np.mean((predictions - y_test) ** 2)))
+    metrics = {
+        "train_rows": int(len(X_train)),
+        "test_rows": int(len(X_test)),
+        "test_rmse": rmse,
+        "n_iter": int(model.n_iter_),
+        "train_seconds": train_seconds,
+    }
+    return model, metrics
+
+
+def export_artifacts(model, name, version, metrics, source, output_dir=ARTIFACTS_DIR):
+    """
+    Write model.joblib, food_type_encoder.pkl and schema.json to
+    `output_dir`/name/version; returns the model path to register, relative
+    to ML_Model/ when it lies inside it.
+    """
+    import joblib
+
+    directory = os.path.join(output_dir, name, version)
+    if os.path.exists(directory):
+        raise FileExistsError(f"{directory} already exists; pick a new version")
+    os.makedirs(directory)
+
+    model_path = os.path.join(directory, "model.joblib")
+    joblib.dump(model, model_path)
+    shutil.copyfile(ENCODER_PATH, os.path.join(directory, "food_type_encoder.pkl"))
+
+    schema = {
+        "name": name,
+        "version": version,
+        "estimator": type(model).__name__,
+        "feature_columns": FEATURE_COLUMNS,
+        "food_types": food_type_classes().tolist(),
+        "source": source,
+        "metrics": metrics,
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    with open(os.path.join(directory, "schema.json"), "w") as f:
+        json.dump(schema, f, indent=2)
+        f.write("\n")
+
+    relative = os.path.relpath(model_path, MODEL_DIR)
+    return model_path if relative.startswith(os.pardir) else relative
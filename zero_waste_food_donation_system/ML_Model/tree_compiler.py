@@ -0,0 +1,289 @@
+"""
+Compile a fitted GradientBoostingRegressor into flat NumPy arrays.
+
+scikit-learn's predict() validates its input, walks each tree separately and
+accepts a DataFrame, which for the handful of rows we score per request
+costs far more than the arithmetic. CompiledTreeEnsemble stores every node of
+every tree in contiguous arrays (feature index, threshold, children, value)
+and evaluates a whole batch level by level with vectorized indexing.
+
+Nodes are renumbered breadth-first so that the two children of a node are
+adjacent: `children[i]` is the left child and `children[i] + 1` the right
+one. Leaves point to themselves and always compare true, so every row takes
+exactly `max_depth` steps without branching on whether it already reached a
+leaf. Inputs are compared as float32, like sklearn does, and the stages are
+summed in sklearn's order, which keeps predictions identical to
+priority_model.predict().
+
+With every other feature fixed, a tree ensemble is a step function of any
+single feature, and its steps can only sit on that feature's split
+thresholds. time_curves() uses this to turn the model into one PriorityCurve
+per row over time_to_expiry, so a score can be read for any moment with a
+binary search instead of another model call.
+"""
+import json
+import os
+
+import numpy as np
+
+# sklearn marks leaves with feature == -2 and children == -1
+_TREE_LEAF = -1
+
+
+class CompiledTreeEnsemble:
+    ARRAYS = ("feature", "threshold", "children", "value", "roots")
+    SCALARS = ("base_score", "learning_rate", "max_depth", "n_features")
+
+    def __init__(self, feature, threshold, children, value, roots,
+                 base_score, learning_rate, max_depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.base_score = float(base_score)
+        self.learning_rate = float(learning_rate)
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    # Rows evaluated together; keeps the (n_trees, rows) work arrays in cache
+    BLOCK_SIZE = 1024
+
+    def predict(self, X):
+        """Predict a batch; X is an (n_samples, n_features) array."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(
+                f"Expected an array of shape (n, {self.n_features}), got {X.shape}"
+            )
+        if len(X) <= self.BLOCK_SIZE:
+            return self._predict_block(X)
+        return np.concatenate([
+            self._predict_block(X[start:start + self.BLOCK_SIZE])
+            for start in range(0, len(X), self.BLOCK_SIZE)
+        ])
+
+    def _predict_block(self, X):
+        n = X.shape[0]
+        flat_X = X.ravel()
+        row_offsets = np.arange(n) * self.n_features
+
+        # One row of node ids per tree, one column per sample
+        nodes = np.repeat(self.roots[:, None], n, axis=1)
+        for _ in range(self.max_depth):
+            go_right = ~(flat_X[row_offsets + self.feature[nodes]] <= self.threshold[nodes])
+            nodes = self.children[nodes] + go_right
+
+        # Row 0 is the initial estimate. cumsum adds the stages strictly one
+        # after another, as sklearn does (sum() may use pairwise summation).
+        stages = np.empty((self.n_trees + 1, n), dtype=np.float64)
+        stages[0] = self.base_score
+        np.multiply(self.learning_rate, self.value[nodes], out=stages[1:])
+        return np.cumsum(stages, axis=0)[-1]
+
+    def _leaf_boxes(self):
+        """Per leaf: the (lo, hi] bounds on every feature that lead to it."""
+        if getattr(self, "_boxes", None) is None:
+            leaves, lows, highs = [], [], []
+            for root in self.roots:
+                stack = [(root, np.full(self.n_features, -np.inf), np.full(self.n_features, np.inf))]
+                while stack:
+                    node, lo, hi = stack.pop()
+                    left = self.children[node]
+                    if left == node:
+                        leaves.append(node)
+                        lows.append(lo)
+                        highs.append(hi)
+                        continue
+                    f, t = self.feature[node], self.threshold[node]
+                    left_hi, right_lo = hi.copy(), lo.copy()
+                    left_hi[f] = min(hi[f], t)
+                    right_lo[f] = max(lo[f], t)
+                    stack.append((left, lo, left_hi))
+                    stack.append((left + 1, right_lo, hi))
+            self._boxes = (np.asarray(leaves), np.asarray(lows), np.asarray(highs))
+        return self._boxes
+
+    def time_curves(self, X, feature, chunk_size=1000):
+        """
+        One PriorityCurve per row of X over `feature`; the values in that
+        column are ignored. Evaluating a curve at t gives the same result as
+        predict() on the row with `feature` set to t.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        _, lows, highs = self._leaf_boxes()
+        other = np.arange(self.n_features) != feature
+        curves = []
+        for start in range(0, len(X), chunk_size):
+            rows = X[start:start + chunk_size]
+            # Leaves a row can reach for some value of `feature`
+            fixed = rows[:, None, other]
+            reachable = ((fixed > lows[None, :, other]) & (fixed <= highs[None, :, other])).all(axis=2)
+
+            points, owners, splits = [], [], []
+            for i, row_reachable in enumerate(reachable):
+                bounds = np.concatenate((lows[row_reachable, feature], highs[row_reachable, feature]))
+                breakpoints = np.unique(bounds[np.isfinite(bounds)])
+                splits.append(breakpoints)
+                points.append(_interval_points(breakpoints))
+                owners.append(np.full(len(breakpoints) + 1, i))
+
+            samples = np.repeat(rows, [len(p) for p in points], axis=0)
+            samples[:, feature] = np.concatenate(points)
+            values = self.predict(samples)
+            offsets = np.cumsum([0] + [len(p) for p in points])
+            for i, breakpoints in enumerate(splits):
+                curves.append(PriorityCurve(breakpoints, values[offsets[i]:offsets[i + 1]]).simplified())
+        return curves
+
+    def save(self, path):
+        np.savez(
+            path,
+            base_score=self.base_score,
+            learning_rate=self.learning_rate,
+            max_depth=self.max_depth,
+            n_features=self.n_features,
+            **{name: getattr(self, name) for name in self.ARRAYS},
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                base_score=data["base_score"][()],
+                learning_rate=data["learning_rate"][()],
+                max_depth=data["max_depth"][()],
+                n_features=data["n_features"][()],
+                **{name: data[name] for name in cls.ARRAYS},
+            )
+
+    def save_arrays(self, directory):
+        """One .npy file per array plus meta.json, for load_arrays()."""
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({name: getattr(self, name) for name in self.SCALARS}, f)
+
+    @classmethod
+    def load_arrays(cls, directory, mmap_mode="r"):
+        """Load a save_arrays() directory; by default the arrays are read-only memory maps."""
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {
+            # Plain ndarray views of the mapping skip np.memmap's per-operation overhead
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode).view(np.ndarray)
+            for name in cls.ARRAYS
+        }
+        return cls(**arrays, **meta)
+
+
+def _interval_points(breakpoints):
+    """
+    One float32 value inside each interval (-inf, b0], (b0, b1], ... (bk, inf).
+    The model sees inputs as float32, so the points must be float32 values.
+    """
+    below = breakpoints.astype(np.float32)
+    # Round down where casting to float32 rounded up past the breakpoint
+    below = np.where(below > breakpoints, np.nextafter(below, np.float32(-np.inf)), below)
+    if len(breakpoints):
+        last = np.float32(breakpoints[-1])
+        while last <= breakpoints[-1]:
+            last = np.nextafter(last, np.float32(np.inf))
+    else:
+        last = np.float32(0)
+    return np.append(below, last).astype(np.float32)
+
+
+class PriorityCurve:
+    """
+    A step function: values[j] holds for x in (breakpoints[j-1], breakpoints[j]],
+    with values[0] below the first breakpoint and values[-1] above the last.
+    """
+
+    def __init__(self, breakpoints, values):
+        self.breakpoints = np.asarray(breakpoints, dtype=np.float64)
+        self.values = np.asarray(values, dtype=np.float64)
+
+    def __call__(self, x):
+        # The model compares float32 inputs, so look up the float32 value too
+        x = np.asarray(x, dtype=np.float32).astype(np.float64)
+        return self.values[np.searchsorted(self.breakpoints, x, side="left")]
+
+    def simplified(self):
+        """Drop breakpoints where the value does not change."""
+        keep = self.values[1:] != self.values[:-1]
+        return PriorityCurve(self.breakpoints[keep], self.values[np.append(True, keep)])
+
+    def to_bytes(self):
+        return self.breakpoints.tobytes(), self.values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, breakpoints, values):
+        return cls(np.frombuffer(breakpoints, dtype=np.float64),
+                   np.frombuffer(values, dtype=np.float64))
+
+    def __len__(self):
+        return len(self.values)
+
+
+def _base_score(model):
+    init = model.init_
+    if isinstance(init, str) and init == "zero":
+        return 0.0
+    constant = getattr(init, "constant_", None)
+    if constant is None:
+        raise ValueError(f"Unsupported init estimator: {init!r}")
+    return float(np.ravel(constant)[0])
+
+
+def _breadth_first(tree):
+    """sklearn node ids in breadth-first order, children kept adjacent."""
+    order = [0]
+    for node in order:  # `order` grows while we iterate
+        if tree.children_left[node] != _TREE_LEAF:
+            order.append(tree.children_left[node])
+            order.append(tree.children_right[node])
+    return np.asarray(order, dtype=np.intp)
+
+
+def compile_gradient_boosting(model):
+    """Flatten a fitted single-output GradientBoostingRegressor."""
+    estimators = model.estimators_
+    if estimators.ndim != 2 or estimators.shape[1] != 1:
+        raise ValueError("Only single-output regressors are supported")
+
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in estimators[:, 0]:
+        tree = estimator.tree_
+        order = _breadth_first(tree)
+        new_id = np.empty(tree.node_count, dtype=np.intp)
+        new_id[order] = np.arange(len(order))
+
+        is_leaf = tree.children_left[order] == _TREE_LEAF
+        left = np.where(is_leaf, order, tree.children_left[order])
+        features.append(np.where(is_leaf, 0, tree.feature[order]))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold[order]))
+        children.append(new_id[left] + offset)
+        values.append(tree.value[order, 0, 0])
+        roots.append(offset)
+
+        offset += len(order)
+        max_depth = max(max_depth, tree.max_depth)
+
+    return CompiledTreeEnsemble(
+        feature=np.concatenate(features).astype(np.intp),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        children=np.concatenate(children).astype(np.intp),
+        value=np.concatenate(values).astype(np.float64),
+        roots=np.asarray(roots, dtype=np.intp),
+        base_score=_base_score(model),
+        learning_rate=model.learning_rate,
+        max_depth=max_depth,
+        n_features=model.n_features_in_,
+    )
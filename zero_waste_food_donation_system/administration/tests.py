@@ -1,3 +1,99 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Donor, FoodDonation, PickupSchedule, Receiver
+from core.rollups import rebuild
+from .models import Admin
+
+
+class AdminAnalyticsTests(TestCase):
+    def setUp(self):
+        admin = Admin.objects.create(username='admin', password='Secret123')
+        session = self.client.session
+        session['admin_id'] = admin.id
+        session.save()
+
+    def add_history(self, months):
+        donor = Donor.objects.create(name='donor', contact='9999999999', location_lat=12.97,
+                                     location_long=77.59, password='Secret123')
+        receiver = Receiver.objects.create(name='receiver', contact='8888888888', capacity=40,
+                                           location_lat=12.93, location_long=77.62, password='Secret123')
+        now = timezone.now()
+        for month in range(months):
+            moment = now - timedelta(days=28 * month)
+            donation = FoodDonation.objects.create(donor_id=donor, food_type='Rice', quantity=10,
+                                                   expiry_time=now + timedelta(days=1))
+            FoodDonation.objects.filter(pk=donation.pk).update(created_at=moment)
+            PickupSchedule.objects.create(donation_id=donation, receiver_id=receiver, scheduled_time=moment,
+                                          pickup_status='accepted' if month % 2 else 'rejected')
+        rebuild()  # The backdating bypassed the rollups
+
+    def query_count(self, url_name):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_trend_queries_do_not_grow_with_history(self):
+        empty = {url_name: self.query_count(url_name) for url_name in ('admin_dashboard', 'analytics')}
+        self.add_history(12)
+        for url_name, count in empty.items():
+            self.assertEqual(self.query_count(url_name), count, url_name)
+
+    def test_monthly_performance(self):
+        self.add_history(12)
+        performance = self.client.get(reverse('analytics')).context['monthly_performance']
+        self.assertEqual(len(performance), 12)
+        self.assertEqual(sum(point['donations'] for point in performance), 12)
+
+
+class AdminDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        admin = Admin.objects.create(username='admin', password='Secret123')
+        session = self.client.session
+        session['admin_id'] = admin.id
+        session.save()
+        donor = Donor.objects.create(name='donor', contact='9999999999', location_lat=12.97,
+                                     location_long=77.59, password='Secret123')
+        receiver = Receiver.objects.create(name='receiver', contact='8888888888', capacity=40,
+                                           location_lat=12.93, location_long=77.62, password='Secret123')
+        now = timezone.now()
+        for status, pickup_status in [('available', 'pending'), ('reserved', 'accepted'), ('completed', 'rejected')]:
+            donation = FoodDonation.objects.create(donor_id=donor, food_type='Rice', quantity=10, status=status,
+                                                   expiry_time=now + timedelta(days=1))
+            PickupSchedule.objects.create(donation_id=donation, receiver_id=receiver, scheduled_time=now,
+                                          priority_score=0.6, pickup_status=pickup_status)
+
+    def test_counters(self):
+        context = self.client.get(reverse('admin_dashboard')).context
+        self.assertEqual(
+            [context[key] for key in ('donations_count', 'available_donations', 'reserved_donations',
+                                      'completed_donations', 'pickups_count', 'pending_pickups',
+                                      'accepted_pickups', 'rejected_pickups', 'recent_donations',
+                                      'recent_pickups', 'total_quantity')],
+            [3, 1, 1, 1, 3, 1, 1, 1, 3, 3, 30],
+        )
+        self.assertEqual(context['avg_priority'], 0.6)
+        self.assertEqual(context['top_donors'], [{'name': 'donor', 'num_donations': 3, 'total_quantity': 30}])
+
+    def test_dashboard_is_cached(self):
+        self.client.get(reverse('admin_dashboard'))
+        # Only the session is read while the cached dashboard is fresh
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.context['donations_count'], 3)
+
+    @override_settings(ADMIN_DASHBOARD_CACHE_TIMEOUT=0)
+    def test_cache_can_be_disabled(self):
+        self.client.get(reverse('admin_dashboard'))
+        FoodDonation.objects.create(donor_id=Donor.objects.get(), food_type='Bread', quantity=5,
+                                    expiry_time=timezone.now() + timedelta(days=1))
+        self.assertEqual(self.client.get(reverse('admin_dashboard')).context['donations_count'], 4)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib.auth.hashers import check_password
 from core.models import Donor, Receiver, FoodDonation, PickupSchedule, MLPredictions
@@ -8,7 +9,11 @@ from django.utils import timezone
 from datetime import timedelta
 import json
 from django.db.models import Count, Sum
-from django.db.models.functions import TruncMonth
+from django.db.models.functions import Coalesce, TruncMonth
+from core.analytics import label, last_buckets_start, series
+from core.caching import get_or_compute
+from core.models import DonationDaily, PickupDaily
+from core.rollups import rollup_day
 
 
 def admin_login(request):
@@ -35,106 +40,83 @@ def admin_login(request):
     })
 
 
-def admin_dashboard(request):
-    if not request.session.get('admin_id'):
-        return redirect('admin_login')
+def dashboard_data(now=None):
+    """Everything the admin dashboard shows, ready to be cached."""
+    now = now or timezone.now()
+    week_ago = rollup_day(now - timedelta(days=7))
 
     # Basic counts
     donors_count = Donor.objects.count()
     receivers_count = Receiver.objects.count()
-    donations_count = FoodDonation.objects.count()
-    pickups_count = PickupSchedule.objects.count()
-
-    # Status-based counts
-    available_donations = FoodDonation.objects.filter(status='available').count()
-    reserved_donations = FoodDonation.objects.filter(status='reserved').count()
-    completed_donations = FoodDonation.objects.filter(status='completed').count()
-
-    # Pickup status counts
-    pending_pickups = PickupSchedule.objects.filter(pickup_status='pending').count()
-    accepted_pickups = PickupSchedule.objects.filter(pickup_status='accepted').count()
-    rejected_pickups = PickupSchedule.objects.filter(pickup_status='rejected').count()
 
-    # Recent activity (last 7 days)
-    week_ago = timezone.now() - timedelta(days=7)
-    recent_donations = FoodDonation.objects.filter(created_at__gte=week_ago).count()
-    recent_pickups = PickupSchedule.objects.filter(scheduled_time__gte=week_ago).count()
+    # Donation and pickup counters, one conditional aggregate over each of
+    # the daily rollups (core.rollups)
+    donations = DonationDaily.objects.aggregate(
+        total=Sum('count'),
+        quantity=Sum('quantity'),
+        recent=Sum('count', filter=Q(day__gte=week_ago)),
+        **{status: Sum('count', filter=Q(status=status)) for status in ('available', 'reserved', 'completed')}
+    )
+    pickups = PickupDaily.objects.aggregate(
+        total=Sum('count'),
+        priority=Sum('priority_total'),
+        recent=Sum('count', filter=Q(day__gte=week_ago)),
+        **{status: Sum('count', filter=Q(pickup_status=status)) for status in ('pending', 'accepted', 'rejected')}
+    )
+    donations = {key: value or 0 for key, value in donations.items()}
+    pickups = {key: value or 0 for key, value in pickups.items()}
 
     # Statistics
-    total_quantity = FoodDonation.objects.aggregate(total=Sum('quantity'))['total'] or 0
-    avg_priority = PickupSchedule.objects.aggregate(avg=Avg('priority_score'))['avg'] or 0
-    success_rate = (accepted_pickups / pickups_count * 100) if pickups_count > 0 else 0
+    pickups_count = pickups['total']
+    avg_priority = (pickups['priority'] / pickups_count) if pickups_count > 0 else 0
+    success_rate = (pickups['accepted'] / pickups_count * 100) if pickups_count > 0 else 0
 
     # Top performers
-    top_donors = Donor.objects.annotate(
-        num_donations=Count('fooddonation'),
-        total_quantity=Sum('fooddonation__quantity')
-    ).order_by('-num_donations')[:5]
+    top_donors = list(Donor.objects.annotate(
+        num_donations=Coalesce(Sum('donationdaily__count'), 0),
+        total_quantity=Coalesce(Sum('donationdaily__quantity'), 0)
+    ).order_by('-num_donations').values('name', 'num_donations', 'total_quantity')[:5])
 
-    top_receivers = Receiver.objects.annotate(
-        num_pickups=Count('pickupschedule'),
-        success_rate=Count('pickupschedule', filter=Q(pickupschedule__pickup_status='accepted'))
-    ).order_by('-num_pickups')[:5]
+    top_receivers = list(Receiver.objects.annotate(
+        num_pickups=Coalesce(Sum('pickupdaily__count'), 0),
+        success_rate=Coalesce(Sum('pickupdaily__count', filter=Q(pickupdaily__pickup_status='accepted')), 0)
+    ).order_by('-num_pickups').values('name', 'num_pickups', 'success_rate')[:5])
 
     # Food type distribution
-    food_type_dist = FoodDonation.objects.values('food_type').annotate(
-        count=Count('food_type'),
+    food_type_dist = list(DonationDaily.objects.values('food_type').annotate(
+        count=Sum('count'),
         total_quantity=Sum('quantity')
-    ).order_by('-count')
-
-    # Monthly trend data
-    # Monthly trend data - FIXED VERSION
-    monthly_trend = []
-    current = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    
-    for i in range(6):  # Last 6 months
-        # Calculate month start and end
-        month_offset = 5 - i  # Start from 5 months ago to current month
-        month_date = current - timedelta(days=month_offset * 30)
-        month_start = month_date.replace(day=1)
-        
-        if month_start.month == 12:
-            month_end = month_start.replace(year=month_start.year + 1, month=1, day=1) - timedelta(seconds=1)
-        else:
-            month_end = month_start.replace(month=month_start.month + 1, day=1) - timedelta(seconds=1)
-        
-        # Get donations for this month
-        month_donations = FoodDonation.objects.filter(
-            created_at__gte=month_start,
-            created_at__lte=month_end
-        )
-        
-        # Get pickups for this month
-        month_pickups = PickupSchedule.objects.filter(
-            scheduled_time__gte=month_start,
-            scheduled_time__lte=month_end
-        )
-        
-        monthly_trend.append({
-            'month': month_start.strftime('%b %Y'),
-            'donations': month_donations.count(),
-            'pickups': month_pickups.count(),
-            'quantity': month_donations.aggregate(total=Sum('quantity'))['total'] or 0
-        })
-
-    # Debug: Print monthly trend data
-    print("DEBUG: Monthly trend data:", monthly_trend)
-
-    context = {
-        'user_type': 'admin',
+    ).filter(count__gt=0).order_by('-count'))
+
+    # Monthly trend data: the last 6 calendar months, one query per series
+    months_start = last_buckets_start(now, 'month', 6)
+    donation_months = series(DonationDaily.objects.all(), 'day', 'month', months_start, now,
+                             quantity='quantity', counted='count')
+    pickup_months = series(PickupDaily.objects.all(), 'day', 'month', months_start, now, counted='count')
+    monthly_trend = [
+        {
+            'month': label(donation_month['start'], 'month', with_year=True),
+            'donations': donation_month['count'],
+            'pickups': pickup_month['count'],
+            'quantity': donation_month['quantity'],
+        }
+        for donation_month, pickup_month in zip(donation_months, pickup_months)
+    ]
+
+    return {
         'donors_count': donors_count,
         'receivers_count': receivers_count,
-        'donations_count': donations_count,
+        'donations_count': donations['total'],
         'pickups_count': pickups_count,
-        'available_donations': available_donations,
-        'reserved_donations': reserved_donations,
-        'completed_donations': completed_donations,
-        'pending_pickups': pending_pickups,
-        'accepted_pickups': accepted_pickups,
-        'rejected_pickups': rejected_pickups,
-        'recent_donations': recent_donations,
-        'recent_pickups': recent_pickups,
-        'total_quantity': total_quantity,
+        'available_donations': donations['available'],
+        'reserved_donations': donations['reserved'],
+        'completed_donations': donations['completed'],
+        'pending_pickups': pickups['pending'],
+        'accepted_pickups': pickups['accepted'],
+        'rejected_pickups': pickups['rejected'],
+        'recent_donations': donations['recent'],
+        'recent_pickups': pickups['recent'],
+        'total_quantity': donations['quantity'],
         'avg_priority': round(avg_priority, 2),
         'success_rate': round(success_rate, 1),
         'top_donors': top_donors,
@@ -144,6 +126,16 @@ def admin_dashboard(request):
         'monthly_trend_json': json.dumps(monthly_trend),  # Add JSON version
     }
 
+
+def admin_dashboard(request):
+    if not request.session.get('admin_id'):
+        return redirect('admin_login')
+
+    # Shared by every admin for ADMIN_DASHBOARD_CACHE_TIMEOUT seconds and
+    # recomputed by one request at a time (core.caching)
+    data = get_or_compute('admin_dashboard', dashboard_data, settings.ADMIN_DASHBOARD_CACHE_TIMEOUT)
+    context = {'user_type': 'admin', **data}
+
     return render(request, 'administration/dashboard.html', context)
 
 def admin_logout(request):
@@ -208,57 +200,43 @@ def pickups_list(request):
 # --- Analytics ---
 @admin_required
 def analytics_view(request):
+    # Everything below comes from the daily rollups (core.rollups)
     # Food type analytics
-    food_type_analytics = list(FoodDonation.objects.values('food_type').annotate(
-        count=Count('food_type'),
-        total_quantity=Sum('quantity'),
-        avg_quantity=Avg('quantity')
-    ).order_by('-count'))
+    food_type_analytics = list(DonationDaily.objects.values('food_type').annotate(
+        count=Sum('count'),
+        total_quantity=Sum('quantity')
+    ).filter(count__gt=0).order_by('-count'))
+    for item in food_type_analytics:
+        item['avg_quantity'] = item['total_quantity'] / item['count']
     
     # Status distribution
-    status_distribution = list(FoodDonation.objects.values('status').annotate(
-        count=Count('status')
-    ).order_by('-count'))
+    status_distribution = list(DonationDaily.objects.values('status').annotate(
+        count=Sum('count')
+    ).filter(count__gt=0).order_by('-count'))
     
     # Pickup success analytics
-    pickup_analytics = list(PickupSchedule.objects.values('pickup_status').annotate(
-        count=Count('pickup_status'),
-        avg_priority=Avg('priority_score')
-    ).order_by('-count'))
-    
-    # Monthly performance
-    monthly_performance = []
-    current = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    pickup_analytics = list(PickupDaily.objects.values('pickup_status').annotate(
+        count=Sum('count'),
+        priority_total=Sum('priority_total')
+    ).filter(count__gt=0).order_by('-count'))
+    for item in pickup_analytics:
+        item['avg_priority'] = item.pop('priority_total') / item['count']
     
-    for i in range(12):  # Last 12 months
-        months_ago = 11 - i
-        target_date = current - timedelta(days=months_ago * 30)
-        target_month = target_date.month
-        target_year = target_date.year
-        
-        month_start = timezone.datetime(target_year, target_month, 1, tzinfo=timezone.get_current_timezone())
-        
-        if target_month == 12:
-            month_end = timezone.datetime(target_year + 1, 1, 1, tzinfo=timezone.get_current_timezone()) - timedelta(seconds=1)
-        else:
-            month_end = timezone.datetime(target_year, target_month + 1, 1, tzinfo=timezone.get_current_timezone()) - timedelta(seconds=1)
-        
-        month_donations = FoodDonation.objects.filter(created_at__range=[month_start, month_end])
-        month_pickups = PickupSchedule.objects.filter(scheduled_time__range=[month_start, month_end])
-        month_accepted_pickups = PickupSchedule.objects.filter(
-            scheduled_time__range=[month_start, month_end],
-            pickup_status='accepted'
-        )
-        
-        total_pickups = month_pickups.count()
-        success_rate = (month_accepted_pickups.count() / total_pickups * 100) if total_pickups > 0 else 0
-        
-        monthly_performance.append({
-            'month': month_start.strftime('%b %Y'),
-            'donations': month_donations.count(),
-            'pickups': total_pickups,
-            'success_rate': round(success_rate, 1)
-        })
+    # Monthly performance: the last 12 calendar months, one query per series
+    now = timezone.now()
+    months_start = last_buckets_start(now, 'month', 12)
+    donation_months = series(DonationDaily.objects.all(), 'day', 'month', months_start, now, counted='count')
+    pickup_months = series(PickupDaily.objects.all(), 'day', 'month', months_start, now,
+                           success=Q(pickup_status='accepted'), counted='count')
+    monthly_performance = [
+        {
+            'month': label(donations['start'], 'month', with_year=True),
+            'donations': donations['count'],
+            'pickups': pickups['count'],
+            'success_rate': pickups['success_rate'],
+        }
+        for donations, pickups in zip(donation_months, pickup_months)
+    ]
 
     context = {
         "food_type_analytics": food_type_analytics,        # ✅ list instead of QuerySet
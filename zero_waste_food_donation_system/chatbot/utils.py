@@ -1,10 +1,19 @@
 from django.utils import timezone
-from core.models import FoodDonation
+from core.models import FoodDonation, PriorityScore
 
-def explain_priority(donation_id):
+def explain_priority(donation_id, receiver_id=None):
     try:
         donation = FoodDonation.objects.get(donation_id=donation_id)
 
+        # Scores are stored per receiver; fall back to the donation's own field
+        priority_score = donation.priority_score
+        if receiver_id is not None:
+            stored = PriorityScore.objects.filter(
+                donation_id=donation, receiver_id=receiver_id
+            ).values_list('score', flat=True).first()
+            if stored is not None:
+                priority_score = stored
+
         reasons = []
         hours_left = (donation.expiry_time - timezone.now()).total_seconds() / 3600
 
@@ -16,7 +25,7 @@ def explain_priority(donation_id):
         if donation.quantity >= 20:
             reasons.append("the quantity of food is high")
 
-        if donation.priority_score >= 0.7:
+        if priority_score >= 0.7:
             reasons.append("the ML model predicted high urgency")
 
         if not reasons:
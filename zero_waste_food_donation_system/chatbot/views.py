@@ -17,7 +17,7 @@ def chatbot_response(request):
 
     if match:
         donation_id = int(match.group(1))
-        reply = explain_priority(donation_id)
+        reply = explain_priority(donation_id, request.session.get('receiver_id'))
     else:
         reply = (
             "I can explain donation priority. "
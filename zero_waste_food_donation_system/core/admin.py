@@ -1,4 +1,4 @@
 from django.contrib import admin
 from .models import *
 
-admin.site.register([Donor, DonorAddress, Receiver, ReceiverAddress, FoodDonation, PickupSchedule, MLPredictions])
\ No newline at end of file
+admin.site.register([Donor, DonorAddress, Receiver, ReceiverAddress, FoodDonation, PickupSchedule, PriorityScore, MLPredictions])
\ No newline at end of file
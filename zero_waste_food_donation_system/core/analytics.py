@@ -0,0 +1,207 @@
+"""
+Time-bucketed series for the donor, receiver and admin charts.
+
+series() groups a queryset by day, week or month of one of its date fields
+(TruncDay / TruncWeek / TruncMonth in the current time zone) in a single
+query and fills the buckets without rows in Python, so a chart costs one
+query however many buckets it shows. Buckets are calendar days, weeks
+starting on Monday, and calendar months. It also reads the daily rollups
+of core.rollups, whose rows are already counts per day.
+
+chart_window() maps the ?period= of the analytics pages to the buckets
+they plot.
+
+chart_data_view() caches the JSON chart endpoints per user, period and
+data version (bumped by core.rollups when the user's rows change) and
+answers conditional requests with 304, so a chart reloaded with no new
+data costs only the session lookup and one read of the data versions.
+"""
+from datetime import datetime, time, timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .caching import data_versions, get_or_compute
+
+TRUNC = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+
+# period -> (bucket unit, number of buckets up to and including the current one)
+PERIODS = {
+    'week': ('day', 7),
+    'month': ('week', 5),
+    'year': ('month', 12),
+}
+
+LABEL_FORMATS = {'day': '%a', 'week': '%m/%d', 'month': '%b'}
+
+
+def bucket_start(moment, unit):
+    """Start of the bucket containing `moment`, in the current time zone."""
+    local = timezone.localtime(moment).replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == 'week':
+        local -= timedelta(days=local.weekday())
+    elif unit == 'month':
+        local = local.replace(day=1)
+    return local
+
+
+def next_bucket(start, unit):
+    if unit == 'day':
+        return start + timedelta(days=1)
+    if unit == 'week':
+        return start + timedelta(days=7)
+    # Month: the 28th plus four days is always in the next month
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def previous_bucket(start, unit):
+    return bucket_start(start - timedelta(days=1), unit)
+
+
+def bucket_starts(start, end, unit):
+    """Starts of the buckets from the one containing `start` to the one containing `end`."""
+    current, last = bucket_start(start, unit), bucket_start(end, unit)
+    starts = []
+    while current <= last:
+        starts.append(current)
+        current = next_bucket(current, unit)
+    return starts
+
+
+def last_buckets_start(now, unit, count):
+    """Start of the first of the `count` buckets ending with the current one."""
+    start = bucket_start(now, unit)
+    for _ in range(count - 1):
+        start = previous_bucket(start, unit)
+    return start
+
+
+def chart_window(period, now, since):
+    """
+    (first bucket start, unit) of a chart for `period`; an unknown period
+    means all time since `since`, by month.
+    """
+    if period not in PERIODS:
+        return bucket_start(min(since, now), 'month'), 'month'
+    unit, count = PERIODS[period]
+    return last_buckets_start(now, unit, count), unit
+
+
+def series(queryset, date_field, unit, start, end, quantity=None, success=None, counted=None):
+    """
+    [{'start', 'count', 'quantity', 'successful', 'success_rate'}] for every
+    bucket from `start` to `end`, from one query. `quantity` is the field
+    summed into 'quantity' and `success` a Q() selecting the successful rows;
+    the keys of the ones not given are left out. Rows are counted, or
+    `counted` is the field summed as their count (for the rollups, whose
+    `date_field` is a DateField).
+    """
+    starts = bucket_starts(start, end, unit)
+
+    def total(**extra):
+        return Sum(counted, **extra) if counted else Count('pk', **extra)
+
+    # Named apart from the fields, which `counted` and `quantity` may be
+    aggregates = {'bucket_count': total()}
+    if quantity is not None:
+        aggregates['bucket_quantity'] = Sum(quantity)
+    if success is not None:
+        aggregates['bucket_successful'] = total(filter=success)
+
+    by_date = queryset.model._meta.get_field(date_field).get_internal_type() == 'DateField'
+    if by_date:
+        first, last, trunc = starts[0].date(), timezone.localtime(end).date(), {}
+    else:
+        first, last, trunc = starts[0], end, {'tzinfo': timezone.get_current_timezone()}
+    rows = (
+        queryset.filter(**{f'{date_field}__gte': first, f'{date_field}__lte': last})
+        .annotate(bucket=TRUNC[unit](date_field, **trunc))
+        .order_by()
+        .values('bucket')
+        .annotate(**aggregates)
+    )
+    by_bucket = {row.pop('bucket'): row for row in rows}
+
+    points = []
+    for bucket in starts:
+        row = by_bucket.get(bucket.date() if by_date else bucket, {})
+        point = {'start': bucket, 'count': row.get('bucket_count') or 0}
+        if quantity is not None:
+            point['quantity'] = row.get('bucket_quantity') or 0
+        if success is not None:
+            point['successful'] = row.get('bucket_successful') or 0
+            point['success_rate'] = round(point['successful'] / point['count'] * 100, 1) if point['count'] else 0
+        points.append(point)
+    return points
+
+
+def label(start, unit, with_year=False):
+    return start.strftime('%b %Y' if with_year else LABEL_FORMATS[unit])
+
+
+def chart_period(request):
+    """The ?period= of `request`; anything but a known period means all time."""
+    period = request.GET.get('period', 'month')
+    return period if period in PERIODS else 'all'
+
+
+def chart_version(request, role):
+    """
+    (tag, last modified) of the chart data `request` asks for as the
+    session's `role` ('donor' or 'receiver'), or None without a session.
+    The tag covers the user, the period, the data versions and today's
+    date, since the periods end today.
+    """
+    cached = getattr(request, '_chart_versions', {})
+    if role not in cached:
+        user_id = request.session.get(f'{role}_id')
+        if user_id is None:
+            cached[role] = None
+        else:
+            scope = f'{role}:{user_id}'
+            (shared, shared_at), (own, own_at) = data_versions('rollups', scope)
+            today = timezone.localdate()
+            midnight = timezone.make_aware(datetime.combine(today, time()))
+            cached[role] = (f'{scope}:{chart_period(request)}:{shared}:{own}:{today.isoformat()}',
+                            max(shared_at, own_at, midnight))
+        request._chart_versions = cached
+    return cached[role]
+
+
+def chart_data_view(role):
+    """
+    Decorator for the JSON chart endpoint of `role`: serves the response
+    from the cache (settings.ANALYTICS_CACHE_TIMEOUT) while the data
+    version is unchanged, with ETag and Last-Modified, and answers 304 to
+    conditional requests for the current version.
+    """
+    def etag(request, *args, **kwargs):
+        version = chart_version(request, role)
+        return version and version[0]
+
+    def last_modified(request, *args, **kwargs):
+        version = chart_version(request, role)
+        return version and version[1]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            version = chart_version(request, role)
+            if version is None:
+                return view(request, *args, **kwargs)
+            content = get_or_compute(f'chart:{version[0]}', lambda: view(request, *args, **kwargs).content,
+                                     settings.ANALYTICS_CACHE_TIMEOUT)
+            return HttpResponse(content, content_type='application/json')
+
+        # Private: the response depends on the session; no-cache: browsers
+        # revalidate with If-None-Match on every fetch
+        return cache_control(private=True, no_cache=True)(
+            condition(etag_func=etag, last_modified_func=last_modified)(wrapper)
+        )
+    return decorator
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import pre_delete
+        from .db_functions import register_sqlite_functions
+        from .models import FoodDonation, PickupSchedule
+        from .rollups import untrack_deleted
+
+        connection_created.connect(register_sqlite_functions, dispatch_uid='core_sqlite_functions')
+        for model in (FoodDonation, PickupSchedule):
+            pre_delete.connect(untrack_deleted, sender=model, dispatch_uid=f'core_untrack_{model.__name__}')
+
+        # Opt-in for web workers: pay the model load at boot rather than on
+        # the first request. Management commands leave it off.
+        if getattr(settings, 'ML_MODEL_WARMUP', False):
+            from ML_Model.ml_model import warm_up
+            warm_up()
@@ -0,0 +1,94 @@
+"""
+Cached values that are expensive to compute and read by many requests.
+
+get_or_compute() keeps a value in the Django cache for `timeout` seconds
+and protects its recomputation from stampedes: when the value expires,
+the first caller takes a lock (cache.add, which is atomic in every cache
+backend) and recomputes it while the others keep getting the expired
+value, which stays in the cache for `stale` more seconds. Only when there
+is no value at all do the others wait, up to `wait` seconds, for the lock
+holder to store it. The lock is shared by every process using the same
+cache backend; with the default per-process LocMemCache each process
+computes the value once.
+
+Data versions name the current state of some data, e.g. everything
+behind one donor's charts ("donor:3"): data_versions() returns a token
+and the time it was issued, and bump_versions() replaces them in the
+transaction that changed the data. They are DataVersion rows rather than
+cache entries, so a change made by any process (a web worker, a
+management command) is seen by all of them, whatever the cache backend.
+Cache keys and ETags built from the token change with it, so nothing
+needs deleting.
+"""
+import logging
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import DataVersion
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = 60  # A lock holder that died frees the lock after this many seconds
+POLL_INTERVAL = 0.05
+
+
+def get_or_compute(key, compute, timeout, stale=None, wait=10.0):
+    """
+    The value cached under `key`, computed by compute() when it is missing
+    or older than `timeout` seconds. A timeout of 0 disables the cache.
+    """
+    if not timeout:
+        return compute()
+    stale = timeout if stale is None else stale
+    entry = cache.get(key)  # (expires_at, value)
+    if entry is not None and entry[0] > time.time():
+        return entry[1]
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, True, LOCK_TIMEOUT):
+        try:
+            value = compute()
+            cache.set(key, (time.time() + timeout, value), timeout + stale)
+        finally:
+            cache.delete(lock_key)
+        return value
+    if entry is not None:
+        return entry[1]  # Being recomputed by another caller
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+    logger.warning("Gave up waiting for %s to be computed; computing it again", key)
+    return compute()
+
+
+# Version of the scopes never bumped
+UNVERSIONED = ('', datetime(2000, 1, 1, tzinfo=dt_timezone.utc))
+
+
+def data_versions(*scopes):
+    """[(token, issued at)] of each scope, UNVERSIONED for those never bumped."""
+    versions = {scope: (token, issued_at) for scope, token, issued_at in
+                DataVersion.objects.filter(scope__in=scopes).values_list('scope', 'token', 'issued_at')}
+    return [versions.get(scope, UNVERSIONED) for scope in scopes]
+
+
+def bump_versions(scopes):
+    """Issue new versions of `scopes`, as part of the current transaction."""
+    scopes = set(scopes)
+    if scopes:
+        token, issued_at = uuid.uuid4().hex, timezone.now().replace(microsecond=0)
+        # Create the missing rows (keeping any another transaction created
+        # first), then give all of them the new token
+        DataVersion.objects.bulk_create(
+            [DataVersion(scope=scope, token=token, issued_at=issued_at) for scope in scopes],
+            ignore_conflicts=True,
+        )
+        DataVersion.objects.filter(scope__in=scopes).update(token=token, issued_at=issued_at)
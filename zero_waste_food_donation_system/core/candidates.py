@@ -0,0 +1,212 @@
+"""
+Reverse matching: the best receivers for a newly posted donation.
+
+update_candidates() scores a donation against every receiver within
+`radius_km` of its donor (the grid index narrows the receivers, see
+core.spatial) in a single model call and keeps the `count` best as
+DonationCandidate rows. A receiver's "new for you" list is then a plain
+read of its rows (new_for_receiver), with no scoring on the request path.
+
+donation_entry only queues the work: enqueue_candidates() hands it to one
+background thread after the donation's transaction commits, so posting a
+donation never waits for the model. Set DONATION_CANDIDATES_ASYNC = False
+to run it inline instead. `manage.py precompute_candidates` fills in the
+donations the thread missed (e.g. because the process was restarted).
+
+Candidates are only read for the active model, and precompute_candidates
+recomputes them after a switch. A change to their other inputs deletes
+the candidates of the donations it affects and queues them again
+(invalidate_candidates): FoodDonation.save() for its own quantity,
+food type, donor or expiry time, Donor.save() for the location of a
+donor (its available donations), Receiver.save() for a new receiver or
+the capacity or location of one (see receiver_donations).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ML_Model.ml_model import assemble_features, encode_food_types, is_known_food_type
+from ML_Model.registry import active_tag, get_active_model
+from .geo import haversine_km
+from .matching import DEFAULT_RADIUS_KM
+from .models import DonationCandidate, FoodDonation, Receiver
+from .spatial import cells_within
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CANDIDATE_COUNT = 10
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def rank_receivers(donation, receivers, now, model, radius_km=DEFAULT_RADIUS_KM, count=DEFAULT_CANDIDATE_COUNT):
+    """
+    [(receiver, score, distance_km)] of the `count` best receivers within
+    `radius_km`, best first.
+    """
+    donor = donation.donor_id
+    if not receivers or not is_known_food_type(donation.food_type):
+        return []
+    distances = haversine_km(
+        donor.location_lat, donor.location_long,
+        np.array([r.location_lat for r in receivers]), np.array([r.location_long for r in receivers]),
+    )
+    nearby = np.flatnonzero(distances <= radius_km)
+    if not len(nearby):
+        return []
+
+    X = assemble_features(
+        receiver_capacity=np.array([receivers[i].capacity for i in nearby], dtype=np.float64),
+        receiver_distance=distances[nearby],
+        food_type_encoded=encode_food_types([donation.food_type])[0],
+        quantity=donation.quantity,
+        time_to_expiry=(donation.expiry_time - now).total_seconds() / 3600,
+    )
+    scores = np.asarray(model.predict(X), dtype=np.float64)
+    best = np.argsort(-scores, kind='stable')[:count]
+    return [(receivers[nearby[i]], float(scores[i]), float(distances[nearby[i]])) for i in best]
+
+
+def update_candidates(donation, now=None, radius_km=DEFAULT_RADIUS_KM, count=DEFAULT_CANDIDATE_COUNT):
+    """Replace the stored candidates of `donation`; returns how many were kept."""
+    now = now or timezone.now()
+    model = get_active_model()
+    donor = donation.donor_id
+    receivers = list(Receiver.objects.filter(cells_within(donor.location_lat, donor.location_long, radius_km)))
+    ranked = rank_receivers(donation, receivers, now, model, radius_km=radius_km, count=count)
+
+    rows = [
+        DonationCandidate(
+            donation_id=donation,
+            receiver_id=receiver,
+            rank=rank,
+            score=score,
+            distance_km=distance_km,
+            model_version=model.tag,
+            computed_at=now,
+        )
+        for rank, (receiver, score, distance_km) in enumerate(ranked, start=1)
+    ]
+    with transaction.atomic():
+        DonationCandidate.objects.filter(donation_id=donation).delete()
+        DonationCandidate.objects.bulk_create(rows)
+    logger.debug("Donation %s: %s candidate receivers out of %s nearby",
+                 donation.donation_id, len(rows), len(receivers))
+    return len(rows)
+
+
+def _update_donations(donation_ids):
+    now = timezone.now()
+    donations = FoodDonation.objects.filter(
+        donation_id__in=donation_ids, status='available', expiry_time__gt=now,
+    ).select_related('donor_id')
+    for donation in donations:
+        update_candidates(donation, now=now)
+
+
+def _update_in_background(donation_ids):
+    close_old_connections()
+    try:
+        _update_donations(donation_ids)
+    except Exception:
+        logger.exception("Could not compute candidate receivers for donations %s", donation_ids)
+    finally:
+        # Pool threads outlive the request; do not leave their connection open
+        connection.close()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='donation-candidates')
+        return _executor
+
+
+def _enqueue(donation_ids):
+    if getattr(settings, 'DONATION_CANDIDATES_ASYNC', True):
+        transaction.on_commit(lambda: _get_executor().submit(_update_in_background, donation_ids))
+    else:
+        transaction.on_commit(lambda: _update_donations(donation_ids))
+
+
+def enqueue_candidates(donation):
+    """Compute the candidates of `donation` once the current transaction commits."""
+    _enqueue([donation.donation_id])
+
+
+def invalidate_candidates(donation_ids):
+    """
+    Delete the candidates of `donation_ids` and compute those of the ones
+    still available again once the current transaction commits.
+    """
+    donation_ids = list(donation_ids)
+    if donation_ids:
+        DonationCandidate.objects.filter(donation_id__in=donation_ids).delete()
+        _enqueue(donation_ids)
+
+
+def receiver_donations(receiver, now=None, radius_km=DEFAULT_RADIUS_KM):
+    """
+    Ids of the donations whose candidates may change when `receiver` is
+    added or its capacity or location changes: those it is a candidate
+    for, and the available ones within `radius_km` of where it is now.
+    """
+    now = now or timezone.now()
+    nearby = cells_within(receiver.location_lat, receiver.location_long, radius_km, prefix='donor_id__')
+    return (
+        FoodDonation.objects.filter(
+            Q(donationcandidate__receiver_id=receiver)
+            | (nearby & Q(status='available', expiry_time__gt=now))
+        )
+        .values_list('donation_id', flat=True)
+        .distinct()
+    )
+
+
+def new_for_receiver(receiver, now=None, limit=20):
+    """
+    Candidate rows of `receiver` for donations that are still available and
+    that it has not requested yet, newest donation first.
+    """
+    now = now or timezone.now()
+    return list(
+        DonationCandidate.objects.filter(
+            receiver_id=receiver, model_version=active_tag(),
+            donation_id__status='available', donation_id__expiry_time__gt=now,
+        )
+        .exclude(donation_id__pickupschedule__receiver_id=receiver)
+        .select_related('donation_id__donor_id')
+        .order_by('-donation_id__created_at', 'rank')[:limit]
+    )
+
+
+def precompute_missing(now=None, chunk_size=500):
+    """
+    Candidates for available donations that have none from the active
+    model, e.g. after switching models; returns counters.
+    """
+    now = now or timezone.now()
+    tag = active_tag()
+    stats = {'donations': 0, 'candidates': 0}
+    last_id = 0
+    while True:
+        donations = list(
+            FoodDonation.objects.filter(status='available', expiry_time__gt=now, donation_id__gt=last_id)
+            .exclude(donationcandidate__model_version=tag)
+            .select_related('donor_id')
+            .order_by('donation_id')[:chunk_size]
+        )
+        if not donations:
+            return stats
+        last_id = donations[-1].donation_id
+        for donation in donations:
+            stats['donations'] += 1
+            stats['candidates'] += update_candidates(donation, now=now)
@@ -0,0 +1,144 @@
+"""
+Change feed of donations and pickups.
+
+Every time a FoodDonation or PickupSchedule is created or changes status
+(or, for a pickup, its scheduled time), a ChangeEvent is appended in the
+same transaction as the change (an outbox), so the feed neither misses a
+committed change nor shows a rolled-back one. FoodDonation.save() and
+PickupSchedule.save() record their own events; code that writes with
+QuerySet.update(), bulk_create() or bulk_update() calls record_donations()
+/ record_pickups() itself (see core.pickups, core.matching and
+core.slots).
+
+Clients sync with /changes/?cursor=<last event_id seen>: changes_since()
+returns the newer events in event_id order, a page at a time, with the
+cursor for the next call. Each event holds the whole state of its row, so
+compact() can drop all but the latest event of a row once they are older
+than the retention period; a client with an older cursor still ends up
+with the current state of every row, without the intermediate steps.
+
+The cursor follows commit order because SQLite runs one write transaction
+at a time; on a database with concurrent writers an event id may commit
+after a larger one has been read.
+"""
+import logging
+
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import ChangeEvent
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def donation_state(donation):
+    return {
+        'donation_id': donation.donation_id,
+        'donor_id': donation.donor_id_id,
+        'food_type': donation.food_type,
+        'quantity': donation.quantity,
+        'unit': donation.unit,
+        'expiry_time': _iso(donation.expiry_time),
+        'status': donation.status,
+        'assigned_receiver_id': donation.assigned_receiver_id,
+    }
+
+
+def pickup_state(pickup):
+    return {
+        'schedule_id': pickup.schedule_id,
+        'donation_id': pickup.donation_id_id,
+        'receiver_id': pickup.receiver_id_id,
+        'pickup_status': pickup.pickup_status,
+        'scheduled_time': _iso(pickup.scheduled_time),
+        'priority_score': pickup.priority_score,
+    }
+
+
+def record_donations(donations, created=False, now=None):
+    """Append one event per donation with its current state."""
+    now = now or timezone.now()
+    ChangeEvent.objects.bulk_create([
+        ChangeEvent(
+            entity='donation',
+            object_id=donation.donation_id,
+            action='created' if created else 'updated',
+            donor_id=donation.donor_id_id,
+            receiver_id=donation.assigned_receiver_id,
+            state=donation_state(donation),
+            created_at=now,
+        )
+        for donation in donations
+    ])
+
+
+def record_pickups(pickups, created=False, now=None):
+    """Append one event per pickup; their donation_id must be loaded."""
+    now = now or timezone.now()
+    ChangeEvent.objects.bulk_create([
+        ChangeEvent(
+            entity='pickup',
+            object_id=pickup.schedule_id,
+            action='created' if created else 'updated',
+            donor_id=pickup.donation_id.donor_id_id,
+            receiver_id=pickup.receiver_id_id,
+            state=pickup_state(pickup),
+            created_at=now,
+        )
+        for pickup in pickups
+    ])
+
+
+def changes_since(cursor=0, limit=DEFAULT_PAGE_SIZE, donor_id=None, receiver_id=None):
+    """
+    Up to `limit` events after `cursor` visible to the donor or receiver:
+    a donor sees its donations and their pickups, a receiver its pickups
+    and every donation (they are all listed on its dashboard). Returns
+    (events, next cursor, whether more are waiting).
+    """
+    visible = Q()
+    if donor_id is not None:
+        visible |= Q(donor_id=donor_id)
+    if receiver_id is not None:
+        visible |= Q(receiver_id=receiver_id) | Q(entity='donation')
+    events = list(
+        ChangeEvent.objects.filter(visible, event_id__gt=cursor)
+        .order_by('event_id')[:limit + 1]
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+    return events, (events[-1].event_id if events else cursor), has_more
+
+
+def compact(before, batch_size=10_000):
+    """
+    Delete the events older than `before` that a later event of the same row
+    supersedes. Works through event ids in batches; returns the number
+    deleted.
+    """
+    latest = (
+        ChangeEvent.objects.filter(entity=OuterRef('entity'), object_id=OuterRef('object_id'))
+        .order_by('-event_id')
+        .values('event_id')[:1]
+    )
+    old = ChangeEvent.objects.filter(created_at__lt=before)
+    last_id = old.order_by('-event_id').values_list('event_id', flat=True).first()
+    if last_id is None:
+        return 0
+
+    deleted = 0
+    start = old.order_by('event_id').values_list('event_id', flat=True).first()
+    while start <= last_id:
+        end = start + batch_size
+        superseded = old.filter(event_id__gte=start, event_id__lt=end).exclude(event_id=Subquery(latest))
+        deleted += superseded.delete()[0]
+        start = end
+    logger.debug("Compacted %s change events older than %s", deleted, before)
+    return deleted
@@ -0,0 +1,73 @@
+"""
+Haversine distance as a database expression.
+
+    FoodDonation.objects.annotate(
+        distance=Haversine('donor_id__location_lat', 'donor_id__location_long', lat, long),
+    ).filter(distance__lte=10).order_by('distance')[:50]
+
+On SQLite the expression calls HAVERSINE_KM, a Python function registered
+on every new connection (see CoreConfig.ready). Other backends get the same
+formula built from Django's portable math functions, so filtering, ordering
+and slicing by distance always happen in the database.
+"""
+import math
+
+from django.db.models import F, FloatField, Func, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+from .geo import EARTH_RADIUS_KM
+
+SQLITE_FUNCTION = 'HAVERSINE_KM'
+
+
+def _haversine_km(lat1, long1, lat2, long2):
+    # Scalar twin of core.geo.haversine_km; NULL in, NULL out like SQL
+    if None in (lat1, long1, lat2, long2):
+        return None
+    lat1, long1, lat2, long2 = map(math.radians, (lat1, long1, lat2, long2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((long2 - long1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def register_sqlite_functions(sender, connection, **kwargs):
+    """connection_created receiver."""
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function(SQLITE_FUNCTION, 4, _haversine_km, deterministic=True)
+
+
+def _as_expression(value):
+    if hasattr(value, 'resolve_expression'):
+        return value
+    if isinstance(value, str):
+        return F(value)
+    return Value(float(value), output_field=FloatField())
+
+
+def haversine_expression(lat1, long1, lat2, long2):
+    """The haversine formula from Django's math functions, for any backend."""
+    lat1, long1, lat2, long2 = map(_as_expression, (lat1, long1, lat2, long2))
+    a = (
+        Power(Sin((Radians(lat2) - Radians(lat1)) / 2), 2)
+        + Cos(Radians(lat1)) * Cos(Radians(lat2)) * Power(Sin((Radians(long2) - Radians(long1)) / 2), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM, output_field=FloatField()) * ASin(Sqrt(a))
+
+
+class Haversine(Func):
+    """
+    Distance in km between two points given as field names, expressions or
+    numbers: Haversine(lat1, long1, lat2, long2).
+    """
+    function = SQLITE_FUNCTION
+    arity = 4
+    output_field = FloatField()
+
+    def __init__(self, lat1, long1, lat2, long2, **extra):
+        super().__init__(*map(_as_expression, (lat1, long1, lat2, long2)), **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, **extra_context)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return compiler.compile(haversine_expression(*self.get_source_expressions()))
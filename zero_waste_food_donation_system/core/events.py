@@ -0,0 +1,190 @@
+"""
+Pickup notifications pushed to donors and receivers.
+
+Events are published to a channel per user ("donor:<id>", "receiver:<id>")
+and streamed to the browser as Server-Sent Events by core.views.event_stream,
+which needs the ASGI application (zero_waste/asgi.py): under WSGI it answers
+204 and the dashboards fall back to polling.
+
+The broker is pluggable through settings.EVENTS_BROKER:
+
+- LocalBroker (default) delivers within one process, which is enough for a
+  single ASGI worker.
+- RedisBroker relays through Redis pub/sub (settings.EVENTS_REDIS_URL) so
+  every worker and node sees every event; it needs the redis package.
+
+Publishers call notify_donor() / notify_receiver(); events are sent once the
+current transaction commits, so nobody hears about a change that was
+rolled back.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Events kept for a subscriber that is not reading; older ones are dropped
+QUEUE_SIZE = 100
+
+MESSAGES = {
+    'pending': 'New pickup request available.',
+    'accepted': 'Pickup {schedule_id} successfully allocated.',
+    'rejected': 'Pickup {schedule_id} allocated to another receiver.',
+}
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def donor_channel(donor_id):
+    return f'donor:{donor_id}'
+
+
+def receiver_channel(receiver_id):
+    return f'receiver:{receiver_id}'
+
+
+def _put(queue, event):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class LocalBroker:
+    """In-process pub/sub; publish() may be called from any thread."""
+
+    def __init__(self):
+        self._subscribers = {}  # channel -> {queue: event loop}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, {}).items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(_put, queue, event)
+            except RuntimeError:  # The subscriber's event loop has closed
+                pass
+
+    def subscribe(self, channels):
+        """Async context manager yielding an asyncio.Queue of events."""
+        return _LocalSubscription(self, channels)
+
+
+class _LocalSubscription:
+    # A class rather than @asynccontextmanager: when the event loop finalizes
+    # an abandoned stream generator, a generator-based context manager inside
+    # it fails to close ("generator didn't stop after athrow()")
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        with self.broker._lock:
+            for channel in self.channels:
+                self.broker._subscribers.setdefault(channel, {})[self.queue] = loop
+        return self.queue
+
+    async def __aexit__(self, *exc_info):
+        with self.broker._lock:
+            for channel in self.channels:
+                subscribers = self.broker._subscribers.get(channel, {})
+                subscribers.pop(self.queue, None)
+                if not subscribers:
+                    self.broker._subscribers.pop(channel, None)
+
+
+class RedisBroker:
+    """Pub/sub through Redis, shared by every process that uses the same URL."""
+
+    def __init__(self, url=None):
+        try:
+            import redis  # noqa: F401
+        except ImportError:
+            raise ImproperlyConfigured("RedisBroker requires the redis package (pip install redis)")
+        self.url = url or settings.EVENTS_REDIS_URL
+        self._client = None
+
+    def publish(self, channel, event):
+        import redis
+
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(channel, json.dumps(event))
+
+    def subscribe(self, channels):
+        return _RedisSubscription(self.url, channels)
+
+
+class _RedisSubscription:
+    def __init__(self, url, channels):
+        self.url = url
+        self.channels = channels
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    async def __aenter__(self):
+        import redis.asyncio
+
+        self.client = redis.asyncio.Redis.from_url(self.url)
+        self.pubsub = self.client.pubsub()
+        await self.pubsub.subscribe(*self.channels)
+        self.relay = asyncio.create_task(self._relay())
+        return self.queue
+
+    async def _relay(self):
+        async for message in self.pubsub.listen():
+            if message['type'] == 'message':
+                _put(self.queue, json.loads(message['data']))
+
+    async def __aexit__(self, *exc_info):
+        self.relay.cancel()
+        await self.pubsub.unsubscribe(*self.channels)
+        await self.pubsub.close()
+        await self.client.close()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'EVENTS_BROKER', 'core.events.LocalBroker'))()
+        return _broker
+
+
+def publish(channel, event):
+    """Publish `event` (a JSON-ready dict) on `channel` after the current transaction commits."""
+    def send():
+        try:
+            get_broker().publish(channel, event)
+        except Exception:
+            # A notification is never worth failing the request for
+            logger.exception("Could not publish %s on %s", event.get('type'), channel)
+
+    transaction.on_commit(send)
+
+
+def pickup_event(schedule_id, status, donation_id=None):
+    return {
+        'type': f'pickup.{status}',
+        'schedule_id': schedule_id,
+        'donation_id': donation_id,
+        'status': status,
+        'message': MESSAGES[status].format(schedule_id=schedule_id),
+    }
+
+
+def notify_receiver(receiver_id, schedule_id, status, donation_id=None):
+    publish(receiver_channel(receiver_id), pickup_event(schedule_id, status, donation_id))
+
+
+def notify_donor(donor_id, schedule_id, status, donation_id=None):
+    publish(donor_channel(donor_id), pickup_event(schedule_id, status, donation_id))
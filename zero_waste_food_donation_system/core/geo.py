@@ -0,0 +1,113 @@
+"""
+Great-circle distances between donors and receivers.
+
+haversine_km() broadcasts like any NumPy ufunc, so one call covers a single
+pair, one point against many, or (with distance_matrix()) every donor
+against every receiver.
+
+Donors and receivers rarely move, so distances between them are also kept
+in a per-process cache keyed by (receiver_id, donor_id). Each entry records
+the coordinates it was computed from and is only used while both parties
+are still at those coordinates, which keeps the cache correct even when
+another process moved one of them; Donor.save() and Receiver.save() also
+drop the entries of a party whose location changed in this process.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Receivers whose distance rows are kept; least recently used rows go first
+MAX_CACHED_RECEIVERS = 1024
+
+
+def haversine_km(lat1, long1, lat2, long2):
+    """Distance in km; arrays broadcast, all-scalar input returns a float."""
+    lat1, long1 = np.radians(lat1), np.radians(long1)
+    lat2, long2 = np.radians(lat2), np.radians(long2)
+    dlat, dlong = lat2 - lat1, long2 - long1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlong / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    distance = EARTH_RADIUS_KM * c
+    return float(distance) if np.ndim(distance) == 0 else distance
+
+
+def distance_matrix(lats1, longs1, lats2, longs2):
+    """(len(lats1), len(lats2)) matrix of distances, in one vectorized pass."""
+    return haversine_km(
+        np.asarray(lats1, dtype=np.float64)[:, None], np.asarray(longs1, dtype=np.float64)[:, None],
+        np.asarray(lats2, dtype=np.float64)[None, :], np.asarray(longs2, dtype=np.float64)[None, :],
+    )
+
+
+# receiver_id -> (receiver_lat, receiver_long, {donor_id: (donor_lat, donor_long, km)})
+_rows = OrderedDict()
+_lock = threading.Lock()
+
+
+def _receiver_row(receiver):
+    key = (receiver.location_lat, receiver.location_long)
+    with _lock:
+        row = _rows.get(receiver.receiver_id)
+        if row is None or row[:2] != key:
+            row = (*key, {})
+            _rows[receiver.receiver_id] = row
+            while len(_rows) > MAX_CACHED_RECEIVERS:
+                _rows.popitem(last=False)
+        else:
+            _rows.move_to_end(receiver.receiver_id)
+    return row[2]
+
+
+def donor_distances(receiver, donors):
+    """
+    Distances from `receiver` to each of `donors` (Donor instances, repeats
+    allowed), as an array in the same order. Missing pairs are computed in
+    a single vectorized call and cached.
+    """
+    n = len(donors)
+    distances = np.empty(n, dtype=np.float64)
+    if n == 0:
+        return distances
+    cached = _receiver_row(receiver)
+
+    missing = []
+    for i, donor in enumerate(donors):
+        entry = cached.get(donor.donor_id)
+        if entry is not None and entry[0] == donor.location_lat and entry[1] == donor.location_long:
+            distances[i] = entry[2]
+        else:
+            missing.append(i)
+
+    if missing:
+        lats = np.fromiter((donors[i].location_lat for i in missing), dtype=np.float64, count=len(missing))
+        longs = np.fromiter((donors[i].location_long for i in missing), dtype=np.float64, count=len(missing))
+        computed = haversine_km(lats, longs, receiver.location_lat, receiver.location_long)
+        distances[missing] = computed
+        for i, km in zip(missing, computed.tolist()):
+            donor = donors[i]
+            cached[donor.donor_id] = (donor.location_lat, donor.location_long, km)
+    return distances
+
+
+def pair_distance(donor, receiver):
+    """Cached distance between one donor and one receiver."""
+    return float(donor_distances(receiver, [donor])[0])
+
+
+def invalidate_receiver(receiver_id):
+    with _lock:
+        _rows.pop(receiver_id, None)
+
+
+def invalidate_donor(donor_id):
+    with _lock:
+        for _, _, cached in _rows.values():
+            cached.pop(donor_id, None)
+
+
+def clear():
+    with _lock:
+        _rows.clear()
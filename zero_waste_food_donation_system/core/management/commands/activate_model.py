@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ML_Model.registry import get_active_model, list_models, set_active_model
+from core.candidates import precompute_missing
+
+
+class Command(BaseCommand):
+    help = (
+        "Switch the priority model used for scoring; running workers pick it up without a restart. "
+        "Recomputes the candidate receivers of available donations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?')
+        parser.add_argument('version', nargs='?')
+
+    def handle(self, *args, **options):
+        name, version = options['name'], options['version']
+        if not name:
+            active = get_active_model().tag
+            for model_name, model_version in list_models():
+                tag = f"{model_name}:{model_version}"
+                self.stdout.write(f"{'*' if tag == active else ' '} {tag}")
+            return
+        if not version:
+            raise CommandError("Both a model name and a version are required")
+        try:
+            set_active_model(name, version)
+        except LookupError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Active priority model is now {name}:{version}"))
+        stats = precompute_missing()
+        self.stdout.write(f"Stored {stats['candidates']} candidate receivers for {stats['donations']} donations")
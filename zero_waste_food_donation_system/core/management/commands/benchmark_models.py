@@ -0,0 +1,64 @@
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ML_Model.ml_model import FEATURE_COLUMNS, encode_food_types
+from ML_Model.registry import list_models, load_model
+
+DEFAULT_DATASET = settings.BASE_DIR.parent / 'ML_Part' / 'food_donation_dataset.csv'
+
+
+def percentiles_ms(samples):
+    return np.percentile(np.asarray(samples) * 1000, [50, 99])
+
+
+class Command(BaseCommand):
+    help = "Report single-row and batch latency (p50/p99) and RMSE for every registered priority model."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', default=str(DEFAULT_DATASET))
+        parser.add_argument('--single-rows', type=int, default=500,
+                            help="Number of one-row predictions to time per model")
+        parser.add_argument('--batch-runs', type=int, default=50,
+                            help="Number of whole-dataset predictions to time per model")
+
+    def handle(self, *args, **options):
+        df = pd.read_csv(options['dataset'])
+        df['food_type_encoded'] = encode_food_types(df['food_type'])
+        X = df[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+        y = df['priority_score'].to_numpy()
+        single_rows = X[:min(options['single_rows'], len(X))]
+
+        self.stdout.write(
+            f"{len(X)} rows from {options['dataset']} "
+            "(the bundled dataset includes the training rows, so RMSE is optimistic)\n"
+        )
+        header = f"{'model':<26}{'single p50':>12}{'single p99':>12}{'batch p50':>12}{'batch p99':>12}{'RMSE':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for name, version in list_models():
+            model = load_model(name, version)
+            model.predict(X[:1])  # Warm-up
+
+            single = []
+            for row in single_rows:
+                start = time.perf_counter()
+                model.predict(row[None, :])
+                single.append(time.perf_counter() - start)
+
+            batch = []
+            for _ in range(options['batch_runs']):
+                start = time.perf_counter()
+                predictions = model.predict(X)
+                batch.append(time.perf_counter() - start)
+
+            rmse = float(np.sqrt(np.mean((predictions - y) ** 2)))
+            s50, s99 = percentiles_ms(single)
+            b50, b99 = percentiles_ms(batch)
+            self.stdout.write(
+                f"{model.tag:<26}{s50:>10.3f}ms{s99:>10.3f}ms{b50:>10.3f}ms{b99:>10.3f}ms{rmse:>10.4f}"
+            )
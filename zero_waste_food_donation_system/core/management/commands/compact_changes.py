@@ -0,0 +1,29 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core.changefeed import compact
+
+
+class Command(BaseCommand):
+    help = "Drop change feed events that a later event of the same row supersedes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help="Keep every event of the last N days")
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Repeat every N seconds instead of running once")
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            deleted = compact(timezone.now() - timedelta(days=options['days']), batch_size=options['batch_size'])
+            self.stdout.write(f"Deleted {deleted} superseded events in {time.perf_counter() - start:.2f}s")
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
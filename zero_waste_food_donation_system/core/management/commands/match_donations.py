@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.matching import DEFAULT_MAX_RECEIVERS, DEFAULT_RADIUS_KM, match_donations
+
+
+class Command(BaseCommand):
+    help = "Assign available donations to nearby receivers and propose pending pickups."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--radius-km', type=float, default=DEFAULT_RADIUS_KM,
+                            help="Only consider receivers this close to the donor")
+        parser.add_argument('--max-receivers', type=int, default=DEFAULT_MAX_RECEIVERS,
+                            help="Nearest receivers considered per donation")
+        parser.add_argument('--dry-run', action='store_true', help="Print the proposals without saving them")
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Repeat every N seconds instead of running once")
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            stats = match_donations(radius_km=options['radius_km'], max_receivers=options['max_receivers'],
+                                    dry_run=options['dry_run'])
+            self.stdout.write(
+                f"Matched {stats['assigned']} of {stats['donations']} donations to {stats['receivers']} receivers "
+                f"over {stats['edges']} candidate pairs in {time.perf_counter() - start:.2f}s"
+            )
+            for pickup in stats.get('proposals', []):
+                self.stdout.write(
+                    f"  donation {pickup.donation_id_id} -> receiver {pickup.receiver_id_id} "
+                    f"(score {pickup.priority_score:.3f})"
+                )
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
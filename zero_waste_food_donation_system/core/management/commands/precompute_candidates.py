@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.candidates import precompute_missing
+
+
+class Command(BaseCommand):
+    help = "Compute the candidate receivers of available donations that have none yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Repeat every N seconds instead of running once")
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            stats = precompute_missing(chunk_size=options['chunk_size'])
+            self.stdout.write(
+                f"Stored {stats['candidates']} candidate receivers for {stats['donations']} donations "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Regenerate the daily donation and pickup rollups from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        donations, pickups = rebuild(batch_size=options['batch_size'])
+        self.stdout.write(f"Rebuilt {donations} donation and {pickups} pickup rollup rows "
+                          f"in {time.perf_counter() - start:.2f}s")
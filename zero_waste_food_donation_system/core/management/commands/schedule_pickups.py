@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.slots import schedule_pickups
+
+
+class Command(BaseCommand):
+    help = "Assign pickup time slots to open pickups that do not have one yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Repeat every N seconds instead of running once")
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            scheduled = schedule_pickups()
+            self.stdout.write(f"Scheduled {scheduled} pickups in {time.perf_counter() - start:.2f}s")
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
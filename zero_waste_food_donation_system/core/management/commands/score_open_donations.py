@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.pipeline import score_open_donations
+
+
+class Command(BaseCommand):
+    help = "Precompute expiry risk and priority scores for all available donations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Repeat every N seconds instead of running once")
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            stats = score_open_donations(chunk_size=options['chunk_size'])
+            self.stdout.write(
+                f"Scored {stats['donations']} donations in {time.perf_counter() - start:.2f}s: "
+                f"{stats['created']} created, {stats['updated']} updated, {stats['skipped']} unchanged, "
+                f"{stats['unscorable']} with unknown food types"
+            )
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,182 @@
+"""
+Batch assignment of available donations to receivers.
+
+Runs outside the request cycle (see `manage.py match_donations`). Every
+available donation without an open pickup request is paired with the
+receivers within `radius_km` of its donor (at most the `max_receivers`
+nearest); all candidate pairs are scored by the active priority model in
+one call, and pairs are then taken best score first as long as the
+donation is free and the receiver's remaining capacity covers the
+quantity. Each chosen pair becomes a pending PickupSchedule, so donors
+confirm it in their dashboard as they do for requests made by receivers,
+and gets a pickup slot from core.slots.
+
+Capacity is the receiver's total storage, in the same unit as quantity
+(see receiver_analytics): the quantity of its open pickups may add up to
+at most that much. core.slots then spreads them over pickup slots with a
+separate per-slot limit (settings.PICKUP_SLOT_CAPACITY). This makes
+matching a generalized assignment problem rather than a plain bipartite
+matching; the greedy pass is the usual fast approximation for it. Pruning
+by distance keeps the candidate graph sparse: 10k donations x 1k receivers
+gives at most 200k scored pairs (see scripts/bench_matching.py).
+"""
+import logging
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from ML_Model.ml_model import assemble_features, encode_food_types, is_known_food_type
+from ML_Model.registry import get_active_model
+from .changefeed import record_pickups
+from .events import notify_donor
+from .geo import distance_matrix
+from .models import FoodDonation, PickupSchedule, Receiver
+from .rollups import track_pickups
+from .slots import schedule_pickups
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RADIUS_KM = 15.0
+# Nearest receivers considered per donation; bounds the graph in dense areas
+DEFAULT_MAX_RECEIVERS = 20
+OPEN_PICKUP_STATUSES = ('pending', 'accepted')
+
+
+def candidate_edges(donor_lats, donor_longs, receiver_lats, receiver_longs, radius_km,
+                    max_receivers=DEFAULT_MAX_RECEIVERS, chunk_size=1000):
+    """
+    (donation_index, receiver_index, distance_km) arrays of the pairs within
+    `radius_km`, keeping at most the `max_receivers` nearest receivers per
+    donation. The distance matrix is computed `chunk_size` donations at a
+    time so memory stays bounded.
+    """
+    donation_idx, receiver_idx, distances = [], [], []
+    for start in range(0, len(donor_lats), chunk_size):
+        block = distance_matrix(donor_lats[start:start + chunk_size], donor_longs[start:start + chunk_size],
+                                receiver_lats, receiver_longs)
+        block[block > radius_km] = np.inf
+        if max_receivers < block.shape[1]:
+            nearest = np.argpartition(block, max_receivers - 1, axis=1)[:, :max_receivers]
+            nearest_distances = np.take_along_axis(block, nearest, axis=1)
+            rows, k = np.nonzero(np.isfinite(nearest_distances))
+            cols = nearest[rows, k]
+        else:
+            rows, cols = np.nonzero(np.isfinite(block))
+        donation_idx.append(rows + start)
+        receiver_idx.append(cols)
+        distances.append(block[rows, cols])
+    if not donation_idx:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, np.empty(0)
+    return np.concatenate(donation_idx), np.concatenate(receiver_idx), np.concatenate(distances)
+
+
+def greedy_assign(scores, donation_idx, receiver_idx, quantities, remaining):
+    """
+    Pick edges best score first, each donation at most once and within every
+    receiver's remaining capacity. Returns the indices of the chosen edges;
+    `remaining` is updated in place.
+    """
+    taken = np.zeros(len(quantities), dtype=bool)
+    chosen = []
+    for edge in np.argsort(-scores, kind='stable').tolist():
+        d, r = donation_idx[edge], receiver_idx[edge]
+        if taken[d] or quantities[d] > remaining[r]:
+            continue
+        taken[d] = True
+        remaining[r] -= quantities[d]
+        chosen.append(edge)
+        if len(chosen) == len(quantities):
+            break
+    return chosen
+
+
+def remaining_capacity(receivers):
+    """Capacity minus the quantity of each receiver's open pickups."""
+    committed = dict(
+        PickupSchedule.objects.filter(
+            receiver_id__in=receivers, pickup_status__in=OPEN_PICKUP_STATUSES,
+            donation_id__status__in=('available', 'reserved'),
+        )
+        .values_list('receiver_id')
+        .annotate(total=Sum('donation_id__quantity'))
+    )
+    return np.array([r.capacity - (committed.get(r.receiver_id) or 0) for r in receivers], dtype=np.float64)
+
+
+def match_donations(radius_km=DEFAULT_RADIUS_KM, max_receivers=DEFAULT_MAX_RECEIVERS, now=None, dry_run=False):
+    """One assignment pass; returns counters (and the proposals if dry_run)."""
+    now = now or timezone.now()
+    model = get_active_model()
+    donations = [
+        d for d in FoodDonation.objects.filter(status='available', expiry_time__gt=now)
+        .exclude(Q(pickupschedule__pickup_status__in=OPEN_PICKUP_STATUSES))
+        .select_related('donor_id')
+        if is_known_food_type(d.food_type)
+    ]
+    receivers = list(Receiver.objects.all())
+    stats = {'donations': len(donations), 'receivers': len(receivers), 'edges': 0, 'assigned': 0}
+    if not donations or not receivers:
+        return stats
+
+    remaining = remaining_capacity(receivers)
+    donation_idx, receiver_idx, distances = candidate_edges(
+        np.array([d.donor_id.location_lat for d in donations]),
+        np.array([d.donor_id.location_long for d in donations]),
+        np.array([r.location_lat for r in receivers]),
+        np.array([r.location_long for r in receivers]),
+        radius_km,
+        max_receivers=max_receivers,
+    )
+    stats['edges'] = len(donation_idx)
+    if not len(donation_idx):
+        return stats
+
+    quantities = np.array([d.quantity for d in donations], dtype=np.float64)
+    X = assemble_features(
+        receiver_capacity=np.array([r.capacity for r in receivers], dtype=np.float64)[receiver_idx],
+        receiver_distance=distances,
+        food_type_encoded=np.asarray(encode_food_types([d.food_type for d in donations]))[donation_idx],
+        quantity=quantities[donation_idx],
+        time_to_expiry=np.array([(d.expiry_time - now).total_seconds() / 3600 for d in donations])[donation_idx],
+    )
+    scores = np.asarray(model.predict(X), dtype=np.float64)
+    chosen = greedy_assign(scores, donation_idx, receiver_idx, quantities, remaining)
+
+    proposals = [
+        PickupSchedule(
+            donation_id=donations[donation_idx[edge]],
+            receiver_id=receivers[receiver_idx[edge]],
+            priority_score=float(scores[edge]),
+            model_version=model.tag,
+            scheduled_time=donations[donation_idx[edge]].expiry_time,
+            pickup_status='pending',
+        )
+        for edge in chosen
+    ]
+    stats['assigned'] = len(proposals)
+    if dry_run:
+        stats['proposals'] = proposals
+        return stats
+
+    with transaction.atomic():
+        # Receivers may have requested some of these since we read them
+        requested = set(
+            PickupSchedule.objects.filter(
+                donation_id__in=[p.donation_id_id for p in proposals],
+                pickup_status__in=OPEN_PICKUP_STATUSES,
+            ).values_list('donation_id', flat=True)
+        )
+        proposals = [p for p in proposals if p.donation_id_id not in requested]
+        PickupSchedule.objects.bulk_create(proposals, batch_size=500)
+        record_pickups(proposals, created=True)
+        track_pickups([(p, None) for p in proposals])
+        for pickup in proposals:
+            notify_donor(pickup.donation_id.donor_id_id, pickup.schedule_id, 'pending', pickup.donation_id_id)
+        schedule_pickups(receivers={p.receiver_id for p in proposals}, now=now)
+    stats['assigned'] = len(proposals)
+    logger.debug("Matched %s of %s donations over %s candidate pairs",
+                 stats['assigned'], stats['donations'], stats['edges'])
+    return stats
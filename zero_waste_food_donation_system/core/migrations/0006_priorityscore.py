@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_fooddonation_priority_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriorityScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('model_version', models.CharField(max_length=20)),
+                ('computed_at', models.DateTimeField()),
+                ('donation_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.fooddonation')),
+                ('receiver_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.receiver')),
+            ],
+            options={
+                'unique_together': {('donation_id', 'receiver_id')},
+            },
+        ),
+    ]
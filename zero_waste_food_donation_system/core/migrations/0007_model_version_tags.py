@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_priorityscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pickupschedule',
+            name='model_version',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='mlpredictions',
+            name='model_version',
+            field=models.CharField(default='v1.0', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='priorityscore',
+            name='model_version',
+            field=models.CharField(max_length=50),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_model_version_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlpredictions',
+            name='inputs_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='mlpredictions',
+            name='priority_score',
+            field=models.FloatField(default=0.0),
+        ),
+    ]
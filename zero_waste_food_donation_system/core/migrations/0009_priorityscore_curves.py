@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_mlpredictions_pipeline_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='priorityscore',
+            name='curve_breakpoints',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='priorityscore',
+            name='curve_values',
+            field=models.BinaryField(null=True),
+        ),
+    ]
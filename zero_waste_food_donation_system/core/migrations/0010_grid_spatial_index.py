@@ -0,0 +1,60 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:53
+
+import math
+
+from django.db import migrations, models
+
+# core.spatial.grid_cell() as of this migration; later changes to the grid
+# need a migration of their own.
+GRID_CELL_DEGREES = 0.05
+GRID_ROWS = math.ceil(180 / GRID_CELL_DEGREES)
+GRID_COLS = math.ceil(360 / GRID_CELL_DEGREES)
+
+
+def assign_grid_cells(apps, schema_editor):
+    for model_name in ('Donor', 'Receiver'):
+        model = apps.get_model('core', model_name)
+        rows = list(model.objects.only('pk', 'location_lat', 'location_long'))
+        for row in rows:
+            row.grid_row = min(int((row.location_lat + 90) // GRID_CELL_DEGREES), GRID_ROWS - 1)
+            row.grid_col = int(((row.location_long + 180) % 360) // GRID_CELL_DEGREES) % GRID_COLS
+        model.objects.bulk_update(rows, ['grid_row', 'grid_col'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_priorityscore_curves'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donor',
+            name='grid_col',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='donor',
+            name='grid_row',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='receiver',
+            name='grid_col',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='receiver',
+            name='grid_row',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(assign_grid_cells, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(fields=['grid_row', 'grid_col'], name='core_donor_grid_ro_65e6da_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receiver',
+            index=models.Index(fields=['grid_row', 'grid_col'], name='core_receiv_grid_ro_5ad4a4_idx'),
+        ),
+    ]
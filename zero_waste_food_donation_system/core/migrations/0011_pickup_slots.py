@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_grid_spatial_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pickupschedule',
+            name='slot_assigned_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
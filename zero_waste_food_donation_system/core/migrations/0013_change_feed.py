@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_donation_candidates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('event_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('entity', models.CharField(max_length=20)),
+                ('object_id', models.IntegerField()),
+                ('action', models.CharField(max_length=20)),
+                ('donor_id', models.IntegerField(db_index=True)),
+                ('receiver_id', models.IntegerField(db_index=True, null=True)),
+                ('state', models.JSONField()),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['entity', 'object_id'], name='core_change_entity_067839_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:28
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def fill_rollups(apps, schema_editor):
+    # core.rollups.rebuild() as of this migration
+    FoodDonation = apps.get_model('core', 'FoodDonation')
+    PickupSchedule = apps.get_model('core', 'PickupSchedule')
+    DonationDaily = apps.get_model('core', 'DonationDaily')
+    PickupDaily = apps.get_model('core', 'PickupDaily')
+    tz = timezone.get_default_timezone()
+
+    donation_rows = (
+        FoodDonation.objects.annotate(day=TruncDate('created_at', tzinfo=tz))
+        .values('day', 'donor_id', 'food_type', 'status')
+        .annotate(count=Count('pk'), quantity=Sum('quantity'))
+        .order_by()
+    )
+    DonationDaily.objects.bulk_create([
+        DonationDaily(day=row['day'], donor_id_id=row['donor_id'], food_type=row['food_type'],
+                      status=row['status'], count=row['count'], quantity=row['quantity'] or 0)
+        for row in donation_rows
+    ], batch_size=500)
+
+    pickup_rows = (
+        PickupSchedule.objects.annotate(
+            day=TruncDate('scheduled_time', tzinfo=tz),
+            donor=F('donation_id__donor_id'),
+            food_type=F('donation_id__food_type'),
+        )
+        .values('day', 'receiver_id', 'donor', 'food_type', 'pickup_status')
+        .annotate(count=Count('pk'), quantity=Sum('donation_id__quantity'), priority_total=Sum('priority_score'))
+        .order_by()
+    )
+    PickupDaily.objects.bulk_create([
+        PickupDaily(day=row['day'], receiver_id_id=row['receiver_id'], donor_id_id=row['donor'],
+                    food_type=row['food_type'], pickup_status=row['pickup_status'], count=row['count'],
+                    quantity=row['quantity'] or 0, priority_total=row['priority_total'] or 0.0)
+        for row in pickup_rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PickupDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('food_type', models.CharField(max_length=50)),
+                ('pickup_status', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('priority_total', models.FloatField(default=0.0)),
+                ('donor_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.donor')),
+                ('receiver_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.receiver')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='core_pickup_day_420612_idx')],
+                'unique_together': {('day', 'receiver_id', 'donor_id', 'food_type', 'pickup_status')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DonationDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('food_type', models.CharField(max_length=50)),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('donor_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.donor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='core_donati_day_464d2a_idx')],
+                'unique_together': {('day', 'donor_id', 'food_type', 'status')},
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
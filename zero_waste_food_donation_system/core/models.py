@@ -1,10 +1,42 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.hashers import make_password
-from math import radians, sin, cos, sqrt, atan2
-from ML_Model.ml_model import priority_model, food_type_encoder, scaler
-import pandas as pd
 
-class Donor(models.Model):
+from . import geo
+from .geo import haversine_km
+from .spatial import assign_grid_cell
+
+
+class TrackedFieldsMixin:
+    """
+    Remember the values of `tracked_fields` as loaded from the database so
+    save() can tell which of them were changed.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def _snapshot_tracked_fields(self):
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            f: getattr(self, f) for f in self.tracked_fields if f not in deferred
+        }
+
+    def changed_tracked_fields(self):
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:  # Not loaded from the database
+            return set()
+        return {f for f, value in loaded.items() if getattr(self, f) != value}
+
+    def loaded_values(self, fields):
+        """{field: value as loaded from the database} of `fields`."""
+        return {f: self._loaded_values[f] for f in fields}
+
+
+class Donor(TrackedFieldsMixin, models.Model):
     donor_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100, unique=True)  # Add unique constraint
     contact = models.CharField(max_length=100)  # Single contact per PDF
@@ -12,20 +44,34 @@ class Donor(models.Model):
     location_long = models.FloatField()  # GPS longitude
     password = models.CharField(max_length=128)  # Hashed password
     created_at = models.DateTimeField(auto_now_add=True)
+    # Spatial index cell of the location, see core.spatial; set by save()
+    grid_row = models.IntegerField(default=0, editable=False)
+    grid_col = models.IntegerField(default=0, editable=False)
+
+    # Inputs of the priority model; changing them invalidates stored scores
+    tracked_fields = ('location_lat', 'location_long')
 
     def save(self, *args, **kwargs):
         if self.password and not self.password.startswith(('pbkdf2_sha256$', 'bcrypt$', 'argon2')):
             self.password = make_password(self.password)
+        changed = self.changed_tracked_fields()
+        assign_grid_cell(self)
         super().save(*args, **kwargs)
+        if changed:
+            from .candidates import invalidate_candidates
+
+            PriorityScore.objects.filter(donation_id__donor_id=self).delete()
+            invalidate_candidates(
+                FoodDonation.objects.filter(donor_id=self, status='available').values_list('pk', flat=True)
+            )
+            geo.invalidate_donor(self.donor_id)
+        self._snapshot_tracked_fields()
+
+    class Meta:
+        indexes = [models.Index(fields=['grid_row', 'grid_col'])]
 
     def calculate_distance(self, other_lat, other_long):
-        R = 6371.0  # Earth radius in km
-        lat1, lon1 = radians(self.location_lat), radians(self.location_long)
-        lat2, lon2 = radians(other_lat), radians(other_long)
-        dlat, dlon = lat2 - lat1, lon2 - lon1
-        a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        return R * c
+        return haversine_km(self.location_lat, self.location_long, other_lat, other_long)
     
 class DonorAddress(models.Model):
     donor_id = models.ForeignKey(Donor, on_delete=models.CASCADE)
@@ -34,7 +80,7 @@ class DonorAddress(models.Model):
     class Meta:
         unique_together = ('donor_id', 'address')  # Prevent duplicates
 
-class Receiver(models.Model):
+class Receiver(TrackedFieldsMixin, models.Model):
     receiver_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100)
     contact = models.CharField(max_length=100)  # Single contact per PDF
@@ -43,20 +89,36 @@ class Receiver(models.Model):
     location_long = models.FloatField()  # GPS longitude
     password = models.CharField(max_length=128)  # Hashed password
     created_at = models.DateTimeField(auto_now_add=True)
+    # Spatial index cell of the location, see core.spatial; set by save()
+    grid_row = models.IntegerField(default=0, editable=False)
+    grid_col = models.IntegerField(default=0, editable=False)
+
+    # Inputs of the priority model; changing them invalidates stored scores
+    tracked_fields = ('capacity', 'location_lat', 'location_long')
 
     def save(self, *args, **kwargs):
         if self.password and not self.password.startswith(('pbkdf2_sha256$', 'bcrypt$', 'argon2')):
             self.password = make_password(self.password)
+        adding = self._state.adding
+        changed = self.changed_tracked_fields()
+        assign_grid_cell(self)
         super().save(*args, **kwargs)
+        if adding or changed:
+            from .candidates import invalidate_candidates, receiver_donations
+
+            # A new receiver may belong among the candidates of donations nearby
+            invalidate_candidates(receiver_donations(self))
+        if changed:
+            PriorityScore.objects.filter(receiver_id=self).delete()
+            if changed != {'capacity'}:
+                geo.invalidate_receiver(self.receiver_id)
+        self._snapshot_tracked_fields()
+
+    class Meta:
+        indexes = [models.Index(fields=['grid_row', 'grid_col'])]
 
     def calculate_distance(self, other_lat, other_long):
-        R = 6371.0  # Earth radius in km
-        lat1, lon1 = radians(self.location_lat), radians(self.location_long)
-        lat2, lon2 = radians(other_lat), radians(other_long)
-        dlat, dlon = lat2 - lat1, lon2 - lon1
-        a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        return R * c
+        return haversine_km(self.location_lat, self.location_long, other_lat, other_long)
 
 class ReceiverAddress(models.Model):
     receiver_id = models.ForeignKey(Receiver, on_delete=models.CASCADE)
@@ -65,7 +127,7 @@ class ReceiverAddress(models.Model):
     class Meta:
         unique_together = ('receiver_id', 'address')  # Prevent duplicates
 
-class FoodDonation(models.Model):
+class FoodDonation(TrackedFieldsMixin, models.Model):
     donation_id = models.AutoField(primary_key=True)
     donor_id = models.ForeignKey(Donor, on_delete=models.CASCADE)
     food_type = models.CharField(max_length=50)
@@ -79,56 +141,212 @@ class FoodDonation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     priority_score = models.FloatField(default=0.0)  # Add this field
 
-    def calculate_priority_ml(self, receiver_capacity, receiver_lat, receiver_long):
-        from django.utils import timezone
+    # Inputs of the priority model; changing them invalidates stored scores.
+    # expiry_time only invalidates point scores: curves cover time to expiry.
+    model_inputs = ('donor_id_id', 'food_type', 'quantity')
+    # Status changes go to the change feed; all of them to the daily rollups
+    rollup_fields = model_inputs + ('status',)
+    tracked_fields = rollup_fields + ('expiry_time',)
 
-    # Prepare feature vector
-        distance = self.donor_id.calculate_distance(receiver_lat, receiver_long)
-        food_type_encoded = food_type_encoder.transform([self.food_type])[0]
+    def save(self, *args, **kwargs):
+        from .candidates import invalidate_candidates
+        from .changefeed import record_donations
+        from .rollups import track_donations, track_pickups
 
-        X = pd.DataFrame([{
-        "receiver_capacity": receiver_capacity,
-        "receiver_distance": distance,
-        "food_type_encoded": food_type_encoded,
-        "quantity": self.quantity,
-        "time_to_expiry": (self.expiry_time - timezone.now()).total_seconds() / 3600
-        }])
+        adding = self._state.adding
+        changed = self.changed_tracked_fields()
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if changed.intersection(self.model_inputs):
+                PriorityScore.objects.filter(donation_id=self).delete()
+            elif 'expiry_time' in changed:
+                PriorityScore.objects.filter(donation_id=self, curve_values__isnull=True).delete()
+            if changed.intersection(self.model_inputs + ('expiry_time',)):
+                invalidate_candidates([self.donation_id])
+            if adding or 'status' in changed:
+                record_donations([self], created=adding)
+            if adding or changed.intersection(self.rollup_fields):
+                track_donations([(self, None if adding else self.loaded_values(changed))])
+            if changed.intersection(self.model_inputs):
+                # Pickups are rolled up with their donation's food type and quantity
+                previous = self.loaded_values(changed)
+                track_pickups([(pickup, previous) for pickup in self.pickupschedule_set.all()])
+        self._snapshot_tracked_fields()
 
-        self.priority_score = float(priority_model.predict(X)[0])
+    def calculate_priority_ml(self, receiver_capacity, receiver_lat, receiver_long):
+        # Single-row case of the batch scorer in core.scoring
+        from .scoring import build_feature_matrix, predict_priority
+
+        X = build_feature_matrix([self], receiver_capacity, receiver_lat, receiver_long)
+        self.priority_score = float(predict_priority(X)[0])
         self.save()
         return self.priority_score
 
 
 
-class PickupSchedule(models.Model):
+class PickupSchedule(TrackedFieldsMixin, models.Model):
     schedule_id = models.AutoField(primary_key=True)
     donation_id = models.ForeignKey(FoodDonation, on_delete=models.CASCADE)  # 1:M with FoodDonations
     receiver_id = models.ForeignKey(Receiver, on_delete=models.CASCADE)  # 1:M with Receivers
     priority_score = models.FloatField(default=0.0)  # Conditional logic
     scheduled_time = models.DateTimeField()
     pickup_status = models.CharField(max_length=20, default='pending')
+    model_version = models.CharField(max_length=50, blank=True)  # Model that produced priority_score
+    slot_assigned_at = models.DateTimeField(null=True, blank=True)  # Set once scheduled_time is a slot, see core.slots
 
+    # Status and time changes go to the change feed; all of them to the daily rollups
+    feed_fields = ('pickup_status', 'scheduled_time')
+    tracked_fields = feed_fields + ('priority_score',)
+
+    def save(self, *args, **kwargs):
+        from .changefeed import record_pickups
+        from .rollups import track_pickups
+
+        adding = self._state.adding
+        changed = self.changed_tracked_fields()
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if adding or changed.intersection(self.feed_fields):
+                record_pickups([self], created=adding)
+            if adding or changed:
+                track_pickups([(self, None if adding else self.loaded_values(changed))])
+        self._snapshot_tracked_fields()
 
     def calculate_priority(self, current_time):
         from datetime import timedelta
         time_to_expiry = (self.donation_id.expiry_time - current_time).total_seconds() / 3600
-        distance = self.receiver_id.calculate_distance(self.donation_id.donor_id.location_lat, self.donation_id.donor_id.location_long)
+        distance = geo.pair_distance(self.donation_id.donor_id, self.receiver_id)
         return (1 - min(time_to_expiry / 24, 1)) * (1 / max(distance, 1))  # Example conditional logic
 
+class PriorityScore(models.Model):
+    """
+    ML priority of a donation for one receiver. The score depends on the
+    receiver (capacity, distance), so it is stored per pair instead of on
+    FoodDonation. Rows are deleted when one of the model inputs changes.
+    Point scores (curve_values is NULL) also depend on the time to expiry:
+    they are deleted when expiry_time changes and recomputed once they are
+    older than settings.POINT_SCORE_TIMEOUT.
+
+    For tree models the row also holds the score as a step function of
+    time_to_expiry (see ML_Model.tree_compiler.PriorityCurve), so the
+    current score is a lookup however much time has passed; `score` is the
+    value at `computed_at`.
+    """
+    donation_id = models.ForeignKey(FoodDonation, on_delete=models.CASCADE)
+    receiver_id = models.ForeignKey(Receiver, on_delete=models.CASCADE)
+    score = models.FloatField()
+    model_version = models.CharField(max_length=50)  # Registry tag, "name:version"
+    computed_at = models.DateTimeField()
+    curve_breakpoints = models.BinaryField(null=True)  # float64 hours to expiry
+    curve_values = models.BinaryField(null=True)  # float64, one more than breakpoints
+
+    class Meta:
+        unique_together = ('donation_id', 'receiver_id')
+
+class DonationCandidate(models.Model):
+    """
+    One of the best receivers for a donation, computed when the donation is
+    posted (see core.candidates). Receivers' "new for you" list reads these
+    rows instead of scoring donations on the request path.
+    """
+    donation_id = models.ForeignKey(FoodDonation, on_delete=models.CASCADE)
+    receiver_id = models.ForeignKey(Receiver, on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()  # 1 is the best receiver for the donation
+    score = models.FloatField()
+    distance_km = models.FloatField()
+    model_version = models.CharField(max_length=50)  # Registry tag, "name:version"
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('donation_id', 'receiver_id')
+
 class MLPredictions(models.Model):
     prediction_id = models.AutoField(primary_key=True)
     donation_id = models.ForeignKey(FoodDonation, on_delete=models.CASCADE)  # 1:1 with FoodDonations
     expiry_risk = models.FloatField(default=0.0)  # Conditional logic
     suggested_pickup_time = models.DateTimeField(null=True, blank=True)
-    model_version = models.CharField(max_length=20, default='v1.0')
+    model_version = models.CharField(max_length=50, default='v1.0')
     predicted_at = models.DateTimeField(auto_now_add=True)
     predicted_for = models.CharField(max_length=50, null=True, blank=True)
+    priority_score = models.FloatField(default=0.0)  # Best score over all receivers
+    inputs_hash = models.CharField(max_length=64, blank=True)  # Fingerprint of the inputs used
 
     def calculate_expiry_risk(self, current_time):
-        from datetime import timedelta
-        time_left = (self.donation_id.expiry_time - current_time).total_seconds() / 3600
+        return self.expiry_risk_for(self.donation_id.expiry_time, current_time)
+
+    @staticmethod
+    def expiry_risk_for(expiry_time, current_time):
+        time_left = (expiry_time - current_time).total_seconds() / 3600
         if time_left < 2:
             return 0.9
         elif time_left < 6:
             return 0.5
-        return 0.1
\ No newline at end of file
+        return 0.1
+
+
+class ChangeEvent(models.Model):
+    """
+    Append-only record of a donation or pickup being created or changing
+    status, with the row's state at that point (see core.changefeed).
+    event_id is the cursor of the change feed.
+    """
+    event_id = models.BigAutoField(primary_key=True)
+    entity = models.CharField(max_length=20)  # 'donation' or 'pickup'
+    object_id = models.IntegerField()
+    action = models.CharField(max_length=20)  # 'created' or 'updated'
+    donor_id = models.IntegerField(db_index=True)  # Whose feeds include it
+    receiver_id = models.IntegerField(null=True, db_index=True)
+    state = models.JSONField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['entity', 'object_id'])]
+
+
+class DonationDaily(models.Model):
+    """
+    Number and quantity of the donations created on `day` by one donor, of
+    one food type, currently in one status (see core.rollups).
+    """
+    day = models.DateField()  # created_at in TIME_ZONE
+    donor_id = models.ForeignKey(Donor, on_delete=models.CASCADE)
+    food_type = models.CharField(max_length=50)
+    status = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+    quantity = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('day', 'donor_id', 'food_type', 'status')
+        indexes = [models.Index(fields=['day'])]
+
+
+class PickupDaily(models.Model):
+    """
+    Number of the pickups scheduled on `day` by one receiver, of one
+    donor's donations of one food type, currently in one status, with the
+    donations' quantity and the sum of the priority scores (see
+    core.rollups).
+    """
+    day = models.DateField()  # scheduled_time in TIME_ZONE
+    receiver_id = models.ForeignKey(Receiver, on_delete=models.CASCADE)
+    donor_id = models.ForeignKey(Donor, on_delete=models.CASCADE)
+    food_type = models.CharField(max_length=50)
+    pickup_status = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+    quantity = models.BigIntegerField(default=0)
+    priority_total = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = ('day', 'receiver_id', 'donor_id', 'food_type', 'pickup_status')
+        indexes = [models.Index(fields=['day'])]
+
+
+class DataVersion(models.Model):
+    """
+    Current version of some data, e.g. everything behind one donor's charts
+    ("donor:3"), see core.caching. Bumped in the transaction that changes
+    the data, so every process sees the new token once it commits.
+    """
+    scope = models.CharField(max_length=100, unique=True)
+    token = models.CharField(max_length=32)
+    issued_at = models.DateTimeField()
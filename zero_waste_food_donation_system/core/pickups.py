@@ -0,0 +1,91 @@
+"""
+Donor decisions on pickup requests.
+
+A donation ends up with at most one accepted pickup however many accepts
+and new requests for it race. accept_pickup() runs in one transaction that
+locks the donation row (select_for_update) and changes state only through
+conditional UPDATEs: the donation goes from available to reserved only if
+it is still available, so of two concurrent accepts exactly one matches
+and the other changes nothing. The remaining pending requests are then
+rejected with a single UPDATE rather than one save() each. Receivers'
+new requests take the same lock (see receivers.views.schedule_pickup), so
+none is left pending on a donation that has just been reserved. Every
+receiver whose request was decided is notified (core.events), and the
+changes are recorded in the change feed (core.changefeed) and the daily
+rollups (core.rollups).
+
+SQLite has no row locks and ignores select_for_update; there the database
+write lock serializes the transactions, and the same conditional UPDATE
+keeps the loser from reserving the donation.
+"""
+from django.db import connection, transaction
+from django.db.models import F
+
+from .changefeed import record_donations, record_pickups
+from .events import notify_receiver
+from .models import FoodDonation, PickupSchedule
+from .rollups import track_donations, track_pickups
+
+
+def lock_donation(donation_id):
+    """Lock the donation row until the end of the current transaction."""
+    if connection.features.has_select_for_update:
+        FoodDonation.objects.select_for_update().get(donation_id=donation_id)
+    else:
+        # Reading first would make concurrent transactions fail to upgrade to
+        # a write lock ("database is locked"); writing first makes them wait
+        FoodDonation.objects.filter(donation_id=donation_id).update(status=F('status'))
+
+
+def accept_pickup(pickup):
+    """
+    Accept `pickup`, reserve its donation for the receiver and reject the
+    other pending requests. Returns False, changing nothing, if the donation
+    is no longer available or the pickup no longer pending.
+    """
+    with transaction.atomic():
+        lock_donation(pickup.donation_id_id)
+        reserved = FoodDonation.objects.filter(
+            donation_id=pickup.donation_id_id, status='available',
+        ).update(status='reserved', assigned_receiver=pickup.receiver_id_id)
+        if not reserved:
+            return False
+        accepted = PickupSchedule.objects.filter(
+            schedule_id=pickup.schedule_id, pickup_status='pending',
+        ).update(pickup_status='accepted')
+        if not accepted:
+            transaction.set_rollback(True)
+            return False
+        others = PickupSchedule.objects.filter(donation_id=pickup.donation_id_id, pickup_status='pending')
+        rejected = list(others.values_list('schedule_id', 'receiver_id'))
+        others.update(pickup_status='rejected')
+
+        # The UPDATEs bypass save(), which would have recorded these
+        decided = list(
+            PickupSchedule.objects.filter(schedule_id__in=[pickup.schedule_id] + [s for s, _ in rejected])
+            .select_related('donation_id')
+            .order_by('schedule_id')
+        )
+        record_donations([decided[0].donation_id])
+        record_pickups(decided)
+        track_donations([(decided[0].donation_id, {'status': 'available'})])
+        track_pickups([(p, {'pickup_status': 'pending'}) for p in decided])
+
+        notify_receiver(pickup.receiver_id_id, pickup.schedule_id, 'accepted', pickup.donation_id_id)
+        for schedule_id, receiver_id in rejected:
+            notify_receiver(receiver_id, schedule_id, 'rejected', pickup.donation_id_id)
+    return True
+
+
+def reject_pickup(pickup):
+    """Reject `pickup` if it is still pending; returns whether it was."""
+    with transaction.atomic():
+        rejected = PickupSchedule.objects.filter(
+            schedule_id=pickup.schedule_id, pickup_status='pending',
+        ).update(pickup_status='rejected')
+        if rejected:
+            decided = list(PickupSchedule.objects.filter(schedule_id=pickup.schedule_id).select_related('donation_id'))
+            record_pickups(decided)
+            track_pickups([(p, {'pickup_status': 'pending'}) for p in decided])
+            notify_receiver(pickup.receiver_id_id, pickup.schedule_id, 'rejected', pickup.donation_id_id)
+    return bool(rejected)
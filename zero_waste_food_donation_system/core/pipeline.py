@@ -0,0 +1,135 @@
+"""
+Offline scoring of open donations.
+
+Runs outside the request cycle (see `manage.py score_open_donations`): walks
+the available donations in primary-key chunks and keeps one MLPredictions
+row per donation with its expiry risk, best score and best receiver.
+
+A donation is only scored again when its fingerprint (inputs_hash: the
+model, the donation and donor inputs, and receivers_key() of the receiver
+set, i.e. every receiver's id, capacity and location) or its expiry risk
+bucket changed since the last run; the others are skipped before any
+scoring. The rest of a chunk is scored against every receiver in one model
+call, without going through the per-receiver PriorityScore store, so
+priority_score is the best score as of predicted_at.
+Donations with a food type the model was not trained on are skipped.
+"""
+import hashlib
+import logging
+
+import numpy as np
+from django.utils import timezone
+
+from ML_Model.ml_model import is_known_food_type
+from ML_Model.registry import get_active_model
+from .models import FoodDonation, MLPredictions, Receiver
+from .scoring import build_feature_matrix, predict_priority
+
+logger = logging.getLogger(__name__)
+
+
+def receivers_key(receivers):
+    """Fingerprint of the receivers' side of the model inputs."""
+    key = "|".join(
+        f"{r.receiver_id}:{r.capacity}:{r.location_lat}:{r.location_long}"
+        for r in sorted(receivers, key=lambda r: r.receiver_id)
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def inputs_hash(donation, model, receivers_fingerprint):
+    """Fingerprint of everything the stored prediction was computed from."""
+    donor = donation.donor_id
+    key = "|".join(str(v) for v in (
+        model.tag, donation.food_type, donation.quantity, donation.expiry_time.isoformat(),
+        donor.location_lat, donor.location_long, receivers_fingerprint,
+    ))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def best_receivers(donations, receivers, model, now):
+    """[(receiver_id, score)] of the best receiver of each donation, from one model call."""
+    if not donations or not receivers:
+        return [(None, 0.0)] * len(donations)
+    X = np.vstack([
+        build_feature_matrix(donations, r.capacity, r.location_lat, r.location_long, now=now)
+        for r in receivers
+    ])
+    scores = predict_priority(X, model=model).reshape(len(receivers), len(donations))
+    best = scores.argmax(axis=0)  # The first receiver on ties
+    return [(receivers[i].receiver_id, float(scores[i, j])) for j, i in enumerate(best)]
+
+
+def score_chunk(donations, receivers, model, now, receivers_fingerprint=None):
+    """Score one chunk of donations; returns (created, updated, skipped)."""
+    if receivers_fingerprint is None:
+        receivers_fingerprint = receivers_key(receivers)
+    existing = {
+        p.donation_id_id: p
+        for p in MLPredictions.objects.filter(donation_id__in=donations)
+    }
+
+    pending, skipped = [], 0
+    for donation in donations:
+        fingerprint = inputs_hash(donation, model, receivers_fingerprint)
+        risk = MLPredictions.expiry_risk_for(donation.expiry_time, now)
+        prediction = existing.get(donation.donation_id)
+        if prediction is not None and prediction.inputs_hash == fingerprint and prediction.expiry_risk == risk:
+            skipped += 1
+            continue
+        pending.append((donation, prediction, fingerprint, risk))
+
+    to_create, to_update = [], []
+    best = best_receivers([donation for donation, *_ in pending], receivers, model, now)
+    for (donation, prediction, fingerprint, risk), (receiver_id, score) in zip(pending, best):
+        if prediction is None:
+            prediction = MLPredictions(donation_id=donation)
+            to_create.append(prediction)
+        else:
+            to_update.append(prediction)
+        prediction.expiry_risk = risk
+        prediction.priority_score = score
+        prediction.predicted_for = str(receiver_id) if receiver_id is not None else None
+        prediction.model_version = model.tag
+        prediction.inputs_hash = fingerprint
+        prediction.predicted_at = now
+
+    MLPredictions.objects.bulk_create(to_create)
+    MLPredictions.objects.bulk_update(
+        to_update,
+        ['expiry_risk', 'priority_score', 'predicted_for', 'model_version', 'inputs_hash', 'predicted_at'],
+    )
+    return len(to_create), len(to_update), skipped
+
+
+def score_open_donations(chunk_size=500, now=None):
+    """One full pass over the available donations; returns counters."""
+    now = now or timezone.now()
+    model = get_active_model()
+    receivers = list(Receiver.objects.order_by('receiver_id'))
+    fingerprint = receivers_key(receivers)
+    stats = {'donations': 0, 'created': 0, 'updated': 0, 'skipped': 0, 'unscorable': 0}
+
+    last_id = 0
+    while True:
+        donations = list(
+            FoodDonation.objects.filter(status='available', donation_id__gt=last_id)
+            .select_related('donor_id')
+            .order_by('donation_id')[:chunk_size]
+        )
+        if not donations:
+            break
+        last_id = donations[-1].donation_id
+        stats['donations'] += len(donations)
+
+        scorable = [d for d in donations if is_known_food_type(d.food_type)]
+        stats['unscorable'] += len(donations) - len(scorable)
+        if not scorable:
+            continue
+        created, updated, skipped = score_chunk(scorable, receivers, model, now, fingerprint)
+        stats['created'] += created
+        stats['updated'] += updated
+        stats['skipped'] += skipped
+        logger.debug("Scored donations up to %s: %s created, %s updated, %s skipped",
+                     last_id, created, updated, skipped)
+    return stats
@@ -0,0 +1,209 @@
+"""
+Daily rollups of donations and pickups for the analytics pages.
+
+DonationDaily and PickupDaily hold counts and quantities per day, donor or
+receiver, food type and status, so the analytics pages add up a few rows
+per day instead of every donation and pickup ever made. They are kept
+current incrementally, in the same transaction as the change: a donation
+or pickup that is created adds 1 to the row of its key, and one whose key
+changes (status, or the day a pickup is scheduled for) moves from the row
+of its old key to the row of its new one. FoodDonation.save() and
+PickupSchedule.save() do this themselves; code that writes with
+QuerySet.update(), bulk_create() or bulk_update() calls track_donations() /
+track_pickups() (see core.pickups, core.matching and core.slots).
+
+Pickups count with the food type and quantity of their donation, so
+FoodDonation.save() also moves the pickups of a donation whose food type
+or quantity changes. Deleted donations and pickups are taken off their
+rows by a pre_delete handler (untrack_deleted), which also covers
+QuerySet.delete() and cascades; when the donor or receiver itself is
+deleted its rows go with it, and the handler only bumps the data
+versions of the others that shared them. Days are dates in TIME_ZONE.
+`manage.py rebuild_rollups` regenerates both tables from scratch, e.g.
+after a data fix that bypassed the hooks.
+
+Every change also bumps the data version (core.caching) of the donors
+and receivers whose rows it touched (a pickup row belongs to both), and
+a rebuild bumps the "rollups" version that every chart depends on, which
+invalidates the cached chart data (see core.analytics.chart_data_view).
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, QuerySet, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .caching import bump_versions
+from .models import DonationDaily, Donor, FoodDonation, PickupDaily, PickupSchedule, Receiver
+
+logger = logging.getLogger(__name__)
+
+DONATION_KEY = ('day', 'donor_id_id', 'food_type', 'status')
+DONATION_VALUES = ('count', 'quantity')
+PICKUP_KEY = ('day', 'receiver_id_id', 'donor_id_id', 'food_type', 'pickup_status')
+PICKUP_VALUES = ('count', 'quantity', 'priority_total')
+
+
+def rollup_day(moment):
+    return timezone.localtime(moment, timezone.get_default_timezone()).date()
+
+
+def _donation_row(donation, previous):
+    value = lambda field: previous.get(field, getattr(donation, field))
+    key = (rollup_day(donation.created_at), value('donor_id_id'), value('food_type'), value('status'))
+    return key, (1, value('quantity'))
+
+
+def _pickup_row(pickup, previous):
+    # previous may also hold the donation's donor_id_id, food_type and quantity
+    donation = pickup.donation_id
+    value = lambda field: previous.get(field, getattr(pickup, field))
+    donation_value = lambda field: previous.get(field, getattr(donation, field))
+    key = (rollup_day(value('scheduled_time')), pickup.receiver_id_id, donation_value('donor_id_id'),
+           donation_value('food_type'), value('pickup_status'))
+    return key, (1, donation_value('quantity'), value('priority_score'))
+
+
+def _deltas(row, changes, removed):
+    deltas = defaultdict(lambda: None)
+    parts = []
+    for obj, previous in changes:
+        parts.append((1, row(obj, {})))
+        if previous is not None:
+            parts.append((-1, row(obj, previous)))
+    for obj, loaded in removed:
+        parts.append((-1, row(obj, loaded)))
+    for sign, (key, values) in parts:
+        current = deltas[key] or (0,) * len(values)
+        deltas[key] = tuple(c + sign * v for c, v in zip(current, values))
+    return {key: values for key, values in deltas.items() if any(values)}
+
+
+def _apply(model, key_fields, value_fields, deltas, chunk_size=100):
+    """
+    Add `deltas` ({key: values}) to the rows of `model`, in three queries
+    per `chunk_size` keys however many there are: create the missing rows,
+    read their ids, and add to all of them in one UPDATE. The increments are
+    relative, so concurrent transactions add up.
+    """
+    keys = list(deltas)
+    for i in range(0, len(keys), chunk_size):
+        chunk = keys[i:i + chunk_size]
+        lookups = [dict(zip(key_fields, key)) for key in chunk]
+        model.objects.bulk_create([model(**lookup) for lookup in lookups], ignore_conflicts=True)
+        matching = Q()
+        for lookup in lookups:
+            matching |= Q(**lookup)
+        ids = {tuple(row[1:]): row[0] for row in model.objects.filter(matching).values_list('pk', *key_fields)}
+        model.objects.filter(pk__in=[ids[key] for key in chunk]).update(**{
+            field: F(field) + Case(
+                *[When(pk=ids[key], then=Value(deltas[key][position])) for key in chunk],
+                default=Value(0),
+                output_field=model._meta.get_field(field),
+            )
+            for position, field in enumerate(value_fields)
+        })
+
+
+def track_donations(changes, removed=()):
+    """
+    Apply `changes`, (donation, previous) pairs, to DonationDaily. previous
+    is None for a new donation, else {attname: value before the change} of
+    the fields that changed. `removed` holds (donation, loaded values)
+    pairs of deleted donations.
+    """
+    deltas = _deltas(_donation_row, changes, removed)
+    _apply(DonationDaily, DONATION_KEY, DONATION_VALUES, deltas)
+    bump_versions(_donation_scopes(deltas))
+
+
+def track_pickups(changes, removed=()):
+    """Same as track_donations() for PickupDaily; the pickups' donation_id must be loaded."""
+    deltas = _deltas(_pickup_row, changes, removed)
+    _apply(PickupDaily, PICKUP_KEY, PICKUP_VALUES, deltas)
+    bump_versions(_pickup_scopes(deltas))
+
+
+def _donation_scopes(keys):
+    return {f'donor:{key[1]}' for key in keys}
+
+
+def _pickup_scopes(keys):
+    # Both the receiver's and the donor's charts read PickupDaily
+    return {f'receiver:{key[1]}' for key in keys} | {f'donor:{key[2]}' for key in keys}
+
+
+def untrack_deleted(sender, instance, origin=None, **kwargs):
+    """
+    pre_delete handler of FoodDonation and PickupSchedule. Runs in the
+    deletion's transaction, before the rows are gone, with the values they
+    were loaded with.
+    """
+    loaded = getattr(instance, '_loaded_values', {})
+    if sender is FoodDonation:
+        row, scopes, track = _donation_row, _donation_scopes, track_donations
+    else:
+        loaded = {**getattr(instance.donation_id, '_loaded_values', {}), **loaded}
+        row, scopes, track = _pickup_row, _pickup_scopes, track_pickups
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if issubclass(origin_model, (Donor, Receiver)):
+        # Its rollup rows are deleted with it, but the other party's charts
+        # read them too
+        key, _ = row(instance, loaded)
+        bump_versions(scopes([key]))
+    else:
+        track([], removed=[(instance, loaded)])
+
+
+def rebuild(batch_size=5000):
+    """
+    Regenerate both tables from the donations and pickups in one
+    transaction; returns the number of (DonationDaily, PickupDaily) rows.
+    """
+    tz = timezone.get_default_timezone()
+    donation_rows = (
+        FoodDonation.objects.annotate(day=TruncDate('created_at', tzinfo=tz))
+        .values('day', 'donor_id', 'food_type', 'status')
+        .annotate(count=Count('pk'), quantity=Sum('quantity'))
+        .order_by()
+    )
+    pickup_rows = (
+        PickupSchedule.objects.annotate(
+            day=TruncDate('scheduled_time', tzinfo=tz),
+            donor=F('donation_id__donor_id'),
+            food_type=F('donation_id__food_type'),
+        )
+        .values('day', 'receiver_id', 'donor', 'food_type', 'pickup_status')
+        .annotate(count=Count('pk'), quantity=Sum('donation_id__quantity'), priority_total=Sum('priority_score'))
+        .order_by()
+    )
+    with transaction.atomic():
+        DonationDaily.objects.all().delete()
+        PickupDaily.objects.all().delete()
+        donations = _insert(DonationDaily, (
+            DonationDaily(day=row['day'], donor_id_id=row['donor_id'], food_type=row['food_type'],
+                          status=row['status'], count=row['count'], quantity=row['quantity'] or 0)
+            for row in donation_rows.iterator(chunk_size=batch_size)
+        ), batch_size)
+        pickups = _insert(PickupDaily, (
+            PickupDaily(day=row['day'], receiver_id_id=row['receiver_id'], donor_id_id=row['donor'],
+                        food_type=row['food_type'], pickup_status=row['pickup_status'], count=row['count'],
+                        quantity=row['quantity'] or 0, priority_total=row['priority_total'] or 0.0)
+            for row in pickup_rows.iterator(chunk_size=batch_size)
+        ), batch_size)
+        bump_versions(['rollups'])
+    logger.debug("Rebuilt %s donation and %s pickup rollup rows", donations, pickups)
+    return donations, pickups
+
+
+def _insert(model, rows, batch_size):
+    inserted, batch = 0, []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            model.objects.bulk_create(batch)
+            inserted, batch = inserted + len(batch), []
+    model.objects.bulk_create(batch)
+    return inserted + len(batch)
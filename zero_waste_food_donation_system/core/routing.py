@@ -0,0 +1,169 @@
+"""
+Pickup route planning for receivers.
+
+A receiver's accepted pickups are visited in one round trip from the
+receiver's location. Each donor has to be reached before the donation's
+expiry_time; travel time is distance / AVERAGE_SPEED_KMH and every stop
+takes SERVICE_MINUTES. plan_route() builds the order with nearest
+insertion (each stop goes where it adds the least distance without making
+any stop late) and then improves it with 2-opt moves that keep every
+deadline. Stops that cannot be reached in time anywhere are still placed,
+at the position that adds the least lateness, and reported as late.
+
+Both phases score all candidate positions or moves at once with NumPy, so
+a 50-stop route is solved well within 100 ms (scripts/bench_route.py).
+
+receiver_route() caches the order per receiver until the set of accepted
+pickups (or a location or deadline in it) changes; arrival times are
+recomputed from the current time on every call.
+"""
+import hashlib
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from .geo import distance_matrix
+from .models import PickupSchedule
+
+AVERAGE_SPEED_KMH = 25.0
+SERVICE_MINUTES = 10.0
+CACHE_TIMEOUT = 24 * 3600
+
+# Tolerance when comparing route lengths and lateness
+_EPS = 1e-9
+
+
+def _schedule(route, dist, deadlines, speed_kmh, service_hours):
+    """Arrival times (hours) at route[1:-1] and the total lateness."""
+    legs = dist[route[:-1], route[1:]] / speed_kmh
+    arrivals = np.cumsum(legs[:-1]) + service_hours * np.arange(len(legs) - 1)
+    lateness = np.maximum(arrivals - deadlines[route[1:-1]], 0.0).sum()
+    return arrivals, lateness
+
+
+def _length(route, dist):
+    return dist[route[:-1], route[1:]].sum()
+
+
+def _insert(route, stop, dist, deadlines, speed_kmh, service_hours):
+    """Insert `stop` where it adds the least distance without new lateness."""
+    before = _schedule(route, dist, deadlines, speed_kmh, service_hours)[1]
+    added = dist[route[:-1], stop] + dist[stop, route[1:]] - dist[route[:-1], route[1:]]
+    best, best_lateness = None, np.inf
+    for position in np.argsort(added, kind='stable') + 1:
+        candidate = np.insert(route, position, stop)
+        lateness = _schedule(candidate, dist, deadlines, speed_kmh, service_hours)[1]
+        if lateness <= before + _EPS:
+            return candidate
+        if lateness < best_lateness - _EPS:
+            best, best_lateness = candidate, lateness
+    return best
+
+
+def _two_opt(route, dist, deadlines, speed_kmh, service_hours):
+    """Apply shortening 2-opt moves that do not add lateness, best first."""
+    lateness = _schedule(route, dist, deadlines, speed_kmh, service_hours)[1]
+    n = len(route) - 1  # Edges (route[i], route[i+1])
+    i, j = np.triu_indices(n, k=2)
+    while True:
+        a, b, c, d = route[i], route[i + 1], route[j], route[j + 1]
+        delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+        improved = False
+        for move in np.argsort(delta, kind='stable'):
+            if delta[move] >= -_EPS:
+                break
+            lo, hi = i[move] + 1, j[move] + 1
+            candidate = np.concatenate([route[:lo], route[lo:hi][::-1], route[hi:]])
+            candidate_lateness = _schedule(candidate, dist, deadlines, speed_kmh, service_hours)[1]
+            if candidate_lateness <= lateness + _EPS:
+                route, lateness, improved = candidate, candidate_lateness, True
+                break
+        if not improved:
+            return route
+
+
+def plan_route(dist, deadlines, speed_kmh=AVERAGE_SPEED_KMH, service_minutes=SERVICE_MINUTES):
+    """
+    Order the stops of a round trip. `dist` is the (n+1, n+1) distance matrix
+    with the start at index 0, `deadlines` the latest arrival at each stop in
+    hours from departure (index 0 unused). Returns the stop indices in visit
+    order, without the start.
+    """
+    dist = np.asarray(dist, dtype=np.float64)
+    deadlines = np.asarray(deadlines, dtype=np.float64)
+    n = len(dist) - 1
+    if n == 0:
+        return []
+    service_hours = service_minutes / 60
+
+    route = np.array([0, 0], dtype=np.intp)
+    unrouted = np.arange(1, n + 1)
+    while len(unrouted):
+        # Nearest insertion: the unrouted stop closest to any routed point
+        nearest = dist[np.ix_(unrouted, route[:-1])].min(axis=1).argmin()
+        route = _insert(route, unrouted[nearest], dist, deadlines, speed_kmh, service_hours)
+        unrouted = np.delete(unrouted, nearest)
+
+    if n > 2:
+        route = _two_opt(route, dist, deadlines, speed_kmh, service_hours)
+    return route[1:-1].tolist()
+
+
+def _fingerprint(receiver, pickups):
+    key = repr((
+        receiver.location_lat, receiver.location_long,
+        [(p.schedule_id, p.donation_id.donor_id.location_lat, p.donation_id.donor_id.location_long,
+          p.donation_id.expiry_time.isoformat()) for p in pickups],
+    ))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def receiver_route(receiver, now=None):
+    """
+    Route over `receiver`'s accepted pickups of non-completed donations,
+    leaving now. Returns a JSON-ready dict.
+    """
+    now = now or timezone.now()
+    pickups = list(
+        PickupSchedule.objects.filter(receiver_id=receiver, pickup_status='accepted')
+        .exclude(donation_id__status='completed')
+        .select_related('donation_id__donor_id')
+        .order_by('schedule_id')
+    )
+    donors = [p.donation_id.donor_id for p in pickups]
+    lats = np.array([receiver.location_lat] + [d.location_lat for d in donors])
+    longs = np.array([receiver.location_long] + [d.location_long for d in donors])
+    dist = distance_matrix(lats, longs, lats, longs)
+    deadlines = np.array([np.inf] + [(p.donation_id.expiry_time - now).total_seconds() / 3600 for p in pickups])
+
+    cache_key = f"route:{receiver.receiver_id}:{_fingerprint(receiver, pickups)}"
+    order = cache.get(cache_key)
+    if order is None:
+        order = plan_route(dist, deadlines)
+        cache.set(cache_key, order, CACHE_TIMEOUT)
+
+    route = np.array([0, *order, 0], dtype=np.intp)
+    arrivals, _ = _schedule(route, dist, deadlines, AVERAGE_SPEED_KMH, SERVICE_MINUTES / 60)
+    stops = []
+    for stop, arrival in zip(order, arrivals):
+        pickup = pickups[stop - 1]
+        donor = pickup.donation_id.donor_id
+        eta = now + timedelta(hours=float(arrival))
+        stops.append({
+            'schedule_id': pickup.schedule_id,
+            'donation_id': pickup.donation_id_id,
+            'donor': donor.name,
+            'location_lat': donor.location_lat,
+            'location_long': donor.location_long,
+            'eta': eta.isoformat(),
+            'expiry_time': pickup.donation_id.expiry_time.isoformat(),
+            'late': bool(eta > pickup.donation_id.expiry_time),
+        })
+    return {
+        'departure': now.isoformat(),
+        'total_km': round(float(_length(route, dist)), 3) if stops else 0.0,
+        'late_stops': sum(stop['late'] for stop in stops),
+        'stops': stops,
+    }
@@ -0,0 +1,95 @@
+"""
+Read-through store for per-(donation, receiver) priority scores.
+
+Scores are kept in PriorityScore and only computed for pairs that have no
+row for the active model version (ML_Model.registry). Model-input changes
+delete the affected rows (see the save() methods in core.models), so a
+steady-state dashboard load reads scores without writing anything.
+
+Tree models store each pair as a curve over time to expiry; reading a score
+is then a binary search at the current time to expiry, and the passing of
+time never requires another model call. Other models store the score at
+`computed_at` only, which is reused for settings.POINT_SCORE_TIMEOUT
+seconds and then recomputed.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from ML_Model.registry import get_active_model
+from ML_Model.tree_compiler import PriorityCurve
+from .models import PriorityScore
+from .scoring import build_feature_matrix, predict_priority
+
+
+def hours_to_expiry(donation, now):
+    return (donation.expiry_time - now).total_seconds() / 3600
+
+
+def get_priority_scores(receiver, donations, now=None, model=None):
+    """
+    Return {donation_id: score} for `receiver` at `now`, computing and storing
+    the missing ones in a single batch. `model` defaults to the active model.
+    """
+    now = now or timezone.now()
+    model = model or get_active_model()
+    by_id = {d.donation_id: d for d in donations}
+    point_score_timeout = timedelta(seconds=settings.POINT_SCORE_TIMEOUT)
+    stored = PriorityScore.objects.filter(
+        receiver_id=receiver,
+        donation_id__in=list(by_id),
+        model_version=model.tag,
+    ).values_list('donation_id', 'score', 'computed_at', 'curve_breakpoints', 'curve_values')
+
+    scores = {}
+    for donation_id, score, computed_at, breakpoints, values in stored:
+        if values is not None:
+            curve = PriorityCurve.from_bytes(breakpoints, values)
+            score = float(curve(hours_to_expiry(by_id[donation_id], now)))
+        elif abs(now - computed_at) > point_score_timeout:
+            continue  # A point score for a time to expiry too far from now
+        scores[donation_id] = score
+
+    missing = [d for d in donations if d.donation_id not in scores]
+    if missing:
+        store_scores(receiver, missing, now, model, scores)
+    return scores
+
+
+def store_scores(receiver, donations, now, model, scores):
+    """Compute, store and add to `scores` the scores of `donations`."""
+    X = build_feature_matrix(
+        donations,
+        receiver_capacity=receiver.capacity,
+        receiver_lat=receiver.location_lat,
+        receiver_long=receiver.location_long,
+        now=now,
+        receiver=receiver,
+    )
+    curves = model.time_curves(X)
+    if curves is not None:
+        current = [float(curve(x)) for curve, x in zip(curves, X[:, -1])]
+    else:
+        current = predict_priority(X, model=model)
+
+    rows = []
+    for i, donation in enumerate(donations):
+        row = PriorityScore(
+            donation_id=donation,
+            receiver_id=receiver,
+            score=float(current[i]),
+            model_version=model.tag,
+            computed_at=now,
+        )
+        if curves is not None:
+            row.curve_breakpoints, row.curve_values = curves[i].to_bytes()
+        scores[donation.donation_id] = row.score
+        rows.append(row)
+
+    # Rows left over from an older model version or time are replaced
+    PriorityScore.objects.filter(
+        receiver_id=receiver,
+        donation_id__in=[d.donation_id for d in donations],
+    ).delete()
+    PriorityScore.objects.bulk_create(rows, ignore_conflicts=True)
@@ -0,0 +1,161 @@
+"""
+Pickup time slots.
+
+Each receiver's day is cut into SLOT_MINUTES slots, and the donations
+picked up in one slot may add up to at most settings.PICKUP_SLOT_CAPACITY
+(the same unit as quantity), or the receiver's capacity if that is lower.
+Receiver.capacity is the receiver's total storage, the same meaning as in
+core.matching, which keeps the open pickups of a receiver within it; it is
+not repeated per slot. New pickups are placed highest priority first, in
+the earliest slot that still has room and ends before the donation
+expires; that slot's start becomes PickupSchedule.scheduled_time and the
+donation's MLPredictions.suggested_pickup_time. A pickup that fits nowhere
+before its deadline goes into the first slot anyway, over capacity, since
+waiting would only let the food expire.
+
+Scheduling is incremental: pickups that already have a slot
+(slot_assigned_at set) keep it and only count towards the load of their
+slot, so a new request never moves earlier ones. schedule_pickup and the
+matching engine call schedule_pickups() right after creating pickups;
+`manage.py schedule_pickups` catches up on everything else.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .changefeed import record_pickups
+from .models import MLPredictions, PickupSchedule
+from .rollups import track_pickups
+
+logger = logging.getLogger(__name__)
+
+SLOT_MINUTES = 30
+SCHEDULABLE_STATUSES = ('pending', 'accepted')
+
+_SLOT_SECONDS = SLOT_MINUTES * 60
+
+
+def slot_index(moment):
+    """Index of the slot containing `moment` (slots are aligned to the epoch)."""
+    return int(moment.timestamp() // _SLOT_SECONDS)
+
+
+def slot_start(index):
+    return datetime.fromtimestamp(index * _SLOT_SECONDS, tz=dt_timezone.utc)
+
+
+def assign_slots(items, loads, capacity, first_slot):
+    """
+    Place `items` (key, quantity, last_slot) in order; `loads` maps slot
+    index to the quantity already booked and is updated in place. Returns
+    {key: slot index}.
+    """
+    placed = {}
+    for key, quantity, last_slot in items:
+        slot = first_slot
+        while slot <= last_slot and loads[slot] and loads[slot] + quantity > capacity:
+            slot += 1
+        if slot > last_slot:
+            slot = first_slot  # Nothing fits in time; do it first, over capacity
+        loads[slot] += quantity
+        placed[key] = slot
+    return placed
+
+
+def slot_capacity(receiver):
+    """Quantity `receiver` can pick up in one slot."""
+    return min(settings.PICKUP_SLOT_CAPACITY, receiver.capacity)
+
+
+def _schedule_receiver(receiver, pickups, now):
+    first_slot = slot_index(now) + 1  # The next slot that has not started
+    loads = defaultdict(float)
+    booked = PickupSchedule.objects.filter(
+        receiver_id=receiver, pickup_status__in=SCHEDULABLE_STATUSES,
+        slot_assigned_at__isnull=False, scheduled_time__gte=slot_start(first_slot),
+    ).values_list('scheduled_time', 'donation_id__quantity')
+    for scheduled_time, quantity in booked:
+        loads[slot_index(scheduled_time)] += quantity
+
+    items = [
+        # The whole slot has to end before the donation expires
+        (i, p.donation_id.quantity, slot_index(p.donation_id.expiry_time) - 1)
+        for i, p in enumerate(pickups)
+    ]
+    placed = assign_slots(items, loads, slot_capacity(receiver), first_slot)
+    for i, pickup in enumerate(pickups):
+        pickup.scheduled_time = slot_start(placed[i])
+        pickup.slot_assigned_at = now
+
+
+def schedule_pickups(receivers=None, now=None):
+    """
+    Give a slot to every open pickup that has none yet (only those of
+    `receivers` if given). Returns the number of pickups scheduled.
+    """
+    now = now or timezone.now()
+    pending = PickupSchedule.objects.filter(
+        pickup_status__in=SCHEDULABLE_STATUSES, slot_assigned_at__isnull=True,
+        donation_id__expiry_time__gt=now,
+    ).exclude(donation_id__status='completed')
+    if receivers is not None:
+        pending = pending.filter(receiver_id__in=receivers)
+    pending = list(
+        pending.select_related('donation_id', 'receiver_id')
+        .order_by('-priority_score', 'donation_id__expiry_time', 'schedule_id')
+    )
+    if not pending:
+        return 0
+
+    by_receiver = defaultdict(list)
+    for pickup in pending:
+        by_receiver[pickup.receiver_id].append(pickup)
+
+    unscheduled_times = [pickup.scheduled_time for pickup in pending]
+    with transaction.atomic():
+        for receiver, pickups in by_receiver.items():
+            _schedule_receiver(receiver, pickups, now)
+        PickupSchedule.objects.bulk_update(pending, ['scheduled_time', 'slot_assigned_at'], batch_size=500)
+        record_pickups(pending, now=now)
+        track_pickups([
+            (pickup, {'scheduled_time': scheduled_time})
+            for pickup, scheduled_time in zip(pending, unscheduled_times)
+        ])
+        _suggest_pickup_times(pending, now)
+    logger.debug("Scheduled %s pickups for %s receivers", len(pending), len(by_receiver))
+    return len(pending)
+
+
+def _suggest_pickup_times(pickups, now):
+    """Earliest upcoming slot of each donation -> MLPredictions."""
+    earliest = {}
+    for pickup in pickups:
+        current = earliest.get(pickup.donation_id_id)
+        if current is None or pickup.scheduled_time < current.scheduled_time:
+            earliest[pickup.donation_id_id] = pickup
+
+    existing = {p.donation_id_id: p for p in MLPredictions.objects.filter(donation_id__in=list(earliest))}
+    to_create, to_update = [], []
+    for donation_id, pickup in earliest.items():
+        prediction = existing.get(donation_id)
+        if prediction is None:
+            donation = pickup.donation_id
+            to_create.append(MLPredictions(
+                donation_id=donation,
+                expiry_risk=MLPredictions.expiry_risk_for(donation.expiry_time, now),
+                suggested_pickup_time=pickup.scheduled_time,
+                predicted_for=str(pickup.receiver_id_id),
+                priority_score=pickup.priority_score,
+                model_version=pickup.model_version or 'v1.0',
+            ))
+        elif (prediction.suggested_pickup_time is None or prediction.suggested_pickup_time < now
+              or pickup.scheduled_time < prediction.suggested_pickup_time):
+            prediction.suggested_pickup_time = pickup.scheduled_time
+            to_update.append(prediction)
+    MLPredictions.objects.bulk_create(to_create)
+    MLPredictions.objects.bulk_update(to_update, ['suggested_pickup_time'])
+
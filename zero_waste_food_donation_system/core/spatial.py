@@ -0,0 +1,83 @@
+"""
+Fixed-grid spatial index for donor and receiver locations.
+
+The globe is cut into GRID_CELL_DEGREES x GRID_CELL_DEGREES cells and every
+Donor and Receiver stores the (grid_row, grid_col) of its location in
+indexed columns, kept current by save(). A radius query first selects the
+cells overlapping the circle's bounding box with an indexed range filter,
+and only the rows in those cells get an exact haversine check (in SQL, see
+core.db_functions). Adding donations in other cities then no longer makes
+a receiver's query slower.
+
+Writes that bypass save() (QuerySet.update, bulk_update) must call
+assign_grid_cell() themselves.
+"""
+import math
+
+from django.db.models import Q
+
+from .geo import EARTH_RADIUS_KM
+
+# About 5.5 km of latitude; a 10 km radius touches at most 5 x 5 cells
+GRID_CELL_DEGREES = 0.05
+GRID_ROWS = math.ceil(180 / GRID_CELL_DEGREES)
+GRID_COLS = math.ceil(360 / GRID_CELL_DEGREES)
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def grid_cell(lat, long):
+    """(row, col) of the cell containing a point."""
+    row = min(int((lat + 90) // GRID_CELL_DEGREES), GRID_ROWS - 1)
+    col = int(((long + 180) % 360) // GRID_CELL_DEGREES) % GRID_COLS
+    return row, col
+
+
+def assign_grid_cell(instance):
+    """Set grid_row/grid_col of a Donor or Receiver from its location."""
+    instance.grid_row, instance.grid_col = grid_cell(instance.location_lat, instance.location_long)
+
+
+def cells_within(lat, long, radius_km, prefix=''):
+    """
+    Q object matching rows whose grid cell overlaps the bounding box of the
+    circle; `prefix` reaches a related model, e.g. 'donor_id__'.
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    lat_min, lat_max = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    row_min, row_max = grid_cell(lat_min, 0)[0], grid_cell(lat_max, 0)[0]
+    rows = Q(**{f'{prefix}grid_row__range': (row_min, row_max)})
+
+    # A degree of longitude is shortest at the box edge nearest a pole
+    widest_lat = max(abs(lat_min), abs(lat_max))
+    cos_lat = math.cos(math.radians(widest_lat))
+    if cos_lat * 180 * KM_PER_DEGREE <= radius_km:
+        return rows  # The circle wraps all the way around
+    dlong = radius_km / (KM_PER_DEGREE * cos_lat)
+    col_min, col_max = grid_cell(0, long - dlong)[1], grid_cell(0, long + dlong)[1]
+    if col_min <= col_max:
+        cols = Q(**{f'{prefix}grid_col__range': (col_min, col_max)})
+    else:  # Crosses the antimeridian
+        cols = Q(**{f'{prefix}grid_col__gte': col_min}) | Q(**{f'{prefix}grid_col__lte': col_max})
+    return rows & cols
+
+
+def nearby_available_donations(receiver, radius_km, limit=None):
+    """
+    Available donations whose donor is within `radius_km` of `receiver`,
+    nearest first, each with a `distance_km` attribute. The grid cells
+    narrow the rows through the index; the exact distance check, ordering
+    and limit then run in the database.
+    """
+    from .db_functions import Haversine
+    from .models import FoodDonation
+
+    nearby = (
+        FoodDonation.objects.filter(status='available')
+        .filter(cells_within(receiver.location_lat, receiver.location_long, radius_km, prefix='donor_id__'))
+        .annotate(distance_km=Haversine('donor_id__location_lat', 'donor_id__location_long',
+                                        receiver.location_lat, receiver.location_long))
+        .filter(distance_km__lte=radius_km)
+        .select_related('donor_id')
+        .order_by('distance_km', 'donation_id')
+    )
+    return list(nearby if limit is None else nearby[:limit])
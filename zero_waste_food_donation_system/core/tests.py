@@ -1,3 +1,1298 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from importlib import import_module
+from io import StringIO
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from unittest import mock
+
+from ML_Model.ml_model import get_priority_model, get_food_type_encoder, encode_food_types, warm_up
+from ML_Model import artifact_cache, registry
+from ML_Model.tree_compiler import CompiledTreeEnsemble, compile_gradient_boosting
+from receivers.forms import CapacityUpdateForm
+from .models import (ChangeEvent, DonationDaily, Donor, Receiver, DonationCandidate, FoodDonation, MLPredictions,
+                     PickupDaily, PickupSchedule, PriorityScore)
+from . import caching, events, geo, pipeline, spatial
+from .analytics import bucket_starts, chart_window, label, last_buckets_start, series
+from .changefeed import compact
+from .candidates import new_for_receiver, precompute_missing, update_candidates
+from .db_functions import Haversine, haversine_expression
+from .matching import greedy_assign, match_donations
+from .pickups import accept_pickup, reject_pickup
+from .rollups import rebuild
+from .pipeline import score_open_donations
+from .routing import plan_route
+from .slots import SLOT_MINUTES, assign_slots, schedule_pickups, slot_capacity, slot_index
+from .score_store import get_priority_scores
+from .scoring import FEATURE_COLUMNS, score_donations
+from .training_data import iter_outcome_chunks
+
+
+def make_donor(name='donor', lat=12.97, long=77.59):
+    return Donor.objects.create(name=name, contact='9999999999', location_lat=lat,
+                                location_long=long, password='Secret123')
+
+
+def make_receiver(name='receiver', capacity=40, lat=12.93, long=77.62):
+    return Receiver.objects.create(name=name, contact='8888888888', capacity=capacity,
+                                   location_lat=lat, location_long=long, password='Secret123')
+
+
+def make_donation(donor, food_type='Rice', quantity=10, hours=6, status='available'):
+    return FoodDonation.objects.create(donor_id=donor, food_type=food_type, quantity=quantity,
+                                       expiry_time=timezone.now() + timedelta(hours=hours),
+                                       status=status)
+
+
+class BatchScoringTests(TestCase):
+    def setUp(self):
+        self.receiver = make_receiver()
+        donors = [make_donor('d%d' % i, lat=12.9 + i * 0.05, long=77.5 + i * 0.03) for i in range(3)]
+        food_types = list(get_food_type_encoder().classes_)
+        self.donations = [
+            make_donation(donors[i % 3], food_type=food_types[i % len(food_types)],
+                          quantity=5 + i * 3, hours=1 + i * 2)
+            for i in range(12)
+        ]
+
+    def reference_score(self, donation, now):
+        # Original one-row-at-a-time computation from calculate_priority_ml
+        X = pd.DataFrame([{
+            "receiver_capacity": self.receiver.capacity,
+            "receiver_distance": donation.donor_id.calculate_distance(
+                self.receiver.location_lat, self.receiver.location_long),
+            "food_type_encoded": get_food_type_encoder().transform([donation.food_type])[0],
+            "quantity": donation.quantity,
+            "time_to_expiry": (donation.expiry_time - now).total_seconds() / 3600,
+        }], columns=FEATURE_COLUMNS)
+        return float(get_priority_model().predict(X)[0])
+
+    def test_batch_scores_match_single_row_scores(self):
+        now = timezone.now()
+        scores = score_donations(self.donations, self.receiver, now=now)
+        self.assertEqual(len(scores), len(self.donations))
+        for donation, score in zip(self.donations, scores):
+            self.assertAlmostEqual(score, self.reference_score(donation, now), places=9)
+
+    def test_empty_batch(self):
+        self.assertEqual(len(score_donations([], self.receiver)), 0)
+
+    def test_batch_runs_single_query_with_select_related(self):
+        donations = FoodDonation.objects.select_related('donor_id')
+        with self.assertNumQueries(1):
+            score_donations(list(donations), self.receiver)
+
+
+class PriorityScoreStoreTests(TestCase):
+    def setUp(self):
+        self.donor = make_donor()
+        self.other_donor = make_donor('other', lat=13.01, long=77.55)
+        self.receiver = make_receiver()
+        self.other_receiver = make_receiver('other', capacity=80, lat=12.99, long=77.70)
+        self.donation = make_donation(self.donor)
+        self.other_donation = make_donation(self.other_donor, food_type='Bread')
+        for receiver in (self.receiver, self.other_receiver):
+            get_priority_scores(receiver, self.donations())
+
+    def donations(self):
+        return list(FoodDonation.objects.select_related('donor_id'))
+
+    def stored_pairs(self):
+        return set(PriorityScore.objects.values_list('donation_id', 'receiver_id'))
+
+    def test_second_read_does_not_write(self):
+        donations = self.donations()
+        with self.assertNumQueries(1):
+            scores = get_priority_scores(self.receiver, donations)
+        expected = score_donations(donations, self.receiver)
+        for donation, score in zip(donations, expected):
+            self.assertAlmostEqual(scores[donation.donation_id], score, places=3)
+
+    def test_receiver_capacity_change_invalidates_only_that_receiver(self):
+        receiver = Receiver.objects.get(pk=self.receiver.pk)
+        form = CapacityUpdateForm({'capacity': 90}, instance=receiver)
+        self.assertTrue(form.is_valid())
+        form.save()
+        self.assertEqual({r for _, r in self.stored_pairs()}, {self.other_receiver.pk})
+
+    def test_non_model_field_change_keeps_scores(self):
+        receiver = Receiver.objects.get(pk=self.receiver.pk)
+        receiver.contact = '7777777777'
+        receiver.save()
+        self.assertEqual(len(self.stored_pairs()), 4)
+
+    def test_donation_quantity_change_invalidates_that_donation(self):
+        donation = FoodDonation.objects.get(pk=self.donation.pk)
+        donation.quantity += 5
+        donation.save()
+        self.assertEqual({d for d, _ in self.stored_pairs()}, {self.other_donation.pk})
+
+    def test_scores_follow_the_clock_without_recomputing(self):
+        donations = self.donations()
+        later = timezone.now() + timedelta(hours=3)
+        with self.assertNumQueries(1):
+            scores = get_priority_scores(self.receiver, donations, now=later)
+        expected = score_donations(donations, self.receiver, now=later)
+        for donation, score in zip(donations, expected):
+            self.assertEqual(scores[donation.donation_id], score)
+
+    def test_expiry_change_keeps_curves(self):
+        donation = FoodDonation.objects.get(pk=self.donation.pk)
+        donation.expiry_time += timedelta(hours=5)
+        donation.save()
+        self.assertEqual(len(self.stored_pairs()), 4)
+        donations = self.donations()
+        now = timezone.now()
+        scores = get_priority_scores(self.receiver, donations, now=now)
+        expected = score_donations(donations, self.receiver, now=now)
+        for d, score in zip(donations, expected):
+            self.assertEqual(scores[d.donation_id], score)
+
+    def test_donor_location_change_invalidates_its_donations(self):
+        donor = Donor.objects.get(pk=self.donor.pk)
+        donor.location_lat += 0.1
+        donor.save()
+        self.assertEqual({d for d, _ in self.stored_pairs()}, {self.other_donation.pk})
+
+
+class PointScoreStoreTests(TestCase):
+    """Scores of a model without time curves (the SVM registry entry)."""
+
+    def setUp(self):
+        self.model = registry.load_model('svm', 'v1.0')
+        self.receiver = make_receiver()
+        self.donation = make_donation(make_donor())
+        self.now = timezone.now()
+        get_priority_scores(self.receiver, self.donations(), now=self.now, model=self.model)
+
+    def donations(self):
+        return list(FoodDonation.objects.select_related('donor_id'))
+
+    def test_rows_hold_point_scores(self):
+        stored = PriorityScore.objects.get()
+        self.assertIsNone(stored.curve_values)
+        self.assertEqual(stored.computed_at, self.now)
+
+    def test_expiry_change_invalidates_point_scores(self):
+        donation = FoodDonation.objects.get(pk=self.donation.pk)
+        donation.expiry_time += timedelta(hours=5)
+        donation.save()
+        self.assertFalse(PriorityScore.objects.exists())
+
+    def test_later_reads_recompute(self):
+        later = self.now + timedelta(hours=3)
+        donations = self.donations()
+        scores = get_priority_scores(self.receiver, donations, now=later, model=self.model)
+        expected = score_donations(donations, self.receiver, now=later, model=self.model)
+        self.assertEqual(scores[self.donation.donation_id], expected[0])
+        stored = PriorityScore.objects.get()
+        self.assertEqual((stored.computed_at, stored.score), (later, expected[0]))
+
+    def test_second_read_does_not_write(self):
+        donations = self.donations()
+        soon = self.now + timedelta(seconds=settings.POINT_SCORE_TIMEOUT - 1)
+        with self.assertNumQueries(1):
+            scores = get_priority_scores(self.receiver, donations, now=soon, model=self.model)
+        self.assertEqual(scores[self.donation.donation_id], PriorityScore.objects.get().score)
+
+
+class LazyModelLoadingTests(SimpleTestCase):
+    def test_app_imports_do_not_load_model(self):
+        probe = (
+            "import os, sys; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zero_waste.settings');"
+            "import django; django.setup();"
+            "import core.models, core.score_store, receivers.views, donors.views;"
+            "from ML_Model import ml_model;"
+            "print(ml_model.is_loaded(), 'sklearn' in sys.modules, 'pandas' in sys.modules)"
+        )
+        out = subprocess.run([sys.executable, '-c', probe], cwd=settings.BASE_DIR,
+                             capture_output=True, text=True, check=True,
+                             env=dict(os.environ, ML_MODEL_WARMUP='0'))
+        self.assertEqual(out.stdout.split(), ['False', 'False', 'False'])
+
+    def test_scoring_from_memory_mapped_artifacts_skips_sklearn(self):
+        warm_up()  # Builds the memory-mapped copies if needed
+        probe = (
+            "import sys; from ML_Model import ml_model; from ML_Model.registry import get_active_model;"
+            "ml_model.warm_up(); model = get_active_model();"
+            "print(model.predict([[40, 5.0, 3, 15, 3.0]])[0], type(model.compiled.value.base).__name__,"
+            "'sklearn' in sys.modules)"
+        )
+        out = subprocess.run([sys.executable, '-c', probe], cwd=settings.BASE_DIR,
+                             capture_output=True, text=True, check=True)
+        score, base, sklearn_imported = out.stdout.split()
+        expected = get_priority_model().predict(pd.DataFrame([[40, 5.0, 3, 15, 3.0]], columns=FEATURE_COLUMNS))
+        self.assertEqual(float(score), expected[0])
+        self.assertEqual((base, sklearn_imported), ('memmap', 'False'))
+
+
+class ArtifactCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.source = os.path.join(self.tmp, 'source.pkl')
+        self.directory = self.source + '.arrays'
+        self.builds = 0
+
+    def write_source(self, data):
+        with open(self.source, 'wb') as f:
+            f.write(data)
+
+    def build(self):
+        self.builds += 1
+        with open(self.source, 'rb') as f:
+            return np.frombuffer(f.read(), dtype=np.uint8)
+
+    def cached(self):
+        return artifact_cache.cached(
+            self.source, self.directory, build=self.build,
+            write=lambda d, a: np.save(os.path.join(d, 'a.npy'), a),
+            read=lambda d: np.load(os.path.join(d, 'a.npy'), mmap_mode='r'),
+        )
+
+    def test_builds_once_and_rebuilds_when_source_changes(self):
+        self.write_source(b'abc')
+        self.assertEqual(bytes(self.cached()), b'abc')
+        self.assertIsInstance(self.cached(), np.memmap)
+        self.assertEqual(self.builds, 1)
+
+        self.write_source(b'abcd')
+        self.assertEqual(bytes(self.cached()), b'abcd')
+        self.assertEqual(self.builds, 2)
+
+    def test_falls_back_to_memory_when_directory_is_not_writable(self):
+        self.write_source(b'abc')
+        with mock.patch.object(artifact_cache.tempfile, 'mkdtemp', side_effect=PermissionError):
+            self.assertEqual(bytes(self.cached()), b'abc')
+        self.assertFalse(os.path.exists(self.directory))
+
+
+class CompiledTreeEnsembleTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model = get_priority_model()
+        cls.compiled = compile_gradient_boosting(cls.model)
+        df = pd.read_csv(settings.BASE_DIR.parent / 'ML_Part' / 'food_donation_dataset.csv')
+        df['food_type_encoded'] = get_food_type_encoder().transform(df['food_type'])
+        cls.X = df[FEATURE_COLUMNS]
+
+    def test_matches_sklearn_on_dataset(self):
+        expected = self.model.predict(self.X)
+        np.testing.assert_array_equal(self.compiled.predict(self.X.to_numpy()), expected)
+
+    def test_matches_sklearn_on_split_thresholds(self):
+        # Rows sitting exactly on split thresholds must take the same branch
+        internal = self.compiled.threshold != np.inf
+        X = np.repeat(self.X.to_numpy()[:1], internal.sum(), axis=0)
+        X[np.arange(len(X)), self.compiled.feature[internal]] = self.compiled.threshold[internal]
+        expected = self.model.predict(pd.DataFrame(X, columns=FEATURE_COLUMNS))
+        np.testing.assert_array_equal(self.compiled.predict(X), expected)
+
+    def test_save_and_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'model.npz')
+            self.compiled.save(path)
+            loaded = CompiledTreeEnsemble.load(path)
+        X = self.X.to_numpy()[:50]
+        np.testing.assert_array_equal(loaded.predict(X), self.compiled.predict(X))
+
+    def test_memory_mapped_arrays_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.compiled.save_arrays(tmp)
+            loaded = CompiledTreeEnsemble.load_arrays(tmp)
+            self.assertFalse(loaded.threshold.flags.writeable)
+            X = self.X.to_numpy()
+            np.testing.assert_array_equal(loaded.predict(X), self.compiled.predict(X))
+            del loaded
+
+    def test_time_curves_match_predict(self):
+        rows = self.X.to_numpy()[::40]
+        curves = self.compiled.time_curves(rows, FEATURE_COLUMNS.index('time_to_expiry'))
+        time_thresholds = self.compiled.threshold[self.compiled.feature == 4]
+        hours = np.concatenate([np.linspace(-10, 40, 200), time_thresholds[:100]])
+        for row, curve in zip(rows, curves):
+            X = np.repeat(row[None, :], len(hours), axis=0)
+            X[:, 4] = hours
+            np.testing.assert_array_equal(curve(hours), self.compiled.predict(X))
+
+    def test_food_type_codes_match_encoder(self):
+        labels = list(get_food_type_encoder().classes_)
+        self.assertEqual(encode_food_types(labels), list(get_food_type_encoder().transform(labels)))
+        with self.assertRaises(ValueError):
+            encode_food_types(['biryani'])
+
+
+class ModelRegistryTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        patcher = mock.patch.object(registry, 'REGISTRY_PATH', os.path.join(tmp, 'registry.json'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_default_active_model_matches_sklearn(self):
+        model = registry.get_active_model()
+        self.assertEqual(model.tag, 'gradient_boosting:v1.0')
+        X = np.array([[40, 5.0, 3, 15, 3.0]])
+        expected = get_priority_model().predict(pd.DataFrame(X, columns=FEATURE_COLUMNS))
+        np.testing.assert_array_equal(model.predict(X), expected)
+
+    def test_switching_active_model_is_picked_up_and_stamped(self):
+        donation = make_donation(make_donor())
+        receiver = make_receiver()
+        donations = list(FoodDonation.objects.select_related('donor_id'))
+        get_priority_scores(receiver, donations)
+
+        call_command('activate_model', 'svm', 'v1.0', stdout=open(os.devnull, 'w'))
+        self.assertEqual(registry.get_active_model().tag, 'svm:v1.0')
+
+        scores = get_priority_scores(receiver, donations)
+        stored = PriorityScore.objects.get(donation_id=donation, receiver_id=receiver)
+        self.assertEqual(stored.model_version, 'svm:v1.0')
+        expected = score_donations(donations, receiver, model=registry.load_model('svm', 'v1.0'))
+        self.assertAlmostEqual(scores[donation.donation_id], expected[0], places=3)
+        self.assertAlmostEqual(stored.score, expected[0], places=3)
+
+    def test_unknown_model_is_rejected(self):
+        with self.assertRaises(LookupError):
+            registry.set_active_model('random_forest', 'v1.0')
+
+    def test_switching_writes_the_live_manifest_only(self):
+        with open(registry.DEFAULT_REGISTRY_PATH) as f:
+            shipped = f.read()
+        registry.set_active_model('svm', 'v1.0')
+        with open(registry.DEFAULT_REGISTRY_PATH) as f:
+            self.assertEqual(f.read(), shipped)
+        with open(registry.REGISTRY_PATH) as f:
+            self.assertEqual(json.load(f)['active'], 'svm:v1.0')
+
+
+class ScoreOpenDonationsTests(TestCase):
+    def setUp(self):
+        donor = make_donor()
+        self.receivers = [make_receiver('r1'), make_receiver('r2', capacity=90, lat=13.0, long=77.7)]
+        self.donations = [make_donation(donor, quantity=5 + i, hours=1 + 3 * i) for i in range(5)]
+        make_donation(donor, status='reserved')
+        make_donation(donor, food_type='biryani')
+
+    def best(self, donation, now):
+        scores = [(score_donations([donation], receiver, now=now)[0], receiver.receiver_id)
+                  for receiver in Receiver.objects.order_by('receiver_id')]
+        return max(scores, key=lambda pair: pair[0])
+
+    def assert_best_scores(self, now):
+        for prediction in MLPredictions.objects.select_related('donation_id__donor_id'):
+            score, receiver_id = self.best(prediction.donation_id, now)
+            self.assertEqual(prediction.predicted_for, str(receiver_id))
+            self.assertAlmostEqual(prediction.priority_score, score)
+
+    def test_populates_predictions_in_one_model_call_per_chunk(self):
+        now = timezone.now()
+        with mock.patch('core.pipeline.predict_priority', wraps=pipeline.predict_priority) as predict:
+            stats = score_open_donations(chunk_size=2, now=now)
+        self.assertEqual(predict.call_count, 3)
+        self.assertEqual(stats['created'], 5)
+        self.assertEqual(stats['unscorable'], 1)
+        self.assertFalse(PriorityScore.objects.exists())
+        self.assert_best_scores(now)
+        for prediction in MLPredictions.objects.select_related('donation_id'):
+            self.assertEqual(prediction.expiry_risk, prediction.calculate_expiry_risk(now))
+            self.assertEqual(prediction.model_version, registry.get_active_model().tag)
+
+    def test_unchanged_donations_are_skipped_before_scoring(self):
+        score_open_donations()
+        with mock.patch('core.pipeline.predict_priority') as predict:
+            stats = score_open_donations()
+        predict.assert_not_called()
+        self.assertEqual(stats['skipped'], 5)
+
+        donation = FoodDonation.objects.get(pk=self.donations[0].pk)
+        donation.quantity += 10
+        donation.save()
+        stats = score_open_donations()
+        self.assertEqual((stats['created'], stats['updated'], stats['skipped']), (0, 1, 4))
+
+    def test_receiver_changes_refresh_best_scores(self):
+        score_open_donations()
+        receiver = Receiver.objects.get(pk=self.receivers[0].pk)
+        receiver.capacity = 95
+        receiver.save()
+
+        now = timezone.now()
+        stats = score_open_donations(now=now)
+        self.assertEqual(stats['skipped'], 0)
+        self.assert_best_scores(now)
+
+
+class BatchScoreCliTests(SimpleTestCase):
+    def test_scores_csv_in_order_with_workers(self):
+        df = pd.read_csv(settings.BASE_DIR.parent / 'ML_Part' / 'food_donation_dataset.csv').head(300)
+        df.loc[7, 'food_type'] = 'biryani'
+        known = df.drop(index=7)
+        X = known[['receiver_capacity', 'receiver_distance', 'food_type', 'quantity', 'time_to_expiry']].copy()
+        X['food_type'] = encode_food_types(X['food_type'])
+        expected = registry.get_active_model().predict(X.to_numpy(dtype=float))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'in.csv')
+            df.to_csv(source, index=False)
+            for workers in ('1', '2'):
+                target = os.path.join(tmp, f'out{workers}.csv')
+                subprocess.run([sys.executable, '-m', 'ML_Model.batch_score', source, target,
+                                '--workers', workers, '--chunk-size', '64'],
+                               cwd=settings.BASE_DIR, capture_output=True, check=True)
+                out = pd.read_csv(target)
+                self.assertEqual(list(out.columns), list(df.columns) + ['predicted_priority'])
+                self.assertTrue(np.isnan(out.loc[7, 'predicted_priority']))
+                np.testing.assert_allclose(out.drop(index=7)['predicted_priority'], expected)
+
+
+class TrainPriorityModelTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        patcher = mock.patch.object(registry, 'REGISTRY_PATH', os.path.join(self.tmp, 'registry.json'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        donor = make_donor()
+        near, far = make_receiver('near'), make_receiver('far', lat=13.2, long=77.9)
+        for i in range(30):
+            donation = make_donation(donor, quantity=5 + i, hours=2 + i % 12)
+            for receiver, status in ((near, 'accepted'), (far, 'rejected')):
+                PickupSchedule.objects.create(donation_id=donation, receiver_id=receiver,
+                                              scheduled_time=donation.expiry_time, pickup_status=status)
+        PickupSchedule.objects.create(donation_id=donation, receiver_id=near,
+                                      scheduled_time=donation.expiry_time)  # Pending: not an outcome
+        make_donation(donor, food_type='biryani')
+
+    def test_outcome_chunks_stream_decided_pickups(self):
+        chunks = list(iter_outcome_chunks(chunk_size=25))
+        self.assertEqual([len(chunk) for chunk in chunks], [25, 25, 10])
+        df = pd.concat(chunks)
+        self.assertEqual(df['target'].sum(), 30)
+        near = df[df['target'] == 1.0]
+        self.assertTrue((near['receiver_distance'] < df[df['target'] == 0.0]['receiver_distance'].min()).all())
+        self.assertTrue(((near['time_to_expiry'] > 1.9) & (near['time_to_expiry'] < 14)).all())
+
+    def test_trains_exports_and_registers(self):
+        call_command('train_priority_model', '--min-rows', '10', '--output-dir', self.tmp,
+                     '--model-version', 'v-test', '--max-iter', '20', '--activate',
+                     stdout=open(os.devnull, 'w'))
+        directory = os.path.join(self.tmp, 'hist_gradient_boosting', 'v-test')
+        self.assertEqual(sorted(os.listdir(directory)), ['food_type_encoder.pkl', 'model.joblib', 'schema.json'])
+
+        model = registry.get_active_model()
+        self.assertEqual(model.tag, 'hist_gradient_boosting:v-test')
+        X = np.array([[40, 0.1, 3, 15, 6.0], [40, 40.0, 3, 15, 6.0]])
+        near, far = model.predict(X)
+        self.assertGreater(near, far)
+
+    def test_refuses_too_little_history(self):
+        with self.assertRaises(CommandError):
+            call_command('train_priority_model', '--output-dir', self.tmp, stdout=open(os.devnull, 'w'))
+
+
+class SpatialIndexTests(TestCase):
+    def setUp(self):
+        self.receiver = make_receiver(lat=12.93, long=77.62)
+        # Bengaluru donors at ~0.5, ~4 and ~13 km, and one in Mumbai
+        self.near = make_donation(make_donor('near', lat=12.935, long=77.62))
+        self.mid = make_donation(make_donor('mid', lat=12.93, long=77.657))
+        self.far = make_donation(make_donor('far', lat=13.05, long=77.62))
+        self.other_city = make_donation(make_donor('mumbai', lat=19.07, long=72.87))
+        make_donation(Donor.objects.get(name='near'), status='reserved')
+
+    def test_grid_cell_kept_current_on_save(self):
+        donor = Donor.objects.get(name='near')
+        self.assertEqual((donor.grid_row, donor.grid_col), spatial.grid_cell(12.935, 77.62))
+        donor.location_lat, donor.location_long = 19.07, 72.87
+        donor.save()
+        donor.refresh_from_db()
+        self.assertEqual((donor.grid_row, donor.grid_col), spatial.grid_cell(19.07, 72.87))
+
+    def test_nearby_available_donations_by_distance(self):
+        nearby = spatial.nearby_available_donations(self.receiver, radius_km=10)
+        self.assertEqual(nearby, [self.near, self.mid])
+        self.assertLess(nearby[0].distance_km, nearby[1].distance_km)
+        self.assertAlmostEqual(nearby[1].distance_km, self.receiver.calculate_distance(12.93, 77.657))
+        self.assertEqual(spatial.nearby_available_donations(self.receiver, radius_km=10, limit=1), [self.near])
+        self.assertEqual(len(spatial.nearby_available_donations(self.receiver, radius_km=20)), 3)
+
+    def test_cell_filter_prunes_other_cities(self):
+        candidates = FoodDonation.objects.filter(
+            spatial.cells_within(12.93, 77.62, 20, prefix='donor_id__'))
+        self.assertNotIn(self.other_city, candidates)
+        self.assertIn(self.far, candidates)
+
+    def test_cell_filter_across_the_antimeridian(self):
+        make_donation(make_donor('fiji', lat=-17.0, long=179.99))
+        make_donation(make_donor('samoa', lat=-17.0, long=-179.99))
+        found = FoodDonation.objects.filter(spatial.cells_within(-17.0, 179.99, 10, prefix='donor_id__'))
+        self.assertEqual(sorted(d.donor_id.name for d in found), ['fiji', 'samoa'])
+
+
+class GeoDistanceTests(TestCase):
+    def setUp(self):
+        geo.clear()
+        self.addCleanup(geo.clear)
+        self.donors = [make_donor('a'), make_donor('b', lat=13.05, long=77.7), make_donor('c', lat=19.07, long=72.87)]
+        self.receiver = make_receiver()
+
+    def test_scalar_and_matrix_match_pairwise(self):
+        donor = self.donors[1]
+        self.assertIsInstance(geo.haversine_km(12.93, 77.62, 13.05, 77.7), float)
+        self.assertAlmostEqual(donor.calculate_distance(12.93, 77.62), self.receiver.calculate_distance(13.05, 77.7))
+
+        receivers = [self.receiver, make_receiver('r2', lat=13.2, long=77.5)]
+        matrix = geo.distance_matrix([d.location_lat for d in self.donors], [d.location_long for d in self.donors],
+                                     [r.location_lat for r in receivers], [r.location_long for r in receivers])
+        self.assertEqual(matrix.shape, (3, 2))
+        for i, d in enumerate(self.donors):
+            for j, r in enumerate(receivers):
+                self.assertAlmostEqual(matrix[i, j], r.calculate_distance(d.location_lat, d.location_long))
+
+    def test_cached_distances_follow_location_changes(self):
+        expected = [self.receiver.calculate_distance(d.location_lat, d.location_long) for d in self.donors]
+        np.testing.assert_allclose(geo.donor_distances(self.receiver, self.donors), expected)
+        with mock.patch.object(geo, 'haversine_km', side_effect=AssertionError('not cached')):
+            np.testing.assert_allclose(geo.donor_distances(self.receiver, self.donors), expected)
+
+        # Moved and saved here, or moved by another process: both recompute
+        self.donors[0].location_lat = 12.5
+        self.donors[0].save()
+        stale_copy = Donor.objects.get(pk=self.donors[1].pk)
+        stale_copy.location_long = 78.0
+        expected[0] = self.receiver.calculate_distance(12.5, 77.59)
+        expected[1] = self.receiver.calculate_distance(13.05, 78.0)
+        np.testing.assert_allclose(geo.donor_distances(self.receiver, [self.donors[0], stale_copy, self.donors[2]]),
+                                   expected)
+
+        self.receiver.location_lat = 13.0
+        self.receiver.save()
+        self.assertAlmostEqual(geo.pair_distance(self.donors[2], self.receiver),
+                               self.receiver.calculate_distance(19.07, 72.87))
+
+
+class HaversineExpressionTests(TestCase):
+    def setUp(self):
+        self.receiver = make_receiver()
+        for i, (lat, long) in enumerate([(12.97, 77.59), (13.05, 77.7), (12.935, 77.62), (19.07, 72.87)]):
+            make_donation(make_donor(f'd{i}', lat=lat, long=long))
+
+    def test_filter_and_order_by_distance_in_sql(self):
+        donations = (
+            FoodDonation.objects.annotate(distance=Haversine('donor_id__location_lat', 'donor_id__location_long',
+                                                             self.receiver.location_lat, self.receiver.location_long))
+            .filter(distance__lte=20).order_by('distance')
+        )
+        names = [d.donor_id.name for d in donations.select_related('donor_id')]
+        self.assertEqual(names, ['d2', 'd0', 'd1'])
+        for donation in donations:
+            self.assertAlmostEqual(donation.distance, self.receiver.calculate_distance(
+                donation.donor_id.location_lat, donation.donor_id.location_long))
+
+    def test_receiver_queryset_and_portable_expression_agree(self):
+        make_receiver('r2', lat=13.2, long=77.5)
+        via_function = Receiver.objects.annotate(d=Haversine('location_lat', 'location_long', 12.97, 77.59))
+        via_math = Receiver.objects.annotate(d=haversine_expression('location_lat', 'location_long', 12.97, 77.59))
+        expected = {r.pk: r.calculate_distance(12.97, 77.59) for r in Receiver.objects.all()}
+        for queryset in (via_function, via_math):
+            for receiver in queryset:
+                self.assertAlmostEqual(receiver.d, expected[receiver.pk])
+
+
+class MatchDonationsTests(TestCase):
+    def setUp(self):
+        donor = make_donor(lat=12.97, long=77.59)
+        self.small = make_receiver('small', capacity=20, lat=12.96, long=77.60)
+        self.big = make_receiver('big', capacity=100, lat=12.98, long=77.58)
+        self.remote = make_receiver('remote', capacity=500, lat=19.07, long=72.87)
+        self.donations = [make_donation(donor, quantity=q, hours=2 + i) for i, q in enumerate([15, 15, 30, 5])]
+        self.requested = make_donation(donor, quantity=5)
+        PickupSchedule.objects.create(donation_id=self.requested, receiver_id=self.small,
+                                      scheduled_time=self.requested.expiry_time)
+        make_donation(donor, food_type='biryani')
+
+    def test_greedy_assign_respects_capacity(self):
+        scores = np.array([0.9, 0.8, 0.7, 0.6])
+        donation_idx, receiver_idx = np.array([0, 1, 1, 0]), np.array([0, 0, 1, 1])
+        remaining = np.array([10.0, 10.0])
+        chosen = greedy_assign(scores, donation_idx, receiver_idx, np.array([6.0, 6.0]), remaining)
+        self.assertEqual(chosen, [0, 2])
+        np.testing.assert_array_equal(remaining, [4.0, 4.0])
+
+    def test_proposes_pending_pickups_within_capacity(self):
+        stats = match_donations(radius_km=10)
+        self.assertEqual((stats['donations'], stats['receivers'], stats['edges']), (4, 3, 8))
+        self.assertEqual(stats['assigned'], 4)
+
+        proposed = PickupSchedule.objects.exclude(donation_id=self.requested)
+        self.assertEqual(sorted(p.donation_id_id for p in proposed), [d.pk for d in self.donations])
+        load = {r.pk: 0 for r in (self.small, self.big)}
+        for pickup in proposed.select_related('donation_id'):
+            self.assertEqual(pickup.pickup_status, 'pending')
+            self.assertEqual(pickup.model_version, registry.get_active_model().tag)
+            load[pickup.receiver_id_id] += pickup.donation_id.quantity
+        # The pending request for 5 counts against the small receiver
+        self.assertLessEqual(load[self.small.pk], 15)
+        self.assertLessEqual(load[self.big.pk], 100)
+
+        # Donations with an open pickup are not proposed twice
+        self.assertEqual(match_donations(radius_km=10)['assigned'], 0)
+
+    def test_max_receivers_prunes_candidates(self):
+        self.assertEqual(match_donations(radius_km=10, max_receivers=1, dry_run=True)['edges'], 4)
+        self.assertEqual(PickupSchedule.objects.count(), 1)
+
+
+class RoutePlannerTests(SimpleTestCase):
+    def test_round_trip_without_deadlines_does_not_cross(self):
+        # Depot plus the corners of a square, given in crossing order
+        lats = np.array([12.90, 12.91, 12.95, 12.91, 12.95])
+        longs = np.array([77.50, 77.51, 77.55, 77.55, 77.51])
+        dist = geo.distance_matrix(lats, longs, lats, longs)
+        order = plan_route(dist, np.full(5, np.inf))
+        self.assertEqual(sorted(order), [1, 2, 3, 4])
+        self.assertIn(order, ([1, 3, 2, 4], [1, 4, 2, 3], [4, 2, 3, 1], [3, 2, 4, 1]))
+
+    def test_tight_deadline_is_visited_first(self):
+        # Stop 3 is the farthest but expires in half an hour
+        lats = np.array([12.90, 12.905, 12.91, 12.96])
+        longs = np.array([77.50, 77.50, 77.50, 77.50])
+        dist = geo.distance_matrix(lats, longs, lats, longs)
+        order = plan_route(dist, np.array([np.inf, 5, 5, 0.5]))
+        self.assertEqual(order[0], 3)
+
+
+class PickupSlotTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.donor = make_donor()
+        self.receiver = make_receiver(capacity=20)
+
+    def request(self, quantity, hours, priority):
+        donation = make_donation(self.donor, quantity=quantity, hours=hours)
+        return PickupSchedule.objects.create(donation_id=donation, receiver_id=self.receiver,
+                                             priority_score=priority, scheduled_time=donation.expiry_time)
+
+    def test_assign_slots_fills_earliest_slot_with_room(self):
+        loads = defaultdict(float, {10: 15.0})
+        placed = assign_slots([('a', 10, 20), ('b', 5, 20), ('c', 30, 20), ('d', 10, 9)], loads, 20, 10)
+        self.assertEqual(placed, {'a': 11, 'b': 10, 'c': 12, 'd': 10})
+        self.assertEqual(loads[10], 30.0)  # 'd' cannot wait and overbooks the first slot
+
+    def test_slots_respect_capacity_priority_and_deadlines(self):
+        urgent = self.request(quantity=15, hours=2, priority=0.9)
+        bulk = self.request(quantity=15, hours=12, priority=0.5)
+        small = self.request(quantity=5, hours=12, priority=0.1)
+        self.assertEqual(schedule_pickups(now=self.now), 3)
+
+        first = slot_index(self.now) + 1
+        slots = {p.pk: slot_index(p.scheduled_time) for p in PickupSchedule.objects.all()}
+        self.assertEqual(slots, {urgent.pk: first, bulk.pk: first + 1, small.pk: first})
+        for pickup in PickupSchedule.objects.select_related('donation_id'):
+            self.assertIsNotNone(pickup.slot_assigned_at)
+            self.assertLessEqual(pickup.scheduled_time + timedelta(minutes=SLOT_MINUTES),
+                                 pickup.donation_id.expiry_time)
+            prediction = MLPredictions.objects.get(donation_id=pickup.donation_id)
+            self.assertEqual(prediction.suggested_pickup_time, pickup.scheduled_time)
+
+    def test_new_pickups_do_not_move_scheduled_ones(self):
+        first = self.request(quantity=15, hours=12, priority=0.1)
+        schedule_pickups(now=self.now)
+        before = PickupSchedule.objects.get(pk=first.pk).scheduled_time
+
+        late_urgent = self.request(quantity=15, hours=6, priority=0.9)
+        self.assertEqual(schedule_pickups(now=self.now), 1)
+        self.assertEqual(PickupSchedule.objects.get(pk=first.pk).scheduled_time, before)
+        self.assertEqual(PickupSchedule.objects.get(pk=late_urgent.pk).scheduled_time,
+                         before + timedelta(minutes=SLOT_MINUTES))
+
+    @override_settings(PICKUP_SLOT_CAPACITY=20)
+    def test_capacity_is_total_storage_not_per_slot(self):
+        self.receiver.capacity = 100
+        self.receiver.save()
+        pickups = [self.request(quantity=15, hours=12, priority=0.5) for _ in range(2)]
+        schedule_pickups(now=self.now)
+
+        first = slot_index(self.now) + 1
+        self.assertEqual(slot_capacity(self.receiver), 20)
+        self.assertEqual(sorted(slot_index(PickupSchedule.objects.get(pk=p.pk).scheduled_time) for p in pickups),
+                         [first, first + 1])
+
+
+class CandidateReceiverTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.donor = make_donor()
+        self.near = [make_receiver(f'near{i}', capacity=10 + 30 * i, lat=12.96 - 0.01 * i) for i in range(3)]
+        self.far = make_receiver('far', lat=13.6)
+        self.donation = make_donation(self.donor)
+
+    def test_keeps_best_receivers_within_radius(self):
+        self.assertEqual(update_candidates(self.donation, now=self.now, radius_km=15, count=2), 2)
+        expected = sorted(
+            ((score_donations([self.donation], r, now=self.now)[0], r.receiver_id) for r in self.near),
+            key=lambda pair: -pair[0],
+        )[:2]
+        rows = DonationCandidate.objects.filter(donation_id=self.donation).order_by('rank')
+        self.assertEqual([row.receiver_id_id for row in rows], [receiver_id for _, receiver_id in expected])
+        for row, (score, _) in zip(rows, expected):
+            self.assertAlmostEqual(row.score, score, places=9)
+
+        # Recomputing replaces the rows
+        update_candidates(self.donation, now=self.now, radius_km=15, count=5)
+        self.assertEqual(DonationCandidate.objects.filter(donation_id=self.donation).count(), 3)
+        self.assertFalse(DonationCandidate.objects.filter(receiver_id=self.far).exists())
+
+    def test_new_for_receiver_skips_taken_and_requested_donations(self):
+        requested = make_donation(self.donor)
+        taken = make_donation(self.donor)
+        for donation in (self.donation, requested, taken):
+            update_candidates(donation, now=self.now)
+        PickupSchedule.objects.create(donation_id=requested, receiver_id=self.near[0],
+                                      scheduled_time=requested.expiry_time)
+        taken.status = 'reserved'
+        taken.save()
+
+        receiver = self.near[0]
+        with self.assertNumQueries(1):
+            rows = new_for_receiver(receiver)
+            self.assertEqual([row.donation_id.donor_id.name for row in rows], ['donor'])
+        self.assertEqual([row.donation_id_id for row in rows], [self.donation.donation_id])
+
+    def test_precompute_missing_fills_donations_without_candidates(self):
+        update_candidates(self.donation, now=self.now)
+        other = make_donation(self.donor)
+        stats = precompute_missing(now=self.now)
+        self.assertEqual(stats, {'donations': 1, 'candidates': 3})
+        self.assertEqual(DonationCandidate.objects.filter(donation_id=other).count(), 3)
+
+    def stored(self):
+        return set(DonationCandidate.objects.values_list('donation_id', 'receiver_id', 'rank'))
+
+    def expected(self, *donations):
+        expected = set()
+        for donation in FoodDonation.objects.filter(pk__in=[d.pk for d in donations]).select_related('donor_id'):
+            update_candidates(donation)
+            expected |= {row for row in self.stored() if row[0] == donation.pk}
+        return expected
+
+    @override_settings(DONATION_CANDIDATES_ASYNC=False)
+    def test_receiver_changes_recompute_affected_donations(self):
+        elsewhere = make_donation(make_donor('elsewhere', lat=13.6))
+        for donation in (self.donation, elsewhere):
+            update_candidates(donation)
+        untouched = DonationCandidate.objects.filter(donation_id=elsewhere).get()
+
+        # Moves next to the donor, out of range of `elsewhere`
+        far = Receiver.objects.get(pk=self.far.pk)
+        far.location_lat = 12.97
+        with self.captureOnCommitCallbacks(execute=True):
+            far.save()
+        self.assertIn(far.pk, {r for d, r, _ in self.stored() if d == self.donation.pk})
+        self.assertFalse(DonationCandidate.objects.filter(donation_id=elsewhere).exists())
+
+        receiver = Receiver.objects.get(pk=self.near[0].pk)
+        receiver.capacity = 95
+        with self.captureOnCommitCallbacks(execute=True):
+            receiver.save()
+        stored = self.stored()
+        self.assertEqual(stored, self.expected(self.donation))
+        self.assertNotIn(untouched.pk, DonationCandidate.objects.values_list('pk', flat=True))
+
+    @override_settings(DONATION_CANDIDATES_ASYNC=False)
+    def test_new_receivers_join_nearby_donations(self):
+        update_candidates(self.donation)
+        with self.captureOnCommitCallbacks(execute=True):
+            newcomer = make_receiver('newcomer', capacity=200, lat=12.97)
+        self.assertIn(newcomer.pk, {r for d, r, _ in self.stored() if d == self.donation.pk})
+        self.assertEqual(self.stored(), self.expected(self.donation))
+
+    @override_settings(DONATION_CANDIDATES_ASYNC=False)
+    def test_donor_moves_recompute_its_donations(self):
+        update_candidates(self.donation)
+        donor = Donor.objects.get(pk=self.donor.pk)
+        donor.location_lat = 13.6  # next to `far`, out of range of the others
+        with self.captureOnCommitCallbacks(execute=True):
+            donor.save()
+        self.assertEqual({r for d, r, _ in self.stored()}, {self.far.pk})
+        self.assertEqual(self.stored(), self.expected(self.donation))
+
+    @override_settings(DONATION_CANDIDATES_ASYNC=False)
+    def test_donation_changes_recompute_its_candidates(self):
+        update_candidates(self.donation)
+        donation = FoodDonation.objects.get(pk=self.donation.pk)
+        donation.quantity += 20
+        with self.captureOnCommitCallbacks(execute=True):
+            donation.save()
+        stored = self.stored()
+        self.assertEqual(len(stored), 3)
+        self.assertEqual(stored, self.expected(self.donation))
+
+    def test_switching_models_hides_and_recomputes_candidates(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        patcher = mock.patch.object(registry, 'REGISTRY_PATH', os.path.join(tmp, 'registry.json'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        update_candidates(self.donation)
+        registry.set_active_model('svm', 'v1.0')
+        self.assertEqual(new_for_receiver(self.near[0]), [])
+        self.assertEqual(precompute_missing(), {'donations': 1, 'candidates': 3})
+        self.assertEqual(set(DonationCandidate.objects.values_list('model_version', flat=True)), {'svm:v1.0'})
+        self.assertEqual(len(new_for_receiver(self.near[0])), 1)
+
+
+class AcceptPickupTests(TestCase):
+    def setUp(self):
+        self.donation = make_donation(make_donor())
+        self.pickups = [
+            PickupSchedule.objects.create(donation_id=self.donation, receiver_id=make_receiver(f'r{i}'),
+                                          scheduled_time=self.donation.expiry_time)
+            for i in range(3)
+        ]
+
+    def test_accept_reserves_donation_and_rejects_the_rest(self):
+        # Savepoint, lock, 3 UPDATEs, rejected ids, decided rows, 2 change event INSERTs,
+        # 3 rollup and 2 data version queries per table (however many pickups were
+        # decided), release
+        with self.assertNumQueries(20):
+            self.assertTrue(accept_pickup(self.pickups[1]))
+        statuses = dict(PickupSchedule.objects.values_list('schedule_id', 'pickup_status'))
+        self.assertEqual([statuses[p.schedule_id] for p in self.pickups], ['rejected', 'accepted', 'rejected'])
+        self.donation.refresh_from_db()
+        self.assertEqual((self.donation.status, self.donation.assigned_receiver), ('reserved', self.pickups[1].receiver_id))
+
+    def test_second_accept_changes_nothing(self):
+        self.assertTrue(accept_pickup(self.pickups[0]))
+        self.assertFalse(accept_pickup(self.pickups[1]))
+        self.assertFalse(reject_pickup(self.pickups[0]))
+        self.donation.refresh_from_db()
+        self.assertEqual(self.donation.assigned_receiver, self.pickups[0].receiver_id)
+
+
+# New receivers queue candidate updates on commit; keep them off the background thread
+@override_settings(DONATION_CANDIDATES_ASYNC=False)
+class AcceptPickupConcurrencyTests(TransactionTestCase):
+    THREADS = 8
+    ROUNDS = 5
+
+    def race(self, pickups):
+        barrier = threading.Barrier(len(pickups))
+        results, errors = [], []
+
+        def accept(pickup):
+            try:
+                barrier.wait()
+                results.append(accept_pickup(pickup))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=accept, args=(pickup,)) for pickup in pickups]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def test_exactly_one_concurrent_accept_wins(self):
+        for round_ in range(self.ROUNDS):
+            donation = make_donation(make_donor(f'donor{round_}'))
+            pickups = [
+                PickupSchedule.objects.create(donation_id=donation, receiver_id=make_receiver(f'r{round_}-{i}'),
+                                              scheduled_time=donation.expiry_time)
+                for i in range(self.THREADS)
+            ]
+            results = self.race(pickups)
+            self.assertEqual(sorted(results), [False] * (self.THREADS - 1) + [True])
+
+            accepted = PickupSchedule.objects.get(donation_id=donation, pickup_status='accepted')
+            self.assertEqual(PickupSchedule.objects.filter(donation_id=donation, pickup_status='rejected').count(),
+                             self.THREADS - 1)
+            donation.refresh_from_db()
+            self.assertEqual(donation.assigned_receiver_id, accepted.receiver_id_id)
+
+
+class PickupEventTests(TestCase):
+    def setUp(self):
+        self.donation = make_donation(make_donor())
+        self.pickups = [
+            PickupSchedule.objects.create(donation_id=self.donation, receiver_id=make_receiver(f'r{i}'),
+                                          scheduled_time=self.donation.expiry_time)
+            for i in range(2)
+        ]
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['receiver_id'] = self.pickups[0].receiver_id_id
+        session.save()
+        self.session_key = session.session_key
+
+    def published(self, action, *args):
+        with mock.patch.object(events, 'get_broker') as broker, self.captureOnCommitCallbacks(execute=True):
+            action(*args)
+        return [(channel, event['type'], event['schedule_id']) for (channel, event), _ in
+                broker.return_value.publish.call_args_list]
+
+    def test_accept_notifies_every_decided_receiver(self):
+        first, second = self.pickups
+        self.assertEqual(self.published(accept_pickup, first), [
+            (f'receiver:{first.receiver_id_id}', 'pickup.accepted', first.schedule_id),
+            (f'receiver:{second.receiver_id_id}', 'pickup.rejected', second.schedule_id),
+        ])
+        self.assertEqual(self.published(accept_pickup, second), [])
+
+    def test_events_wait_for_commit(self):
+        with mock.patch.object(events, 'get_broker') as broker, self.captureOnCommitCallbacks() as callbacks:
+            reject_pickup(self.pickups[0])
+        self.assertEqual(len(callbacks), 1)
+        broker.return_value.publish.assert_not_called()
+
+    def test_local_broker_delivers_across_threads(self):
+        broker = events.LocalBroker()
+
+        async def listen():
+            async with broker.subscribe(['receiver:1']) as queue:
+                publisher = threading.Thread(target=broker.publish, args=('receiver:1', {'type': 'ping'}))
+                publisher.start()
+                event = await asyncio.wait_for(queue.get(), 5)
+                publisher.join()
+            return event
+
+        self.assertEqual(asyncio.run(listen()), {'type': 'ping'})
+        self.assertEqual(broker._subscribers, {})
+
+    def test_event_stream_needs_login_and_asgi(self):
+        self.assertEqual(self.client.get(reverse('event_stream')).status_code, 401)
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = self.session_key
+        self.assertEqual(self.client.get(reverse('event_stream')).status_code, 204)
+
+    async def test_event_stream_sends_published_events(self):
+        self.async_client.cookies[settings.SESSION_COOKIE_NAME] = self.session_key
+        response = await self.async_client.get(reverse('event_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+
+        event = events.pickup_event(7, 'accepted', 3)
+        events.get_broker().publish(f'receiver:{self.pickups[0].receiver_id_id}', event)
+        events.get_broker().publish(f'receiver:{self.pickups[1].receiver_id_id}', events.pickup_event(8, 'rejected'))
+        self.assertEqual(await anext(stream), f'data: {json.dumps(event)}\n\n'.encode())
+        await stream.aclose()
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.donor = make_donor()
+        self.receivers = [make_receiver(f'r{i}') for i in range(2)]
+        self.donation = make_donation(self.donor)
+        self.pickups = [
+            PickupSchedule.objects.create(donation_id=self.donation, receiver_id=receiver,
+                                          scheduled_time=self.donation.expiry_time)
+            for receiver in self.receivers
+        ]
+
+    def log(self):
+        return list(ChangeEvent.objects.order_by('event_id').values_list('entity', 'object_id', 'action'))
+
+    def login(self, key, value):
+        session = self.client.session
+        session[key] = value
+        session.save()
+
+    def feed(self, cursor=0, limit=100):
+        return self.client.get(reverse('change_feed'), {'cursor': cursor, 'limit': limit}).json()
+
+    def test_creations_and_status_changes_are_recorded(self):
+        self.donation.quantity = 12
+        self.donation.save()  # Not a status change
+        accept_pickup(self.pickups[1])
+        first, second = (p.schedule_id for p in self.pickups)
+        self.assertEqual(self.log(), [
+            ('donation', self.donation.donation_id, 'created'),
+            ('pickup', first, 'created'),
+            ('pickup', second, 'created'),
+            ('donation', self.donation.donation_id, 'updated'),
+            ('pickup', first, 'updated'),
+            ('pickup', second, 'updated'),
+        ])
+        states = {e.object_id: e.state for e in ChangeEvent.objects.filter(entity='pickup', action='updated')}
+        self.assertEqual((states[first]['pickup_status'], states[second]['pickup_status']), ('rejected', 'accepted'))
+
+    def test_slot_assignment_is_recorded(self):
+        schedule_pickups()
+        for pickup in PickupSchedule.objects.all():
+            latest = ChangeEvent.objects.filter(entity='pickup', object_id=pickup.schedule_id).latest('event_id')
+            self.assertEqual((latest.action, latest.state['scheduled_time']),
+                             ('updated', pickup.scheduled_time.isoformat()))
+            self.assertNotEqual(pickup.scheduled_time, self.donation.expiry_time)
+
+    def test_feed_pages_through_visible_events(self):
+        self.login('receiver_id', self.receivers[0].receiver_id)
+        page = self.feed(limit=1)
+        self.assertEqual(([e['entity'] for e in page['events']], page['has_more']), (['donation'], True))
+        page = self.feed(cursor=page['cursor'], limit=1)
+        self.assertEqual(page['events'][0]['state']['schedule_id'], self.pickups[0].schedule_id)
+        # The other receiver's pickup is not in this feed
+        page = self.feed(cursor=page['cursor'])
+        self.assertEqual((page['events'], page['has_more']), ([], False))
+
+        accept_pickup(self.pickups[0])
+        page = self.feed(cursor=page['cursor'])
+        self.assertEqual([(e['entity'], e['action']) for e in page['events']],
+                         [('donation', 'updated'), ('pickup', 'updated')])
+
+        self.client.session.flush()
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get(reverse('change_feed')).status_code, 401)
+        self.login('donor_id', self.donor.donor_id)
+        self.assertEqual(len(self.feed()['events']), 6)
+        self.assertEqual(self.client.get(reverse('change_feed'), {'cursor': 'x'}).status_code, 400)
+
+    def test_compaction_keeps_the_latest_event_of_each_row(self):
+        accept_pickup(self.pickups[0])
+        cutoff = timezone.now() + timedelta(seconds=1)
+        self.donation.status = 'completed'
+        self.donation.save()
+        ChangeEvent.objects.filter(event_id=ChangeEvent.objects.latest('event_id').event_id) \
+            .update(created_at=cutoff + timedelta(days=1))
+
+        self.assertEqual(compact(cutoff, batch_size=2), 4)
+        first, second = (p.schedule_id for p in self.pickups)
+        self.assertEqual(self.log(), [
+            ('pickup', first, 'updated'),
+            ('pickup', second, 'updated'),
+            ('donation', self.donation.donation_id, 'updated'),
+        ])
+        self.assertEqual(compact(cutoff), 0)
+
+
+class AnalyticsSeriesTests(TestCase):
+    def setUp(self):
+        self.now = datetime(2026, 3, 15, 12, tzinfo=dt_timezone.utc)
+        donor = make_donor()
+        receiver = make_receiver()
+        for created, status in [((2026, 1, 31, 23, 30), 'rejected'), ((2026, 2, 1, 0, 10), 'accepted'),
+                                ((2026, 3, 2, 9), 'accepted'), ((2026, 3, 9, 9), 'pending')]:
+            donation = make_donation(donor, quantity=created[2])
+            moment = datetime(*created, tzinfo=dt_timezone.utc)
+            FoodDonation.objects.filter(pk=donation.pk).update(created_at=moment)
+            PickupSchedule.objects.create(donation_id=donation, receiver_id=receiver, scheduled_time=moment,
+                                          pickup_status=status)
+
+    def test_months_in_one_query_with_empty_buckets(self):
+        start = last_buckets_start(self.now, 'month', 4)
+        with self.assertNumQueries(1):
+            points = series(FoodDonation.objects.all(), 'created_at', 'month', start, self.now, quantity='quantity')
+        self.assertEqual([(label(p['start'], 'month', with_year=True), p['count'], p['quantity']) for p in points], [
+            ('Dec 2025', 0, 0), ('Jan 2026', 1, 31), ('Feb 2026', 1, 1), ('Mar 2026', 2, 11),
+        ])
+
+    def test_weeks_start_on_monday_with_success_rate(self):
+        start = last_buckets_start(self.now, 'week', 3)
+        points = series(PickupSchedule.objects.all(), 'scheduled_time', 'week', start, self.now,
+                        success=Q(pickup_status='accepted'))
+        self.assertEqual([(p['start'].date().isoformat(), p['count'], p['success_rate']) for p in points], [
+            ('2026-02-23', 0, 0), ('2026-03-02', 1, 100.0), ('2026-03-09', 1, 0.0),
+        ])
+
+    def test_chart_windows(self):
+        self.assertEqual(chart_window('week', self.now, self.now), (datetime(2026, 3, 9, tzinfo=dt_timezone.utc), 'day'))
+        self.assertEqual(chart_window('year', self.now, self.now), (datetime(2025, 4, 1, tzinfo=dt_timezone.utc), 'month'))
+        since = datetime(2024, 7, 20, tzinfo=dt_timezone.utc)
+        self.assertEqual(chart_window('all', self.now, since), (datetime(2024, 7, 1, tzinfo=dt_timezone.utc), 'month'))
+        self.assertEqual(len(bucket_starts(since, self.now, 'month')), 21)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.donors = [make_donor(f'd{i}') for i in range(2)]
+        self.receivers = [make_receiver(f'r{i}') for i in range(3)]
+
+    def rollups(self):
+        donations = set(DonationDaily.objects.filter(count__gt=0).values_list(
+            'day', 'donor_id', 'food_type', 'status', 'count', 'quantity'))
+        pickups = {
+            row[:-1] + (round(row[-1], 6),)
+            for row in PickupDaily.objects.filter(count__gt=0).values_list(
+                'day', 'receiver_id', 'donor_id', 'food_type', 'pickup_status', 'count', 'quantity', 'priority_total')
+        }
+        return donations, pickups
+
+    def request(self, donation, receiver, priority=0.5):
+        return PickupSchedule.objects.create(donation_id=donation, receiver_id=receiver, priority_score=priority,
+                                             scheduled_time=donation.expiry_time)
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        rice = make_donation(self.donors[0], quantity=10)
+        bread = make_donation(self.donors[0], food_type='Bread', quantity=4)
+        curry = make_donation(self.donors[1], food_type='Curry', quantity=7, hours=30)
+        pickups = [self.request(rice, receiver, 0.1 * (i + 1)) for i, receiver in enumerate(self.receivers)]
+        late = self.request(curry, self.receivers[0], 0.9)
+        self.request(bread, self.receivers[1], 0.3)
+        accept_pickup(pickups[1])
+        reject_pickup(late)
+        schedule_pickups()
+        curry.quantity = 8
+        curry.save()
+        bread.status = 'completed'
+        bread.save()
+
+        incremental = self.rollups()
+        rebuild()
+        self.assertEqual(self.rollups(), incremental)
+        donations, pickups = incremental
+        self.assertEqual(sum(row[4] for row in donations), 3)
+        self.assertEqual(sum(row[5] for row in pickups), 5)
+
+    def test_deletes_are_taken_off_the_rollups(self):
+        rice = make_donation(self.donors[0], quantity=10)
+        bread = make_donation(self.donors[1], food_type='Bread', quantity=4)
+        curry = make_donation(self.donors[1], food_type='Curry', quantity=7)
+        for receiver in self.receivers:
+            self.request(rice, receiver)
+        self.request(bread, self.receivers[0])
+        self.request(curry, self.receivers[1])
+
+        FoodDonation.objects.get(pk=rice.pk).delete()  # Cascades to its pickups
+        PickupSchedule.objects.filter(donation_id=bread).delete()
+        self.receivers[1].delete()  # Its pickups go with its own rows
+        self.donors[0].delete()
+        incremental = self.rollups()
+        rebuild()
+        self.assertEqual(self.rollups(), incremental)
+        self.assertEqual({row[2] for row in incremental[0]}, {'Bread', 'Curry'})
+        self.assertEqual(incremental[1], set())
+
+    def test_receiver_cascades_bump_the_donors_versions(self):
+        donation = make_donation(self.donors[0])
+        self.request(donation, self.receivers[0])
+        scopes = [f'donor:{self.donors[0].pk}', f'donor:{self.donors[1].pk}', f'receiver:{self.receivers[1].pk}']
+        before = caching.data_versions(*scopes)
+
+        self.receivers[0].delete()  # Cascades to its pickup and PickupDaily rows
+        after = caching.data_versions(*scopes)
+        self.assertNotEqual(after[0], before[0])
+        self.assertEqual(after[1:], before[1:])
+        self.assertEqual(self.rollups()[1], set())
+
+    def test_rebuild_command_regenerates_lost_rows(self):
+        donation = make_donation(self.donors[0])
+        self.request(donation, self.receivers[0])
+        expected = self.rollups()
+        DonationDaily.objects.all().delete()
+        PickupDaily.objects.update(count=0)
+
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertIn('Rebuilt 1 donation and 1 pickup rollup rows', out.getvalue())
+        self.assertEqual(self.rollups(), expected)
+
+    def test_rebuild_invalidates_every_chart(self):
+        before = caching.data_versions('rollups')
+        with self.captureOnCommitCallbacks(execute=True):
+            rebuild()
+        self.assertNotEqual(caching.data_versions('rollups'), before)
+
+    def test_pickups_move_to_their_slot_day(self):
+        donation = make_donation(self.donors[0], hours=72)
+        pickup = self.request(donation, self.receivers[0])
+        schedule_pickups()
+        pickup.refresh_from_db()
+        self.assertEqual(list(PickupDaily.objects.filter(count__gt=0).values_list('day', flat=True)),
+                         [timezone.localtime(pickup.scheduled_time).date()])
+
+
+class DataVersionTests(TransactionTestCase):
+    def bump_in_another_process(self, scope):
+        # A separate interpreter: its own cache, the same (test) database
+        probe = (
+            "import os, sys; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zero_waste.settings');"
+            "from django.conf import settings; settings.DATABASES['default']['NAME'] = sys.argv[1];"
+            "import django; django.setup();"
+            "from core.caching import bump_versions; bump_versions([sys.argv[2]])"
+        )
+        subprocess.run([sys.executable, '-c', probe, connection.settings_dict['NAME'], scope],
+                       cwd=settings.BASE_DIR, capture_output=True, check=True,
+                       env=dict(os.environ, ML_MODEL_WARMUP='0'))
+
+    def test_bumps_are_seen_by_other_processes(self):
+        never = caching.data_versions('donor:1', 'rollups')
+        self.assertEqual(never, [caching.UNVERSIONED] * 2)
+        self.bump_in_another_process('donor:1')
+        first, rollups = caching.data_versions('donor:1', 'rollups')
+        self.assertNotEqual(first, caching.UNVERSIONED)
+        self.assertEqual(rollups, caching.UNVERSIONED)
+        self.bump_in_another_process('donor:1')
+        self.assertNotEqual(caching.data_versions('donor:1')[0][0], first[0])
+
+    def test_rolled_back_bumps_are_not_seen(self):
+        caching.bump_versions(['donor:1'])
+        before = caching.data_versions('donor:1')
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            caching.bump_versions(['donor:1'])
+            raise RuntimeError
+        self.assertEqual(caching.data_versions('donor:1'), before)
+
+
+class GetOrComputeTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, delay=0.0):
+        self.calls += 1
+        time.sleep(delay)
+        return self.calls
+
+    def test_value_is_cached_until_it_expires(self):
+        self.assertEqual(caching.get_or_compute('k', self.compute, 30), 1)
+        self.assertEqual(caching.get_or_compute('k', self.compute, 30), 1)
+        with mock.patch.object(caching.time, 'time', return_value=time.time() + 31):
+            self.assertEqual(caching.get_or_compute('k', self.compute, 30), 2)
+
+    def test_concurrent_misses_compute_once(self):
+        barrier = threading.Barrier(8)
+        results = []
+
+        def load():
+            barrier.wait()
+            results.append(caching.get_or_compute('k', lambda: self.compute(delay=0.2), 30))
+
+        threads = [threading.Thread(target=load) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [1] * 8)
+
+    def test_expired_value_is_served_while_another_caller_recomputes(self):
+        caching.get_or_compute('k', self.compute, 30)
+        cache.add('k:lock', True)
+        with mock.patch.object(caching.time, 'time', return_value=time.time() + 31):
+            self.assertEqual(caching.get_or_compute('k', self.compute, 30), 1)
+        self.assertEqual(self.calls, 1)
@@ -0,0 +1,49 @@
+"""
+Training data from pickup history, for ML_Model.training.
+
+Every decided PickupSchedule (accepted or rejected) becomes one row: the
+model inputs as they were when the donation was posted, and a target of
+1.0 if the pickup was accepted and 0.0 if it was rejected. Rows are read
+with keyset pagination so history of any size is streamed in chunks.
+"""
+import pandas as pd
+
+from ML_Model.training import INPUT_COLUMNS, TARGET_COLUMN
+from .models import PickupSchedule
+from .geo import haversine_km
+
+OUTCOME_TARGETS = {'accepted': 1.0, 'rejected': 0.0}
+
+
+def iter_outcome_chunks(chunk_size=50_000):
+    """Yield DataFrames with INPUT_COLUMNS and TARGET_COLUMN."""
+    last_id = 0
+    while True:
+        rows = list(
+            PickupSchedule.objects.filter(
+                schedule_id__gt=last_id, pickup_status__in=list(OUTCOME_TARGETS),
+            )
+            .order_by('schedule_id')
+            .values_list(
+                'schedule_id', 'pickup_status',
+                'receiver_id__capacity', 'receiver_id__location_lat', 'receiver_id__location_long',
+                'donation_id__donor_id__location_lat', 'donation_id__donor_id__location_long',
+                'donation_id__food_type', 'donation_id__quantity',
+                'donation_id__expiry_time', 'donation_id__created_at',
+            )[:chunk_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        df = pd.DataFrame(rows, columns=[
+            'schedule_id', 'pickup_status', 'receiver_capacity', 'receiver_lat', 'receiver_long',
+            'donor_lat', 'donor_long', 'food_type', 'quantity', 'expiry_time', 'created_at',
+        ])
+        df['receiver_distance'] = haversine_km(
+            df['receiver_lat'].to_numpy(), df['receiver_long'].to_numpy(),
+            df['donor_lat'].to_numpy(), df['donor_long'].to_numpy(),
+        )
+        df['time_to_expiry'] = (df['expiry_time'] - df['created_at']).dt.total_seconds() / 3600
+        df[TARGET_COLUMN] = df['pickup_status'].map(OUTCOME_TARGETS)
+        yield df[INPUT_COLUMNS + [TARGET_COLUMN]]
@@ -1,3 +1,78 @@
-from django.shortcuts import render
+import asyncio
+import json
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+
+from .changefeed import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, changes_since
+from .events import donor_channel, get_broker, receiver_channel
+
+# A comment line this often keeps proxies from closing an idle stream
+KEEPALIVE_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+
+def _channels(session):
+    channels = []
+    if 'donor_id' in session:
+        channels.append(donor_channel(session['donor_id']))
+    if 'receiver_id' in session:
+        channels.append(receiver_channel(session['receiver_id']))
+    return channels
+
+
+async def _stream(channels):
+    async with get_broker().subscribe(channels) as queue:
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield f'data: {json.dumps(event)}\n\n'
+
+
+async def event_stream(request):
+    """Pickup events of the logged-in donor or receiver, as Server-Sent Events."""
+    channels = await sync_to_async(_channels)(request.session)
+    if not channels:
+        return HttpResponse(status=401)
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the stream would hold a worker for as long as the page is
+        # open; 204 tells EventSource to stop and the page polls instead
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(_stream(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: send events as they come
+    return response
+
+
+def change_feed(request):
+    """Donation and pickup changes after ?cursor=, a page (?limit=) at a time."""
+    donor_id = request.session.get('donor_id')
+    receiver_id = request.session.get('receiver_id')
+    if donor_id is None and receiver_id is None:
+        return JsonResponse({'error': 'Not logged in'}, status=401)
+    try:
+        cursor = int(request.GET.get('cursor', 0))
+        limit = min(max(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'cursor and limit must be integers'}, status=400)
+
+    events, cursor, has_more = changes_since(cursor, limit, donor_id=donor_id, receiver_id=receiver_id)
+    return JsonResponse({
+        'cursor': cursor,
+        'has_more': has_more,
+        'events': [
+            {
+                'event_id': event.event_id,
+                'entity': event.entity,
+                'action': event.action,
+                'created_at': event.created_at.isoformat(),
+                'state': event.state,
+            }
+            for event in events
+        ],
+    })
@@ -1,3 +1,170 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from unittest import mock
+
+from core import candidates
+from core.rollups import rebuild
+from core.models import DonationCandidate, Donor, FoodDonation, PickupSchedule, Receiver
+
+
+class DonationEntryTests(TestCase):
+    def setUp(self):
+        donor = Donor.objects.create(name='donor', contact='9999999999', location_lat=12.97,
+                                     location_long=77.59, password='Secret123')
+        self.receiver = Receiver.objects.create(name='receiver', contact='8888888888', capacity=40,
+                                                location_lat=12.93, location_long=77.62, password='Secret123')
+        session = self.client.session
+        session['donor_id'] = donor.donor_id
+        session.save()
+
+    def post_donation(self):
+        expiry = (timezone.now() + timedelta(days=2)).date().isoformat()
+        return self.client.post(reverse('donors:donation_entry'),
+                                {'food_type': 'Rice', 'quantity': 10, 'unit': 'kg', 'expiry_time': expiry})
+
+    def test_candidates_are_computed_off_the_request_thread(self):
+        executor = mock.Mock()
+        with mock.patch.object(candidates, '_get_executor', return_value=executor), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.post_donation()
+        self.assertRedirects(response, reverse('donors:dashboard'), fetch_redirect_response=False)
+        donation = FoodDonation.objects.get()
+        executor.submit.assert_called_once_with(candidates._update_in_background, [donation.donation_id])
+        self.assertFalse(DonationCandidate.objects.exists())
+
+    @override_settings(DONATION_CANDIDATES_ASYNC=False)
+    def test_new_donation_reaches_nearby_receivers(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_donation()
+        candidate = DonationCandidate.objects.get()
+        self.assertEqual((candidate.receiver_id, candidate.rank), (self.receiver, 1))
+
+        session = self.client.session
+        session['receiver_id'] = self.receiver.receiver_id
+        session.save()
+        data = self.client.get(reverse('receivers:new_for_you')).json()
+        self.assertEqual([d['donation_id'] for d in data['donations']], [candidate.donation_id_id])
+
+
+class DonorDashboardTests(TestCase):
+    def setUp(self):
+        self.donor = Donor.objects.create(name='donor', contact='9999999999', location_lat=12.97,
+                                          location_long=77.59, password='Secret123')
+        self.donation = FoodDonation.objects.create(donor_id=self.donor, food_type='Rice', quantity=10,
+                                                    expiry_time=timezone.now() + timedelta(hours=6))
+        self.pickups = [
+            PickupSchedule.objects.create(
+                donation_id=self.donation, scheduled_time=self.donation.expiry_time,
+                receiver_id=Receiver.objects.create(name=f'r{i}', contact='8888888888', capacity=40,
+                                                    location_lat=12.93, location_long=77.62, password='Secret123'),
+            )
+            for i in range(2)
+        ]
+        session = self.client.session
+        session['donor_id'] = self.donor.donor_id
+        session.save()
+
+    def test_accept_rejects_other_requests_and_blocks_new_ones(self):
+        self.client.post(reverse('donors:dashboard'), {'schedule_id': self.pickups[0].schedule_id, 'action': 'accept'})
+        self.assertEqual([p.pickup_status for p in PickupSchedule.objects.order_by('schedule_id')],
+                         ['accepted', 'rejected'])
+
+        late = Receiver.objects.create(name='late', contact='7777777777', capacity=40,
+                                       location_lat=12.93, location_long=77.62, password='Secret123')
+        session = self.client.session
+        session['receiver_id'] = late.receiver_id
+        session.save()
+        self.client.post(reverse('receivers:schedule_pickup', args=[self.donation.donation_id]))
+        self.assertFalse(PickupSchedule.objects.filter(receiver_id=late).exists())
+
+
+class DonorAnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        donor = Donor.objects.create(name='donor', contact='9999999999', location_lat=12.97,
+                                     location_long=77.59, password='Secret123')
+        now = timezone.now()
+        Donor.objects.filter(pk=donor.pk).update(created_at=now - timedelta(days=520))
+        for days_ago in (0, 3, 20, 45, 200, 500):
+            donation = FoodDonation.objects.create(donor_id=donor, food_type='Rice', quantity=10,
+                                                   expiry_time=now + timedelta(days=1))
+            FoodDonation.objects.filter(pk=donation.pk).update(created_at=now - timedelta(days=days_ago))
+        rebuild()  # The backdating bypassed the rollups
+        session = self.client.session
+        session['donor_id'] = donor.donor_id
+        session.save()
+
+    def query_counts(self, url_name):
+        counts = {}
+        for period in ('week', 'month', 'year', 'all'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(url_name), {'period': period})
+            self.assertEqual(response.status_code, 200)
+            counts[period] = len(queries)
+        return counts
+
+    def test_chart_queries_do_not_grow_with_the_period(self):
+        for url_name in ('donors:analytics', 'donors:analytics_data'):
+            counts = self.query_counts(url_name)
+            self.assertEqual(len(set(counts.values())), 1, (url_name, counts))
+
+    def test_all_time_trend_has_every_month(self):
+        trend = self.client.get(reverse('donors:analytics_data'), {'period': 'all'}).json()['monthly_trend']
+        self.assertGreaterEqual(len(trend), 17)
+        self.assertEqual(sum(point['count'] for point in trend), 6)
+
+
+class ChartCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.donor = Donor.objects.create(name='donor', contact='9999999999', location_lat=12.97,
+                                          location_long=77.59, password='Secret123')
+        FoodDonation.objects.create(donor_id=self.donor, food_type='Rice', quantity=10,
+                                    expiry_time=timezone.now() + timedelta(days=1))
+        session = self.client.session
+        session['donor_id'] = self.donor.donor_id
+        session.save()
+
+    def fetch(self, **headers):
+        return self.client.get(reverse('donors:analytics_data'), {'period': 'month'}, headers=headers)
+
+    def test_repeat_loads_cost_only_the_session_and_versions(self):
+        first = self.fetch()
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('private', first['Cache-Control'])
+        self.assertTrue(first.has_header('Last-Modified'))
+
+        with self.assertNumQueries(2):
+            not_modified = self.fetch(if_none_match=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        with self.assertNumQueries(2):
+            again = self.fetch()
+        self.assertEqual(again.content, first.content)
+
+    def test_new_donation_changes_the_version(self):
+        first = self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            FoodDonation.objects.create(donor_id=self.donor, food_type='Bread', quantity=5,
+                                        expiry_time=timezone.now() + timedelta(days=1))
+        response = self.fetch(if_none_match=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(sorted(item['food_type'] for item in response.json()['food_types']), ['Bread', 'Rice'])
+
+    def test_versions_are_per_donor_and_period(self):
+        first = self.fetch()
+        other = Donor.objects.create(name='other', contact='7777777777', location_lat=12.9,
+                                     location_long=77.5, password='Secret123')
+        with self.captureOnCommitCallbacks(execute=True):
+            FoodDonation.objects.create(donor_id=other, food_type='Bread', quantity=5,
+                                        expiry_time=timezone.now() + timedelta(days=1))
+        self.assertEqual(self.fetch(if_none_match=first['ETag']).status_code, 304)
+        week = self.client.get(reverse('donors:analytics_data'), {'period': 'week'})
+        self.assertNotEqual(week['ETag'], first['ETag'])
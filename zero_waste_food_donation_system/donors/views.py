@@ -10,7 +10,11 @@ from django.contrib import messages
 from django.shortcuts import render, redirect
 from django.contrib.auth.hashers import make_password, check_password
 from .forms import DonorRegistrationForm, DonationEntryForm, ProfileUpdateForm
-from core.models import Donor, DonorAddress, FoodDonation, PickupSchedule
+from core.models import DonationDaily, Donor, DonorAddress, FoodDonation, PickupDaily, PickupSchedule
+from core.analytics import PERIODS, chart_data_view, chart_window, label, series
+from core.rollups import rollup_day
+from core.candidates import enqueue_candidates
+from core.pickups import accept_pickup, reject_pickup
 import logging
 from django.db.models import Count, Sum, Avg, Q
 from django.utils import timezone
@@ -70,28 +74,13 @@ def donor_dashboard(request):
         if schedule_id:
             pickup = PickupSchedule.objects.get(schedule_id=schedule_id)
             if action == 'accept':
-                # Accept this receiver
-                pickup.pickup_status = 'accepted'
-                pickup.save()
+                # One transaction; the other pending requests are rejected with it
+                # Receivers are notified by core.events.notify_receiver
+                if not accept_pickup(pickup):
+                    messages.error(request, 'This donation has already been reserved.')
 
-                # Mark donation as reserved and store receiver
-                donation = pickup.donation_id
-                donation.status = 'reserved'
-                donation.assigned_receiver = pickup.receiver_id
-                donation.save()
-
-                # Reject other pending pickups for this donation
-                other_pickups = PickupSchedule.objects.filter(
-                    donation_id=donation, pickup_status='pending'
-                ).exclude(schedule_id=schedule_id)
-                for op in other_pickups:
-                    op.pickup_status = 'rejected'
-                    op.save()
-                    # Here you can send notification to receivers (WebSocket/Email)
-                
             elif action == 'reject':
-                pickup.pickup_status = 'rejected'
-                pickup.save()
+                reject_pickup(pickup)
         return redirect('donors:dashboard')
 
     return render(request, 'dashboard.html', {
@@ -112,6 +101,7 @@ def donation_entry(request):
             donation = form.save(commit=False)
             donation.donor_id = Donor.objects.get(donor_id=request.session['donor_id'])
             donation.save()
+            enqueue_candidates(donation)
             logger.debug("Donation saved: ID=%s, Donor=%s", donation.donation_id, donation.donor_id.donor_id)
             return redirect('donors:dashboard')
     else:
@@ -138,14 +128,12 @@ def profile(request):
     return render(request, 'profile.html', {'user': donor, 'addresses': addresses, 'form': form})
 
 def check_requests(request, donor_id):
+    # Polling fallback for core.views.event_stream
     pickups = PickupSchedule.objects.filter(donation_id__donor_id=donor_id, pickup_status='pending')
     if pickups.exists():
         return JsonResponse({'message': 'New pickup request available.'})
     return JsonResponse({'message': ''})
 
-def notify_receiver(receiver_id, schedule_id, status):
-    pass  # Placeholder for WebSocket or real-time notification
-
 def add_address(request):
     if 'donor_id' not in request.session:
         return redirect('donors:donor_login')
@@ -176,61 +164,53 @@ def donor_analytics(request):
     else:  # all time
         start_date = donor.created_at
     
-    # Get donations data
-    donations = FoodDonation.objects.filter(
+    # Daily totals of the period (core.rollups)
+    days = DonationDaily.objects.filter(
         donor_id=donor,
-        created_at__range=[start_date, end_date]
+        day__range=[rollup_day(start_date), rollup_day(end_date)]
     )
     
     # Basic statistics
-    total_donations = donations.count()
-    total_quantity = donations.aggregate(total=Sum('quantity'))['total'] or 0
+    totals = days.aggregate(count=Sum('count'), quantity=Sum('quantity'))
+    total_donations = totals['count'] or 0
+    total_quantity = totals['quantity'] or 0
     
     # Status distribution
-    status_counts = donations.values('status').annotate(count=Count('status'))
+    status_counts = days.values('status').annotate(count=Sum('count')).filter(count__gt=0)
     
     # Food type distribution
-    food_type_dist = donations.values('food_type').annotate(
-        count=Count('food_type'),
+    food_type_dist = days.values('food_type').annotate(
+        count=Sum('count'),
         total_quantity=Sum('quantity')
-    )
+    ).filter(count__gt=0)
     
-    # Monthly trend data
-    monthly_data = []
-    current = start_date
-    while current <= end_date:
-        month_start = current.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        if period == 'year':
-            next_month = month_start + timedelta(days=32)
-            month_end = next_month.replace(day=1) - timedelta(days=1)
-        else:
-            month_end = month_start + timedelta(days=30)
-        
-        month_donations = donations.filter(
-            created_at__range=[month_start, month_end]
-        )
-        monthly_data.append({
-            'month': month_start.strftime('%b %Y'),
-            'count': month_donations.count(),
-            'quantity': month_donations.aggregate(total=Sum('quantity'))['total'] or 0
-        })
-        
-        if period == 'year':
-            current = next_month
-        else:
-            break  # For shorter periods, show single month
+    # Trend data
+    chart_start, unit = chart_window(period, end_date, donor.created_at)
+    monthly_data = [
+        {'month': label(point['start'], unit, with_year=period not in PERIODS),
+         'count': point['count'], 'quantity': point['quantity']}
+        for point in series(DonationDaily.objects.filter(donor_id=donor), 'day', unit,
+                            chart_start, end_date, quantity='quantity', counted='count')
+    ]
     
     # Pickup statistics
-    pickups = PickupSchedule.objects.filter(donation_id__donor_id=donor)
-    pickup_status_dist = pickups.values('pickup_status').annotate(count=Count('pickup_status'))
+    pickups = PickupDaily.objects.filter(donor_id=donor)
+    pickup_status_dist = pickups.values('pickup_status').annotate(count=Sum('count')).filter(count__gt=0)
     
     # Success rate
-    successful_pickups = pickups.filter(pickup_status='accepted').count()
-    total_pickup_requests = pickups.count()
+    pickup_totals = pickups.aggregate(
+        total=Sum('count'),
+        successful=Sum('count', filter=Q(pickup_status='accepted'))
+    )
+    successful_pickups = pickup_totals['successful'] or 0
+    total_pickup_requests = pickup_totals['total'] or 0
     success_rate = (successful_pickups / total_pickup_requests * 100) if total_pickup_requests > 0 else 0
     
     # Recent activity
-    recent_donations = donations.order_by('-created_at')[:5]
+    recent_donations = FoodDonation.objects.filter(
+        donor_id=donor,
+        created_at__range=[start_date, end_date]
+    ).order_by('-created_at')[:5]
     
     context = {
         'user_type': 'donor',
@@ -249,6 +229,7 @@ def donor_analytics(request):
     
     return render(request, 'analytics/donor_analytics.html', context)
 
+@chart_data_view('donor')
 def donor_analytics_data(request):
     """API endpoint for chart data"""
     if 'donor_id' not in request.session:
@@ -267,127 +248,30 @@ def donor_analytics_data(request):
     else:
         start_date = donor.created_at
     
-    # Get donations with proper date filtering
-    donations = FoodDonation.objects.filter(
+    # Daily totals of the period (core.rollups)
+    days = DonationDaily.objects.filter(
         donor_id=donor,
-        created_at__gte=start_date,
-        created_at__lte=end_date
+        day__range=[rollup_day(start_date), rollup_day(end_date)]
     )
     
-    print(f"DEBUG: Found {donations.count()} donations between {start_date} and {end_date}")
-    
     # Food type distribution for chart
-    food_types = list(donations.values('food_type').annotate(
-        count=Count('food_type'),
+    food_types = list(days.values('food_type').annotate(
+        count=Sum('count'),
         quantity=Sum('quantity')
-    ))
+    ).filter(count__gt=0))
     
     # Status distribution for chart
-    status_data = list(donations.values('status').annotate(count=Count('status')))
+    status_data = list(days.values('status').annotate(count=Sum('count')).filter(count__gt=0))
     
-    # Monthly trend for chart - IMPROVED VERSION
-    monthly_trend = []
-    
-    if period == 'year':
-        # Generate data for each month of the year
-        for i in range(12):
-            # Calculate month start and end
-            month_date = end_date.replace(day=1)  # Start from current month
-            target_month = month_date.month - i
-            target_year = month_date.year
-            
-            if target_month <= 0:
-                target_month += 12
-                target_year -= 1
-            
-            month_start = timezone.datetime(target_year, target_month, 1, tzinfo=timezone.get_current_timezone())
-            if target_month == 12:
-                month_end = timezone.datetime(target_year + 1, 1, 1, tzinfo=timezone.get_current_timezone()) - timedelta(seconds=1)
-            else:
-                month_end = timezone.datetime(target_year, target_month + 1, 1, tzinfo=timezone.get_current_timezone()) - timedelta(seconds=1)
-            
-            # Filter donations for this month
-            month_donations = donations.filter(
-                created_at__gte=month_start,
-                created_at__lte=month_end
-            )
-            
-            monthly_trend.append({
-                'month': month_start.strftime('%b'),
-                'count': month_donations.count(),
-                'quantity': month_donations.aggregate(total=Sum('quantity'))['total'] or 0
-            })
-        
-        monthly_trend.reverse()  # Reverse to show chronological order
-    
-    elif period == 'month':
-        # Generate data for last 30 days (weekly chunks)
-        for i in range(4):  # 4 weeks
-            week_end = end_date - timedelta(days=i * 7)
-            week_start = week_end - timedelta(days=6)
-            
-            week_donations = donations.filter(
-                created_at__gte=week_start,
-                created_at__lte=week_end
-            )
-            
-            monthly_trend.append({
-                'month': week_start.strftime('%m/%d'),
-                'count': week_donations.count(),
-                'quantity': week_donations.aggregate(total=Sum('quantity'))['total'] or 0
-            })
-        
-        monthly_trend.reverse()
-    
-    elif period == 'week':
-        # Generate data for last 7 days
-        for i in range(7):
-            day = end_date - timedelta(days=6 - i)  # Start from oldest to newest
-            day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day.replace(hour=23, minute=59, second=59, microsecond=999999)
-            
-            day_donations = donations.filter(
-                created_at__gte=day_start,
-                created_at__lte=day_end
-            )
-            
-            monthly_trend.append({
-                'month': day_start.strftime('%a'),
-                'count': day_donations.count(),
-                'quantity': day_donations.aggregate(total=Sum('quantity'))['total'] or 0
-            })
-    
-    else:  # all time
-        # Group by month for all time
-        all_donations = FoodDonation.objects.filter(donor_id=donor)
-        dates = all_donations.dates('created_at', 'month')
-        
-        for date in dates:
-            month_start = date.replace(day=1)
-            if date.month == 12:
-                month_end = date.replace(year=date.year + 1, month=1, day=1) - timedelta(seconds=1)
-            else:
-                month_end = date.replace(month=date.month + 1, day=1) - timedelta(seconds=1)
-            
-            month_donations = all_donations.filter(
-                created_at__gte=month_start,
-                created_at__lte=month_end
-            )
-            
-            monthly_trend.append({
-                'month': month_start.strftime('%b %Y'),
-                'count': month_donations.count(),
-                'quantity': month_donations.aggregate(total=Sum('quantity'))['total'] or 0
-            })
-    
-    # If still no data, use sample data for demonstration
-    if not monthly_trend and donations.exists():
-        # Only use sample data if there are actual donations but no trend data
-        monthly_trend = [
-            {'month': 'Jan', 'count': 5, 'quantity': 25},
-            {'month': 'Feb', 'count': 8, 'quantity': 40},
-            {'month': 'Mar', 'count': 12, 'quantity': 60},
-        ]
+    # Trend for chart: days of the week, weeks of the month, months of the year
+    # or of all time, from one query
+    chart_start, unit = chart_window(period, end_date, donor.created_at)
+    monthly_trend = [
+        {'month': label(point['start'], unit, with_year=period not in PERIODS),
+         'count': point['count'], 'quantity': point['quantity']}
+        for point in series(DonationDaily.objects.filter(donor_id=donor), 'day', unit,
+                            chart_start, end_date, quantity='quantity', counted='count')
+    ]
     
     response_data = {
         'food_types': food_types,
@@ -395,6 +279,4 @@ def donor_analytics_data(request):
         'monthly_trend': monthly_trend,
     }
     
-    print(f"DEBUG: Sending response - Food types: {len(food_types)}, Status: {len(status_data)}, Trend: {len(monthly_trend)}")
-    
     return JsonResponse(response_data)
\ No newline at end of file
@@ -1,3 +1,228 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from unittest import mock
+
+from core.models import Donor, Receiver, FoodDonation, PickupSchedule
+from core import routing
+from core.events import pickup_event
+from core.scoring import score_donations
+
+
+class ReceiverDashboardTests(TestCase):
+    def setUp(self):
+        self.donor = Donor.objects.create(name='donor', contact='9999999999', location_lat=12.97,
+                                          location_long=77.59, password='Secret123')
+        self.receiver = Receiver.objects.create(name='receiver', contact='8888888888', capacity=40,
+                                                location_lat=12.93, location_long=77.62,
+                                                password='Secret123')
+        self.donations = [
+            FoodDonation.objects.create(donor_id=self.donor, food_type=food_type, quantity=10 + i,
+                                        expiry_time=timezone.now() + timedelta(hours=2 + i))
+            for i, food_type in enumerate(['Rice', 'Bread', 'Curry'])
+        ]
+        session = self.client.session
+        session['receiver_id'] = self.receiver.receiver_id
+        session.save()
+
+    def test_dashboard_scores_available_donations(self):
+        response = self.client.get(reverse('receivers:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        shown = {d.donation_id: d.priority_score for d in response.context['available_donations']}
+        expected = score_donations(self.donations, self.receiver)
+        for donation, score in zip(self.donations, expected):
+            self.assertAlmostEqual(shown[donation.donation_id], score, places=3)
+
+    def test_dashboard_radius_limits_donations(self):
+        far_donor = Donor.objects.create(name='far', contact='7777777777', location_lat=19.07,
+                                         location_long=72.87, password='Secret123')
+        FoodDonation.objects.create(donor_id=far_donor, food_type='Rice', quantity=5,
+                                    expiry_time=timezone.now() + timedelta(hours=3))
+
+        response = self.client.get(reverse('receivers:dashboard'))
+        self.assertEqual(response.context['available_donations'], self.donations)
+        response = self.client.get(reverse('receivers:dashboard'), {'radius_km': 0})
+        self.assertEqual(len(response.context['available_donations']), 4)
+        with self.settings(RECEIVER_DASHBOARD_RADIUS_KM=None):
+            response = self.client.get(reverse('receivers:dashboard'))
+        self.assertEqual(len(response.context['available_donations']), 4)
+
+    def test_repeat_dashboard_load_does_not_write_scores(self):
+        self.client.get(reverse('receivers:dashboard'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('receivers:dashboard'))
+        writes = [q['sql'] for q in queries.captured_queries
+                  if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+                  and 'django_session' not in q['sql']]
+        self.assertEqual(writes, [])
+
+    def test_schedule_pickup_uses_batch_score(self):
+        donation = self.donations[0]
+        self.client.post(reverse('receivers:schedule_pickup', args=[donation.donation_id]))
+        pickup = PickupSchedule.objects.get(donation_id=donation)
+        expected = score_donations([donation], self.receiver)[0]
+        self.assertAlmostEqual(pickup.priority_score, expected, places=3)
+
+
+class PickupRouteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.receiver = Receiver.objects.create(name='receiver', contact='8888888888', capacity=40,
+                                                location_lat=12.93, location_long=77.62,
+                                                password='Secret123')
+        # All on one meridian; the farthest donation expires in half an hour
+        for i, (lat, hours) in enumerate([(12.99, 0.5), (12.95, 5), (12.97, 4)]):
+            self.accept(lat, hours, name=f'donor{i}')
+        session = self.client.session
+        session['receiver_id'] = self.receiver.receiver_id
+        session.save()
+
+    def accept(self, lat, hours, name):
+        donor = Donor.objects.create(name=name, contact='9999999999', location_lat=lat,
+                                     location_long=77.62, password='Secret123')
+        donation = FoodDonation.objects.create(donor_id=donor, food_type='Rice', quantity=10, status='reserved',
+                                               expiry_time=timezone.now() + timedelta(hours=hours))
+        return PickupSchedule.objects.create(donation_id=donation, receiver_id=self.receiver,
+                                             scheduled_time=donation.expiry_time, pickup_status='accepted')
+
+    def test_route_visits_accepted_pickups_in_order(self):
+        data = self.client.get(reverse('receivers:pickup_route')).json()
+        self.assertEqual([stop['donor'] for stop in data['stops']], ['donor0', 'donor2', 'donor1'])
+        self.assertEqual(data['late_stops'], 0)
+        self.assertGreater(data['total_km'], 2 * self.receiver.calculate_distance(12.99, 77.62) - 0.01)
+
+    def test_route_is_cached_until_pickups_change(self):
+        self.client.get(reverse('receivers:pickup_route'))
+        with mock.patch.object(routing, 'plan_route', wraps=routing.plan_route) as plan:
+            self.client.get(reverse('receivers:pickup_route'))
+            self.assertEqual(plan.call_count, 0)
+            self.accept(12.94, 3, name='donor3')
+            data = self.client.get(reverse('receivers:pickup_route')).json()
+            self.assertEqual(plan.call_count, 1)
+        self.assertEqual(len(data['stops']), 4)
+
+    def test_requires_login(self):
+        self.client.session.flush()
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get(reverse('receivers:pickup_route')).status_code, 401)
+
+
+class CheckNotificationTests(TestCase):
+    def setUp(self):
+        self.receiver = Receiver.objects.create(name='receiver', contact='8888888888', capacity=40,
+                                                location_lat=12.93, location_long=77.62,
+                                                password='Secret123')
+        donor = Donor.objects.create(name='donor', contact='9999999999', location_lat=12.97,
+                                     location_long=77.59, password='Secret123')
+        self.pickups = []
+        for status in ('accepted', 'rejected', 'pending'):
+            donation = FoodDonation.objects.create(donor_id=donor, food_type='Rice', quantity=10,
+                                                   expiry_time=timezone.now() + timedelta(hours=5))
+            self.pickups.append(PickupSchedule.objects.create(
+                donation_id=donation, receiver_id=self.receiver,
+                scheduled_time=donation.expiry_time, pickup_status=status,
+            ))
+
+    def check(self):
+        url = reverse('receivers:check_notification', args=[self.receiver.receiver_id])
+        return self.client.get(url).json()['message']
+
+    def test_reports_the_newest_decided_pickup(self):
+        self.assertEqual(self.check(), pickup_event(self.pickups[1].schedule_id, 'rejected')['message'])
+        newest = self.pickups[2]
+        newest.pickup_status = 'accepted'
+        newest.save()
+        self.assertEqual(self.check(), pickup_event(newest.schedule_id, 'accepted')['message'])
+
+    def test_pending_pickups_are_not_reported(self):
+        PickupSchedule.objects.update(pickup_status='pending')
+        self.assertEqual(self.check(), '')
+
+
+class ReceiverAnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        donor = Donor.objects.create(name='donor', contact='9999999999', location_lat=12.97,
+                                     location_long=77.59, password='Secret123')
+        receiver = Receiver.objects.create(name='receiver', contact='8888888888', capacity=40,
+                                           location_lat=12.93, location_long=77.62, password='Secret123')
+        now = timezone.now()
+        Receiver.objects.filter(pk=receiver.pk).update(created_at=now - timedelta(days=520))
+        for days_ago, status in ((0, 'pending'), (3, 'rejected'), (20, 'pending'), (45, 'rejected'),
+                                 (200, 'rejected'), (500, 'pending')):
+            donation = FoodDonation.objects.create(donor_id=donor, food_type='Rice', quantity=10,
+                                                   expiry_time=now + timedelta(days=1))
+            PickupSchedule.objects.create(donation_id=donation, receiver_id=receiver,
+                                          scheduled_time=now - timedelta(days=days_ago), pickup_status=status)
+        session = self.client.session
+        session['receiver_id'] = receiver.receiver_id
+        session.save()
+
+    def add_accepted(self, count, quantity=3):
+        donor, receiver = Donor.objects.get(), Receiver.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):  # Bumps the receiver's data version
+            for i in range(count):
+                donation = FoodDonation.objects.create(donor_id=donor, food_type=['Rice', 'Bread', 'Curry'][i % 3],
+                                                       quantity=quantity, expiry_time=timezone.now() + timedelta(days=1))
+                PickupSchedule.objects.create(donation_id=donation, receiver_id=receiver, pickup_status='accepted',
+                                              scheduled_time=timezone.now() - timedelta(hours=1))
+
+    def query_count(self, url_name, period='month'):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name), {'period': period})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_chart_queries_do_not_grow_with_the_period(self):
+        self.add_accepted(3)
+        for url_name in ('receivers:analytics', 'receivers:analytics_data'):
+            counts = {period: self.query_count(url_name, period) for period in ('week', 'month', 'year', 'all')}
+            self.assertEqual(len(set(counts.values())), 1, (url_name, counts))
+
+    def test_query_count_does_not_grow_with_pickups(self):
+        # Session, receiver, then the rollup aggregates: totals, food types,
+        # statuses and the trend, plus the 5 recent pickups with their donations;
+        # the chart data also reads its data versions
+        self.add_accepted(1)
+        with self.assertNumQueries(7):
+            self.client.get(reverse('receivers:analytics'))
+        with self.assertNumQueries(6):
+            self.client.get(reverse('receivers:analytics_data'))
+        self.add_accepted(30)
+        with self.assertNumQueries(7):
+            self.client.get(reverse('receivers:analytics'))
+        with self.assertNumQueries(6):
+            self.client.get(reverse('receivers:analytics_data'))
+
+    def test_food_types_and_capacity_are_aggregated(self):
+        self.add_accepted(5, quantity=4)
+        data = self.client.get(reverse('receivers:analytics_data')).json()
+        self.assertEqual(sorted((item['food_type'], item['quantity']) for item in data['food_data']),
+                         [('Bread', 8), ('Curry', 4), ('Rice', 8)])
+        context = self.client.get(reverse('receivers:analytics')).context
+        self.assertEqual(context['total_quantity'], 20)
+        self.assertEqual(context['capacity_utilization'], 50.0)
+
+    def test_trend_buckets(self):
+        week = self.client.get(reverse('receivers:analytics_data'), {'period': 'week'}).json()['monthly_trend']
+        self.assertEqual(len(week), 7)
+        everything = self.client.get(reverse('receivers:analytics_data'), {'period': 'all'}).json()['monthly_trend']
+        self.assertEqual(sum(point['total'] for point in everything), 6)
+        self.assertEqual(sum(point['successful'] for point in everything), 0)
 
-# Create your tests here.
+    def test_chart_data_is_revalidated_after_a_pickup_changes(self):
+        first = self.client.get(reverse('receivers:analytics_data'))
+        self.assertEqual(self.client.get(reverse('receivers:analytics_data'),
+                                         headers={'if_none_match': first['ETag']}).status_code, 304)
+        pickup = PickupSchedule.objects.filter(pickup_status='pending').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            pickup.pickup_status = 'accepted'
+            pickup.save()
+        response = self.client.get(reverse('receivers:analytics_data'), headers={'if_none_match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(point['successful'] for point in response.json()['monthly_trend']), 1)
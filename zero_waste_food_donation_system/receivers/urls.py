@@ -10,6 +10,8 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('check_notification/<int:receiver_id>/', views.check_notification, name='check_notification'),
     path('schedule_pickup/<int:donation_id>/', views.schedule_pickup, name='schedule_pickup'),
+    path('route/', views.pickup_route, name='pickup_route'),
+    path('new_for_you/', views.new_for_you, name='new_for_you'),
         # Analytics URLs
     path('analytics/', views.receiver_analytics, name='analytics'),
     path('analytics/data/', views.receiver_analytics_data, name='analytics_data'),
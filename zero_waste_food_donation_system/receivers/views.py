@@ -1,9 +1,19 @@
 from django.contrib import messages
 from .forms import ReceiverRegistrationForm, ProfileUpdateForm , CapacityUpdateForm
-from core.models import Receiver, FoodDonation, PickupSchedule, ReceiverAddress
+from core.models import Receiver, FoodDonation, PickupDaily, PickupSchedule, ReceiverAddress
 from django.http import JsonResponse
-from ML_Model.ml_model import priority_model, food_type_encoder, scaler
-import pandas as pd
+from core.score_store import get_priority_scores
+from core.analytics import PERIODS, chart_data_view, chart_window, label, series
+from core.rollups import rollup_day
+from core.candidates import new_for_receiver
+from core.events import notify_donor, pickup_event
+from core.pickups import lock_donation
+from core.routing import receiver_route
+from core.slots import schedule_pickups
+from core.spatial import nearby_available_donations
+from django.conf import settings
+from django.db import transaction
+from ML_Model.registry import get_active_model
 from django.shortcuts import render, redirect
 from django.contrib.auth.hashers import make_password, check_password
 from core.models import Receiver, FoodDonation, PickupSchedule, ReceiverAddress
@@ -50,22 +60,36 @@ def receiver_login(request):
             pass
     return render(request, 'auth.html', {'action': 'login', 'user_type': 'receiver'})
 
+def dashboard_radius_km(request):
+    """?radius_km=N, else settings.RECEIVER_DASHBOARD_RADIUS_KM (None: everywhere)."""
+    try:
+        radius_km = float(request.GET['radius_km'])
+    except (KeyError, ValueError):
+        return settings.RECEIVER_DASHBOARD_RADIUS_KM
+    return radius_km if radius_km > 0 else None
+
 def receiver_dashboard(request):
     if 'receiver_id' not in request.session:
         return redirect('receivers:receiver_login')
     
     receiver = Receiver.objects.get(receiver_id=request.session['receiver_id'])
-    available_donations = FoodDonation.objects.filter(status='available')
-    
-    # Update priority for each donation for this receiver
-    for donation in available_donations:
-        donation.calculate_priority_ml(
-            receiver_capacity=receiver.capacity,
-            receiver_lat=receiver.location_lat,
-            receiver_long=receiver.location_long
+    radius_km = dashboard_radius_km(request)
+    if radius_km is None:
+        available_donations = list(
+            FoodDonation.objects.filter(status='available').select_related('donor_id')
         )
+    else:
+        # Only donations near the receiver are loaded and scored
+        available_donations = nearby_available_donations(receiver, radius_km)
+
+    # Stored per-receiver scores; only missing ones are computed
+    scores = get_priority_scores(receiver, available_donations)
+    for donation in available_donations:
+        donation.priority_score = scores[donation.donation_id]
 
     accepted_pickups = PickupSchedule.objects.filter(receiver_id=receiver)
+    # Precomputed when the donations were posted, see core.candidates
+    new_donations = new_for_receiver(receiver)
 
     # Handle capacity update
     if request.method == 'POST' and 'update_capacity' in request.POST:
@@ -84,6 +108,8 @@ def receiver_dashboard(request):
         'capacity_form': form,  # Pass form to template
         'current_capacity':receiver.capacity,
         'receiver_name':receiver.name,
+        'radius_km': radius_km,
+        'new_for_you': new_donations,
     })
 
 
@@ -108,35 +134,71 @@ def profile(request):
     return render(request, 'profile.html', {'user': receiver, 'addresses': addresses, 'form': form})
 
 def check_notification(request, receiver_id):
-    pickups = PickupSchedule.objects.filter(receiver_id__receiver_id=receiver_id)
-    for pickup in pickups:
-        if pickup.pickup_status == 'accepted':
-            return JsonResponse({'message': f'Pickup {pickup.schedule_id} successfully allocated.'})
-        elif pickup.pickup_status == 'rejected':
-            return JsonResponse({'message': f'Pickup {pickup.schedule_id} allocated to another receiver.'})
-    return JsonResponse({'message': ''})
+    # Polling fallback for core.views.event_stream; reports the newest decided request
+    decided = (
+        PickupSchedule.objects.filter(receiver_id=receiver_id, pickup_status__in=('accepted', 'rejected'))
+        .order_by('-schedule_id')
+        .values_list('schedule_id', 'pickup_status')
+        .first()
+    )
+    if decided is None:
+        return JsonResponse({'message': ''})
+    return JsonResponse({'message': pickup_event(*decided)['message']})
+
+def pickup_route(request):
+    """Suggested order for visiting the receiver's accepted pickups, as JSON."""
+    if 'receiver_id' not in request.session:
+        return JsonResponse({'error': 'Not logged in'}, status=401)
+    receiver = Receiver.objects.get(receiver_id=request.session['receiver_id'])
+    return JsonResponse(receiver_route(receiver))
+
+def new_for_you(request):
+    """Donations this receiver is a precomputed top candidate for, as JSON."""
+    if 'receiver_id' not in request.session:
+        return JsonResponse({'error': 'Not logged in'}, status=401)
+    receiver = Receiver.objects.get(receiver_id=request.session['receiver_id'])
+    return JsonResponse({'donations': [
+        {
+            'donation_id': candidate.donation_id_id,
+            'donor': candidate.donation_id.donor_id.name,
+            'food_type': candidate.donation_id.food_type,
+            'quantity': candidate.donation_id.quantity,
+            'unit': candidate.donation_id.unit,
+            'expiry_time': candidate.donation_id.expiry_time.isoformat(),
+            'priority_score': candidate.score,
+            'rank': candidate.rank,
+            'distance_km': round(candidate.distance_km, 3),
+        }
+        for candidate in new_for_receiver(receiver)
+    ]})
 
 def schedule_pickup(request, donation_id):
     if 'receiver_id' not in request.session:
         return redirect('receivers:receiver_login')
     if request.method == 'POST':
         receiver = Receiver.objects.get(receiver_id=request.session['receiver_id'])
-        donation = FoodDonation.objects.get(donation_id=donation_id)
+        donation = FoodDonation.objects.select_related('donor_id').get(donation_id=donation_id)
 
         # ML-based priority
-        priority = donation.calculate_priority_ml(
-            receiver_capacity=receiver.capacity,
-            receiver_lat=receiver.location_lat,
-            receiver_long=receiver.location_long
-        )
+        model = get_active_model()
+        priority = get_priority_scores(receiver, [donation], model=model)[donation.donation_id]
 
-        PickupSchedule.objects.create(
-            donation_id=donation,
-            receiver_id=receiver,
-            priority_score=priority,
-            scheduled_time=donation.expiry_time,
-            pickup_status='pending'
-        )
+        with transaction.atomic():
+            # A donor may be accepting another request for it right now
+            lock_donation(donation.donation_id)
+            if not FoodDonation.objects.filter(donation_id=donation_id, status='available').exists():
+                messages.error(request, 'This donation is no longer available.')
+                return redirect('receivers:dashboard')
+            pickup = PickupSchedule.objects.create(
+                donation_id=donation,
+                receiver_id=receiver,
+                priority_score=priority,
+                model_version=model.tag,
+                scheduled_time=donation.expiry_time,  # Replaced by a slot below
+                pickup_status='pending'
+            )
+            notify_donor(donation.donor_id_id, pickup.schedule_id, 'pending', donation.donation_id)
+        schedule_pickups(receivers=[receiver])
         logger.debug("Pickup scheduled for donation %s by receiver %s", donation_id, receiver.receiver_id)
         return redirect('receivers:dashboard')
     return redirect('receivers:dashboard')
@@ -161,61 +223,52 @@ def receiver_analytics(request):
     else:
         start_date = receiver.created_at
     
-    # Get pickups data
-    pickups = PickupSchedule.objects.filter(
+    # Daily totals of the period (core.rollups)
+    days = PickupDaily.objects.filter(
         receiver_id=receiver,
-        scheduled_time__range=[start_date, end_date]
+        day__range=[rollup_day(start_date), rollup_day(end_date)]
+    )
+    accepted = Q(pickup_status='accepted')
+    totals = days.aggregate(
+        total=Sum('count'),
+        successful=Sum('count', filter=accepted),
+        received=Sum('quantity', filter=accepted),
+        priority=Sum('priority_total')
     )
     
     # Basic statistics
-    total_pickups = pickups.count()
-    successful_pickups = pickups.filter(pickup_status='accepted').count()
+    total_pickups = totals['total'] or 0
+    successful_pickups = totals['successful'] or 0
     success_rate = (successful_pickups / total_pickups * 100) if total_pickups > 0 else 0
     
     # Total quantity received
-    total_quantity = 0
-    for pickup in pickups.filter(pickup_status='accepted'):
-        total_quantity += pickup.donation_id.quantity
+    total_quantity = totals['received'] or 0
     
     # Average priority score
-    avg_priority = pickups.aggregate(avg=Avg('priority_score'))['avg'] or 0
+    avg_priority = (totals['priority'] / total_pickups) if total_pickups > 0 else 0
     
     # Food type distribution
-    food_type_dist = []
-    for pickup in pickups.filter(pickup_status='accepted'):
-        food_type_dist.append({
-            'food_type': pickup.donation_id.food_type,
-            'quantity': pickup.donation_id.quantity
-        })
+    food_type_dist = list(days.filter(accepted).values('food_type').annotate(
+        quantity=Sum('quantity')
+    ).filter(quantity__gt=0))
     
     # Status distribution
-    status_dist = pickups.values('pickup_status').annotate(count=Count('pickup_status'))
+    status_dist = days.values('pickup_status').annotate(count=Sum('count')).filter(count__gt=0)
     
-    # Monthly trend
-    monthly_data = []
-    current = start_date
-    while current <= end_date:
-        month_start = current.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        if period == 'year':
-            next_month = month_start + timedelta(days=32)
-            month_end = next_month.replace(day=1) - timedelta(days=1)
-        else:
-            month_end = month_start + timedelta(days=30)
-        
-        month_pickups = pickups.filter(scheduled_time__range=[month_start, month_end])
-        monthly_data.append({
-            'month': month_start.strftime('%b %Y'),
-            'count': month_pickups.count(),
-            'successful': month_pickups.filter(pickup_status='accepted').count()
-        })
-        
-        if period == 'year':
-            current = next_month
-        else:
-            break
+    # Trend data
+    chart_start, unit = chart_window(period, end_date, receiver.created_at)
+    monthly_data = [
+        {'month': label(point['start'], unit, with_year=period not in PERIODS),
+         'count': point['count'], 'successful': point['successful']}
+        for point in series(PickupDaily.objects.filter(receiver_id=receiver), 'day', unit,
+                            chart_start, end_date, success=accepted, counted='count')
+    ]
     
     # Recent activity
-    recent_pickups = pickups.order_by('-scheduled_time')[:5]
+    recent_pickups = PickupSchedule.objects.filter(
+        receiver_id=receiver,
+        scheduled_time__range=[start_date, end_date]
+    ).select_related('donation_id').order_by('-scheduled_time')[:5]
     
     # Capacity utilization
     capacity_utilization = min((total_quantity / receiver.capacity * 100) if receiver.capacity > 0 else 0, 100)
@@ -238,6 +291,7 @@ def receiver_analytics(request):
     
     return render(request, 'analytics/receiver_analytics.html', context)
 
+@chart_data_view('receiver')
 def receiver_analytics_data(request):
     """API endpoint for receiver chart data"""
     if 'receiver_id' not in request.session:
@@ -256,64 +310,30 @@ def receiver_analytics_data(request):
     else:
         start_date = receiver.created_at
     
-    pickups = PickupSchedule.objects.filter(
+    # Daily totals of the period (core.rollups)
+    days = PickupDaily.objects.filter(
         receiver_id=receiver,
-        scheduled_time__gte=start_date,
-        scheduled_time__lte=end_date
+        day__range=[rollup_day(start_date), rollup_day(end_date)]
     )
     
-    # Food type distribution - improved
-    food_data = []
-    accepted_pickups = pickups.filter(pickup_status='accepted')
-    
-    for pickup in accepted_pickups:
-        food_type = pickup.donation_id.food_type
-        quantity = pickup.donation_id.quantity
-        
-        # Check if this food type already exists in our list
-        existing = next((item for item in food_data if item['food_type'] == food_type), None)
-        if existing:
-            existing['quantity'] += quantity
-        else:
-            food_data.append({'food_type': food_type, 'quantity': quantity})
+    # Food type distribution of the accepted pickups
+    food_data = list(days.filter(pickup_status='accepted').values('food_type').annotate(
+        quantity=Sum('quantity')
+    ).filter(quantity__gt=0))
     
     # Status distribution
-    status_data = list(pickups.values('pickup_status').annotate(count=Count('pickup_status')))
+    status_data = list(days.values('pickup_status').annotate(count=Sum('count')).filter(count__gt=0))
     
-    # Monthly trend - improved
-    monthly_trend = []
-    
-    if period == 'year':
-        for i in range(12):
-            month_date = end_date.replace(day=1)
-            target_month = month_date.month - i
-            target_year = month_date.year
-            
-            if target_month <= 0:
-                target_month += 12
-                target_year -= 1
-            
-            month_start = timezone.datetime(target_year, target_month, 1, tzinfo=timezone.get_current_timezone())
-            if target_month == 12:
-                month_end = timezone.datetime(target_year + 1, 1, 1, tzinfo=timezone.get_current_timezone()) - timedelta(seconds=1)
-            else:
-                month_end = timezone.datetime(target_year, target_month + 1, 1, tzinfo=timezone.get_current_timezone()) - timedelta(seconds=1)
-            
-            month_pickups = pickups.filter(
-                scheduled_time__gte=month_start,
-                scheduled_time__lte=month_end
-            )
-            
-            monthly_trend.append({
-                'month': month_start.strftime('%b'),
-                'total': month_pickups.count(),
-                'successful': month_pickups.filter(pickup_status='accepted').count()
-            })
-        
-        monthly_trend.reverse()
-    
-    # If no data but pickups exist, use sample data
-  
+    # Trend for chart: days of the week, weeks of the month, months of the year
+    # or of all time, from one query
+    chart_start, unit = chart_window(period, end_date, receiver.created_at)
+    monthly_trend = [
+        {'month': label(point['start'], unit, with_year=period not in PERIODS),
+         'total': point['count'], 'successful': point['successful']}
+        for point in series(PickupDaily.objects.filter(receiver_id=receiver), 'day', unit,
+                            chart_start, end_date, success=Q(pickup_status='accepted'), counted='count')
+    ]
+
     return JsonResponse({
         'food_data': food_data,
         'status_data': status_data,
@@ -0,0 +1,70 @@
+"""
+Time the matching engine's solver on synthetic data, without the database.
+
+Donations and receivers are scattered over a city-sized box; the run
+covers candidate pruning, scoring every candidate pair with the active
+model and the greedy assignment. Run from the project directory:
+
+    python scripts/bench_matching.py [--donations 10000] [--receivers 1000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zero_waste.settings')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--donations', type=int, default=10_000)
+    parser.add_argument('--receivers', type=int, default=1_000)
+    parser.add_argument('--radius-km', type=float, default=None)
+    parser.add_argument('--max-receivers', type=int, default=None)
+    parser.add_argument('--box-degrees', type=float, default=0.5, help="Side of the area, ~55 km per 0.5")
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from ML_Model.ml_model import assemble_features
+    from ML_Model.registry import get_active_model
+    from core.matching import DEFAULT_MAX_RECEIVERS, DEFAULT_RADIUS_KM, candidate_edges, greedy_assign
+
+    rng = np.random.default_rng(42)
+    radius_km = args.radius_km or DEFAULT_RADIUS_KM
+    max_receivers = args.max_receivers or DEFAULT_MAX_RECEIVERS
+    n, m = args.donations, args.receivers
+    donor_lats = 12.8 + rng.random(n) * args.box_degrees
+    donor_longs = 77.4 + rng.random(n) * args.box_degrees
+    receiver_lats = 12.8 + rng.random(m) * args.box_degrees
+    receiver_longs = 77.4 + rng.random(m) * args.box_degrees
+    quantities = rng.integers(5, 50, n).astype(np.float64)
+    capacities = rng.integers(10, 100, m).astype(np.float64)
+    food_types = rng.integers(0, 5, n)
+    hours = rng.uniform(1, 24, n)
+
+    model = get_active_model()
+    model.predict(np.zeros((1, 5)))  # Load outside the timing
+
+    start = time.perf_counter()
+    d, r, distances = candidate_edges(donor_lats, donor_longs, receiver_lats, receiver_longs, radius_km,
+                                      max_receivers=max_receivers)
+    pruned = time.perf_counter()
+    scores = model.predict(assemble_features(capacities[r], distances, food_types[d], quantities[d], hours[d]))
+    scored = time.perf_counter()
+    chosen = greedy_assign(scores, d, r, quantities, capacities.copy())
+    end = time.perf_counter()
+
+    print(f"{n} donations x {m} receivers, radius {radius_km} km, {max_receivers} nearest: {len(d)} candidate pairs")
+    print(f"  prune  {(pruned - start) * 1000:8.1f} ms")
+    print(f"  score  {(scored - pruned) * 1000:8.1f} ms  ({model.tag})")
+    print(f"  assign {(end - scored) * 1000:8.1f} ms  ({len(chosen)} donations assigned)")
+    print(f"  total  {(end - start) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Time the pickup route planner on random 50-stop routes.
+
+Stops are scattered around a depot in a city-sized box with deadlines
+between 2 and 24 hours; reports the median and worst solve time and
+how many stops ended up late. Run from the project directory:
+
+    python scripts/bench_route.py [--stops 50] [--runs 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zero_waste.settings')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--stops', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--box-degrees', type=float, default=0.2, help="Side of the area, ~22 km per 0.2")
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from core.geo import distance_matrix
+    from core.routing import AVERAGE_SPEED_KMH, SERVICE_MINUTES, _length, _schedule, plan_route
+
+    rng = np.random.default_rng(42)
+    times, late, lengths = [], [], []
+    for _ in range(args.runs):
+        lats = 12.9 + rng.random(args.stops + 1) * args.box_degrees
+        longs = 77.5 + rng.random(args.stops + 1) * args.box_degrees
+        dist = distance_matrix(lats, longs, lats, longs)
+        deadlines = np.append(np.inf, rng.uniform(2, 24, args.stops))
+
+        start = time.perf_counter()
+        order = plan_route(dist, deadlines)
+        times.append(time.perf_counter() - start)
+
+        route = np.array([0, *order, 0])
+        arrivals, _ = _schedule(route, dist, deadlines, AVERAGE_SPEED_KMH, SERVICE_MINUTES / 60)
+        late.append(int((arrivals > deadlines[route[1:-1]]).sum()))
+        lengths.append(_length(route, dist))
+
+    print(f"{args.runs} routes of {args.stops} stops")
+    print(f"  solve time  median {statistics.median(times) * 1000:7.1f} ms   max {max(times) * 1000:7.1f} ms")
+    print(f"  route       median {statistics.median(lengths):7.1f} km   late stops per route {statistics.mean(late):.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Measure Django start-up time and memory with and without the priority model.
+
+Each scenario runs in a fresh interpreter so nothing is shared between
+measurements. Run from the project directory:
+
+    python scripts/bench_startup.py [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, os, resource, sys, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zero_waste.settings')
+import django
+django.setup()
+import core.models, receivers.views, donors.views
+setup_done = time.perf_counter()
+if sys.argv[1] == 'model':
+    from ML_Model.ml_model import warm_up
+    warm_up()
+end = time.perf_counter()
+print(json.dumps({
+    'setup_s': setup_done - start,
+    'total_s': end - start,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'sklearn_imported': 'sklearn' in sys.modules,
+    'pandas_imported': 'pandas' in sys.modules,
+}))
+"""
+
+SCENARIOS = {
+    'lazy': 'django.setup() and app imports only (default)',
+    'model': 'same, then load the priority model (ML_MODEL_WARMUP=1)',
+}
+
+
+def run_probe(scenario):
+    env = dict(os.environ, ML_MODEL_WARMUP='0')
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE, scenario],
+        cwd=PROJECT_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for scenario, description in SCENARIOS.items():
+        runs = [run_probe(scenario) for _ in range(args.repeat)]
+        print(f"{scenario}: {description}")
+        print(f"  start-up time  median {statistics.median(r['total_s'] for r in runs) * 1000:8.1f} ms")
+        print(f"  max RSS        median {statistics.median(r['max_rss_mb'] for r in runs):8.1f} MB")
+        print(f"  sklearn/pandas imported: {runs[0]['sklearn_imported']}/{runs[0]['pandas_imported']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Measure per-worker memory of forked web workers with the priority model.
+
+Each scenario runs in a fresh interpreter that sets up Django (like a
+gunicorn master with --preload), forks N workers and has every worker score
+a batch. Workers report USS (memory only they use, the cost of one more
+worker) and PSS from /proc/self/smaps_rollup, so this is Linux only. Run
+from the project directory:
+
+    python scripts/bench_worker_memory.py [--workers 4]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, os, pickle, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zero_waste.settings')
+import django
+django.setup()
+import core.models, receivers.views, donors.views
+import numpy as np
+from ML_Model import ml_model
+from ML_Model.registry import get_active_model
+
+scenario, workers = sys.argv[1], int(sys.argv[2])
+X = np.column_stack([np.full(500, 40.0), np.linspace(1, 20, 500), np.full(500, 3.0),
+                     np.full(500, 15.0), np.linspace(1, 24, 500)])
+
+
+def unpickle_everything():
+    # What every worker did before the artifacts were memory-mapped
+    import joblib
+    from ML_Model.tree_compiler import compile_gradient_boosting
+    model = joblib.load(ml_model.MODEL_PATH)
+    for path in (ml_model.ENCODER_PATH, ml_model.SCALER_PATH):
+        with open(path, 'rb') as f:
+            pickle.load(f)
+    return compile_gradient_boosting(model).predict
+
+
+def memory_kb():
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return fields['Private_Clean'] + fields['Private_Dirty'], fields['Pss']
+
+
+if scenario == 'preload':
+    ml_model.preload()
+
+pipes = []
+for _ in range(workers):
+    read_fd, write_fd = os.pipe()
+    if os.fork() == 0:
+        os.close(read_fd)
+        if scenario == 'unpickle':
+            predict = unpickle_everything()
+        else:
+            ml_model.warm_up()  # No-op after preload
+            predict = get_active_model().predict
+        predict(X)
+        uss, pss = memory_kb()
+        os.write(write_fd, json.dumps({'uss_mb': uss / 1024, 'pss_mb': pss / 1024}).encode())
+        os._exit(0)
+    os.close(write_fd)
+    pipes.append(read_fd)
+
+results = []
+for fd in pipes:
+    with os.fdopen(fd) as f:
+        results.append(json.loads(f.read()))
+    os.wait()
+print(json.dumps(results))
+"""
+
+SCENARIOS = {
+    'unpickle': 'each worker unpickles model, encoder and scaler (previous behaviour)',
+    'mmap': 'each worker opens the memory-mapped arrays after the fork',
+    'preload': 'arrays loaded once in the parent before the fork (ML_MODEL_PRELOAD)',
+}
+
+
+def run(scenario, workers):
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE, scenario, str(workers)],
+        cwd=PROJECT_DIR, capture_output=True, text=True, check=True,
+        env=dict(os.environ, ML_MODEL_WARMUP='0', ML_MODEL_PRELOAD='0'),
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        sys.exit("Needs Linux /proc/<pid>/smaps_rollup")
+
+    run('mmap', 1)  # Build the memory-mapped copies if they are missing
+    print(f"{'scenario':<10}{'USS/worker':>12}{'PSS/worker':>12}  description")
+    for name, description in SCENARIOS.items():
+        results = run(name, args.workers)
+        uss = statistics.mean(r['uss_mb'] for r in results)
+        pss = statistics.mean(r['pss_mb'] for r in results)
+        print(f"{name:<10}{uss:>10.1f}MB{pss:>10.1f}MB  {description}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@
 ASGI config for zero_waste project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it (e.g. ``uvicorn zero_waste.asgi:application``) for the pushed pickup
+notifications of core/events.py; under WSGI the dashboards poll instead.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -14,3 +16,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zero_waste.settings')
 
 application = get_asgi_application()
+
+# As in wsgi.py: with `gunicorn --preload -k uvicorn.workers.UvicornWorker`
+# the forked workers inherit the model loaded here.
+from django.conf import settings  # noqa: E402
+
+if settings.ML_MODEL_PRELOAD:
+    from ML_Model.ml_model import preload
+    preload()
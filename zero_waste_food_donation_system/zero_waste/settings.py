@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -83,6 +84,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than the shared in-memory database: its table locks
+        # fail at once instead of waiting, which breaks the threaded tests.
+        # Kept outside the source tree.
+        'TEST': {'NAME': os.path.join(tempfile.gettempdir(), 'zero_waste_test_db.sqlite3')},
     }
 }
 
@@ -127,3 +132,68 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Priority model
+# The model is loaded lazily on first use. Set ML_MODEL_WARMUP=1 for web
+# workers to load it while the app boots instead.
+
+ML_MODEL_WARMUP = os.environ.get('ML_MODEL_WARMUP') == '1'
+
+# Set ML_MODEL_PRELOAD=1 with `gunicorn --preload` to load it once in the
+# master process, so forked workers share it (see zero_waste/wsgi.py).
+
+ML_MODEL_PRELOAD = os.environ.get('ML_MODEL_PRELOAD') == '1'
+
+
+# Pickup slots
+# The quantity a receiver can pick up in one slot (core.slots), in the same
+# unit as Receiver.capacity. Capacity is the receiver's total storage, so a
+# slot never takes more than that either.
+
+PICKUP_SLOT_CAPACITY = float(os.environ.get('PICKUP_SLOT_CAPACITY', '50'))
+
+
+# Receiver dashboard
+# Only list donations within this many km of the receiver, found through
+# the grid index (core.spatial). None, or RECEIVER_DASHBOARD_RADIUS_KM=0 in
+# the environment, lists every available donation. Receivers can override
+# it with ?radius_km= (0: everywhere).
+
+_radius_km = float(os.environ.get('RECEIVER_DASHBOARD_RADIUS_KM', '20'))
+RECEIVER_DASHBOARD_RADIUS_KM = _radius_km if _radius_km > 0 else None
+
+
+# Candidate receivers of new donations (core.candidates) are computed on a
+# background thread; DONATION_CANDIDATES_ASYNC=0 computes them in the request.
+
+DONATION_CANDIDATES_ASYNC = os.environ.get('DONATION_CANDIDATES_ASYNC') != '0'
+
+
+# Pickup notifications (core.events). The local broker only reaches the
+# clients of its own process; with several ASGI workers or nodes use
+# EVENTS_BROKER=core.events.RedisBroker and EVENTS_REDIS_URL.
+
+EVENTS_BROKER = os.environ.get('EVENTS_BROKER', 'core.events.LocalBroker')
+EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL', 'redis://localhost:6379/0')
+
+
+# Seconds the admin dashboard is served from the cache before it is
+# recomputed (administration.views.admin_dashboard); 0 disables caching.
+
+ADMIN_DASHBOARD_CACHE_TIMEOUT = int(os.environ.get('ADMIN_DASHBOARD_CACHE_TIMEOUT', '30'))
+
+
+# Seconds a stored point score (priority models without time curves, see
+# core.score_store) is reused for before it is recomputed at the current
+# time to expiry. Tree models store curves and never need recomputing.
+
+POINT_SCORE_TIMEOUT = int(os.environ.get('POINT_SCORE_TIMEOUT', '900'))
+
+
+# Seconds a donor's or receiver's chart data is cached for when it does not
+# change (core.analytics.chart_data_view); changes invalidate it at once, in
+# every process, through the data versions stored in the database.
+# 0 disables caching; conditional requests are still answered with 304.
+
+ANALYTICS_CACHE_TIMEOUT = int(os.environ.get('ANALYTICS_CACHE_TIMEOUT', str(24 * 3600)))
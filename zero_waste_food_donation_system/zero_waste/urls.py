@@ -20,8 +20,12 @@ from django.urls import path, include
 from django.contrib import admin
 from django.urls import path, include
 
+from core.views import change_feed, event_stream
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('events/', event_stream, name='event_stream'),
+    path('changes/', change_feed, name='change_feed'),
     path('donors/', include(('donors.urls', 'donors'), namespace='donors')),
     path('receivers/', include(('receivers.urls', 'receivers'), namespace='receivers')),
     path('admin_panel/', include('administration.urls')),
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zero_waste.settings')
 
 application = get_wsgi_application()
+
+# With `gunicorn --preload` this module is imported once in the master
+# process; loading the model here means the forked workers inherit it.
+from django.conf import settings  # noqa: E402
+
+if settings.ML_MODEL_PRELOAD:
+    from ML_Model.ml_model import preload
+    preload()